@@ -1,50 +1,276 @@
--- DipHunter Database Schema
--- PostgreSQL database for storing ticker fundamentals and intraday metrics
-
--- Tickers table: stores fundamental data for universe filtering
-CREATE TABLE IF NOT EXISTS tickers (
-    ticker VARCHAR(10) PRIMARY KEY,
-    sector VARCHAR(100),
-    industry VARCHAR(100),
-    market_cap BIGINT,  -- Market cap in dollars
-    avg_volume BIGINT,  -- Average daily volume
-    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-
--- Index for efficient filtering
-CREATE INDEX IF NOT EXISTS idx_tickers_market_cap ON tickers(market_cap);
-CREATE INDEX IF NOT EXISTS idx_tickers_sector ON tickers(sector);
-CREATE INDEX IF NOT EXISTS idx_tickers_avg_volume ON tickers(avg_volume);
-
--- Intraday metrics table: stores computed drawdown metrics per ticker per date
-CREATE TABLE IF NOT EXISTS intraday_metrics (
-    ticker VARCHAR(10) NOT NULL,
-    date DATE NOT NULL,
-    max_drawdown_pct DECIMAL(10, 4),  -- Maximum drawdown percentage
-    drawdown_time TIMESTAMP,  -- Timestamp when max drawdown occurred
-    recovery_pct DECIMAL(10, 4),  -- Recovery percentage from low to close
-    data_source VARCHAR(50),  -- 'polygon', 'yahoo', etc.
-    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    PRIMARY KEY (ticker, date),
-    FOREIGN KEY (ticker) REFERENCES tickers(ticker) ON DELETE CASCADE
-);
-
--- Index for efficient date-based queries
-CREATE INDEX IF NOT EXISTS idx_intraday_metrics_date ON intraday_metrics(date);
-CREATE INDEX IF NOT EXISTS idx_intraday_metrics_drawdown ON intraday_metrics(max_drawdown_pct);
-
--- Raw intraday bars table (optional, for visualization and debugging)
-CREATE TABLE IF NOT EXISTS intraday_bars (
-    ticker VARCHAR(10) NOT NULL,
-    timestamp TIMESTAMP NOT NULL,
-    open DECIMAL(12, 4),
-    high DECIMAL(12, 4),
-    low DECIMAL(12, 4),
-    close DECIMAL(12, 4),
-    volume BIGINT,
-    PRIMARY KEY (ticker, timestamp),
-    FOREIGN KEY (ticker) REFERENCES tickers(ticker) ON DELETE CASCADE
-);
-
--- Index for efficient time-series queries
-CREATE INDEX IF NOT EXISTS idx_intraday_bars_ticker_date ON intraday_bars(ticker, timestamp);
+-- DipHunter SQLite schema, generated from python/src/migrations.py.
+-- Do not edit: add a migration, then run
+--   python python/benchmarks/check_schema.py --write
+-- The application migrates its database itself on connect; this file
+-- documents the result and can create one: sqlite3 diphunter.db < database/schema.sql
+-- schema version 13
+
+CREATE TABLE schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    );
+
+CREATE TABLE tickers (
+            ticker TEXT PRIMARY KEY,
+            sector TEXT,
+            industry TEXT,
+            market_cap INTEGER,
+            avg_volume INTEGER,
+            last_updated TEXT
+        );
+
+CREATE INDEX idx_tickers_sector ON tickers(sector);
+
+CREATE INDEX idx_tickers_industry ON tickers(industry);
+
+CREATE TABLE intraday_metrics (
+            ticker TEXT NOT NULL,
+            date TEXT NOT NULL,
+            max_drawdown_pct REAL,
+            drawdown_time TEXT,
+            recovery_pct REAL,
+            data_source TEXT,
+            computed_at TEXT, universe_rank INTEGER, universe_pct REAL, sector_rank INTEGER, sector_pct REAL, industry_rank INTEGER, industry_pct REAL,
+            PRIMARY KEY (ticker, date),
+            FOREIGN KEY (ticker) REFERENCES tickers(ticker) ON DELETE CASCADE
+        );
+
+CREATE TABLE intraday_bars (
+            ticker TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL, volume INTEGER,
+            PRIMARY KEY (ticker, timestamp),
+            FOREIGN KEY (ticker) REFERENCES tickers(ticker) ON DELETE CASCADE
+        );
+
+CREATE TABLE data_generation (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            generation INTEGER NOT NULL
+        );
+
+CREATE TRIGGER trg_tickers_insert_generation
+        AFTER INSERT ON tickers
+        BEGIN
+            UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+        END;
+
+CREATE TRIGGER trg_tickers_delete_generation
+        AFTER DELETE ON tickers
+        BEGIN
+            UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+        END;
+
+CREATE TRIGGER trg_intraday_metrics_insert_generation
+        AFTER INSERT ON intraday_metrics
+        BEGIN
+            UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+        END;
+
+CREATE TRIGGER trg_intraday_metrics_update_generation
+        AFTER UPDATE ON intraday_metrics
+        BEGIN
+            UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+        END;
+
+CREATE TRIGGER trg_intraday_metrics_delete_generation
+        AFTER DELETE ON intraday_metrics
+        BEGIN
+            UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+        END;
+
+CREATE TRIGGER trg_intraday_bars_insert_generation
+        AFTER INSERT ON intraday_bars
+        BEGIN
+            UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+        END;
+
+CREATE TRIGGER trg_intraday_bars_update_generation
+        AFTER UPDATE ON intraday_bars
+        BEGIN
+            UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+        END;
+
+CREATE TRIGGER trg_intraday_bars_delete_generation
+        AFTER DELETE ON intraday_bars
+        BEGIN
+            UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+        END;
+
+CREATE INDEX idx_intraday_metrics_date_drawdown
+           ON intraday_metrics(date, max_drawdown_pct, ticker,
+                               drawdown_time, recovery_pct, data_source);
+
+CREATE INDEX idx_tickers_sector_industry_cap
+           ON tickers(sector, industry, market_cap);
+
+CREATE INDEX idx_tickers_cap_ticker ON tickers(market_cap, ticker);
+
+CREATE INDEX idx_tickers_volume_ticker
+           ON tickers(COALESCE(avg_volume, 0), ticker);
+
+CREATE TABLE daily_snapshot (
+            date TEXT PRIMARY KEY,
+            ticker_count INTEGER NOT NULL,
+            avg_return_pct REAL,
+            worst_ticker TEXT,
+            worst_return_pct REAL,
+            losers INTEGER NOT NULL,
+            sectors TEXT NOT NULL,
+            industries TEXT NOT NULL,
+            computed_at TEXT
+        );
+
+CREATE TRIGGER trg_daily_snapshot_insert_generation
+        AFTER INSERT ON daily_snapshot
+        BEGIN
+            UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+        END;
+
+CREATE TRIGGER trg_daily_snapshot_update_generation
+        AFTER UPDATE ON daily_snapshot
+        BEGIN
+            UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+        END;
+
+CREATE TRIGGER trg_daily_snapshot_delete_generation
+        AFTER DELETE ON daily_snapshot
+        BEGIN
+            UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+        END;
+
+CREATE TRIGGER trg_tickers_update_generation
+        AFTER UPDATE OF ticker, sector, industry, market_cap, avg_volume ON tickers
+        BEGIN
+            UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+        END;
+
+CREATE TABLE ingest_jobs (
+            ticker TEXT NOT NULL,
+            date TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending'
+                CHECK (state IN ('pending', 'leased', 'done', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            lease_expiry REAL,
+            last_error TEXT,
+            updated_at TEXT,
+            PRIMARY KEY (ticker, date)
+        );
+
+CREATE INDEX idx_ingest_jobs_state ON ingest_jobs(state, lease_expiry);
+
+CREATE TABLE live_state (
+            ticker TEXT NOT NULL,
+            date TEXT NOT NULL,
+            settled INTEGER NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            low_time TEXT,
+            last_time TEXT NOT NULL,
+            last_open REAL NOT NULL,
+            last_high REAL NOT NULL,
+            last_low REAL NOT NULL,
+            last_close REAL NOT NULL,
+            updated_at TEXT,
+            PRIMARY KEY (ticker, date)
+        );
+
+CREATE TABLE rolling_metrics (
+            ticker TEXT NOT NULL,
+            date TEXT NOT NULL,
+            cum_return_pct REAL NOT NULL,
+            down_streak INTEGER NOT NULL,
+            return_zscore REAL,
+            return_window BLOB NOT NULL,
+            computed_at TEXT,
+            PRIMARY KEY (ticker, date),
+            FOREIGN KEY (ticker) REFERENCES tickers(ticker) ON DELETE CASCADE
+        );
+
+CREATE INDEX idx_rolling_metrics_date_cum_return
+           ON rolling_metrics(date, cum_return_pct, ticker);
+
+CREATE INDEX idx_rolling_metrics_date_down_streak
+           ON rolling_metrics(date, down_streak, ticker);
+
+CREATE INDEX idx_rolling_metrics_date_zscore
+           ON rolling_metrics(date, return_zscore, ticker);
+
+CREATE TRIGGER trg_rolling_metrics_insert_generation
+        AFTER INSERT ON rolling_metrics
+        BEGIN
+            UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+        END;
+
+CREATE TRIGGER trg_rolling_metrics_update_generation
+        AFTER UPDATE ON rolling_metrics
+        BEGIN
+            UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+        END;
+
+CREATE TRIGGER trg_rolling_metrics_delete_generation
+        AFTER DELETE ON rolling_metrics
+        BEGIN
+            UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+        END;
+
+CREATE INDEX idx_intraday_metrics_date_universe_pct
+           ON intraday_metrics(date, universe_pct, ticker);
+
+CREATE INDEX idx_intraday_metrics_date_sector_pct
+           ON intraday_metrics(date, sector_pct, ticker);
+
+CREATE INDEX idx_intraday_metrics_date_industry_pct
+           ON intraday_metrics(date, industry_pct, ticker);
+
+CREATE TABLE daemon_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL CHECK (kind IN ('eod', 'live', 'backfill')),
+            slot TEXT UNIQUE,
+            args TEXT NOT NULL,
+            priority INTEGER NOT NULL,
+            state TEXT NOT NULL DEFAULT 'queued'
+                CHECK (state IN ('queued', 'running', 'done', 'failed')),
+            requested_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT,
+            duration_seconds REAL,
+            stats TEXT,
+            error TEXT
+        , attempts INTEGER NOT NULL DEFAULT 0, retry_at TEXT);
+
+CREATE INDEX idx_daemon_jobs_state ON daemon_jobs(state, priority, id);
+
+INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (1, 'baseline', datetime('now'));
+
+INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (2, 'intraday_bars_volume', datetime('now'));
+
+INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (3, 'hot_query_indexes', datetime('now'));
+
+INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (4, 'leaderboard_sort_indexes', datetime('now'));
+
+INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (5, 'daily_snapshot', datetime('now'));
+
+INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (6, 'tickers_refresh_trigger', datetime('now'));
+
+INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (7, 'ingest_jobs', datetime('now'));
+
+INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (8, 'live_state', datetime('now'));
+
+INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (9, 'rolling_metrics', datetime('now'));
+
+INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (10, 'metric_ranks', datetime('now'));
+
+INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (11, 'daemon_jobs', datetime('now'));
+
+INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (12, 'daemon_job_retries', datetime('now'));
+
+INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (13, 'utc_bar_timestamps', datetime('now'));
+
+INSERT OR IGNORE INTO data_generation (id, generation) VALUES (1, 0);
+
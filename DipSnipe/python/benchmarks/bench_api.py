@@ -0,0 +1,92 @@
+"""
+API benchmark: payload size and latency of /api/metrics on a 500-ticker
+day for a cold request, a repeat request with gzip (and brotli, if
+installed), and a conditional repeat that gets 304 Not Modified.
+
+Usage: python bench_api.py [--tickers 500] [--repeat 50]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import api_server
+from database import Database, ReadPool
+
+logging.disable(logging.INFO)
+
+
+def seed(db, n_tickers, target_date):
+    start = datetime.combine(target_date, datetime.min.time()) + timedelta(hours=9.5)
+    db.save_fundamentals_many([{
+        'ticker': f"T{i:05d}", 'sector': f"Sector {i % 11}",
+        'industry': f"Industry {i % 60}", 'market_cap': 1_000_000_000 + i
+    } for i in range(n_tickers)])
+    db.save_metrics_many([
+        (f"T{i:05d}", target_date,
+         {'max_drawdown_pct': -5.0 + i / n_tickers, 'drawdown_time': start, 'recovery_pct': 2.0},
+         'bench')
+        for i in range(n_tickers)
+    ])
+
+
+def timed(client, url, headers, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        response = client.get(url, headers=headers)
+        best = min(best, time.perf_counter() - t0)
+    return best, response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+    
+    target_date = date(2024, 6, 3)
+    path = os.path.join(tempfile.mkdtemp(), "bench_api.db")
+    db = Database({'file': path})
+    db.connect()
+    seed(db, args.tickers, target_date)
+    
+    api_server.db = db
+    api_server.read_pool = ReadPool({'file': path})
+    client = api_server.app.test_client()
+    url = f"/api/metrics?date={target_date.isoformat()}"
+    
+    # Cold: every request rebuilds the body because the cache is dropped first
+    best = float('inf')
+    for _ in range(args.repeat):
+        api_server.response_cache = None
+        t0 = time.perf_counter()
+        cold = client.get(url)
+        best = min(best, time.perf_counter() - t0)
+    rows = [("cold identity", best, cold)]
+    
+    rows.append(("warm identity",) + timed(client, url, {}, args.repeat))
+    rows.append(("warm gzip",) + timed(client, url, {'Accept-Encoding': 'gzip'}, args.repeat))
+    if api_server.brotli is not None:
+        rows.append(("warm br",) + timed(client, url, {'Accept-Encoding': 'br'}, args.repeat))
+    etag = rows[-1][2].headers['ETag']
+    rows.append(("304 revalidate",) + timed(
+        client, url, {'Accept-Encoding': 'gzip, br', 'If-None-Match': etag}, args.repeat))
+    
+    assert rows[-1][2].status_code == 304
+    db.close()
+    
+    print(f"/api/metrics, {args.tickers} tickers")
+    for label, elapsed, response in rows:
+        print(f"{label:<16} status={response.status_code}  bytes={len(response.get_data()):>8}  "
+              f"latency={elapsed * 1000:7.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Read benchmark: loading a range of historical bars from intraday_bars vs
+the memory-mapped columnar archive, per ticker (a day at a time and as
+one range read, with no day mapped yet, as in a fresh process) and as a
+whole-universe scan.
+
+Also checks that archive reads match SQLite, that bars written to
+intraday_bars after their day was archived (a late fill) are still read
+and merged in when the day is archived again, and that an archive handle
+with the day already mapped (another process) sees the rewritten day.
+
+Usage: python bench_archive.py [--tickers 500] [--days 60] [--bars 7]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from bar_archive import BarArchive
+from database import Database
+from trading_calendar import trading_days
+
+logging.disable(logging.INFO)
+
+
+def check_late_fill(db, ticker, day):
+    other = BarArchive(str(db.archive.root))
+    before = other.get_bars(ticker, day)
+    late = dict(before[-1], timestamp=before[-1]['timestamp'] + timedelta(minutes=30), close=1.0)
+    db.save_bars_many({ticker: [late]})
+    
+    bars = db.get_intraday_bars(ticker, day)
+    assert bars == before + [late], "late bar missing from an archived day"
+    assert db.get_intraday_bars_many([ticker], day)[ticker] == bars
+    assert db.get_intraday_bars_range(ticker, day, day) == bars
+    
+    db.archive_bars(day)
+    assert db.get_bar_dates() == [], "late bar left in intraday_bars"
+    assert db.get_intraday_bars(ticker, day) == bars, "re-archiving lost bars"
+    assert other.get_bars(ticker, day) == bars, "a mapped day was served stale after a rewrite"
+    print("ok    late fills merge into archived days; rewritten days are remapped elsewhere")
+
+
+def timed(fn, repeat, before=None):
+    """(median seconds, last result) of repeat calls, running before() untimed ahead of each"""
+    times = []
+    for _ in range(repeat):
+        if before:
+            before()
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return sorted(times)[len(times) // 2], result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--bars', type=int, default=7)
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp()
+    db = Database({'file': os.path.join(workdir, "bench_archive.db"),
+                   'archive_dir': os.path.join(workdir, "archive")})
+    db.connect()
+    
+    days = trading_days(date(2024, 1, 2), date(2024, 12, 31))[:args.days]
+    tickers = [f"T{i:05d}" for i in range(args.tickers)]
+    for day in days:
+        start = datetime.combine(day, datetime.min.time()) + timedelta(hours=9.5)
+        db.save_bars_many({
+            t: [{'timestamp': start + timedelta(hours=h), 'open': 100.0 + h, 'high': 101.0 + h,
+                 'low': 99.0 + h, 'close': 100.5 + h, 'volume': 1000 * h} for h in range(args.bars)]
+            for t in tickers
+        })
+    archive = db.archive
+    
+    def one_by_day():
+        return [db.get_intraday_bars(tickers[0], d) for d in days]
+    
+    def one_range():
+        return db.get_intraday_bars_range(tickers[0], days[0], days[-1])
+    
+    def all_by_day():
+        return [db.get_intraday_bars_many(tickers, d) for d in days]
+    
+    db.archive = None
+    sqlite_one_t, sqlite_one = timed(one_by_day, args.repeat)
+    sqlite_range_t, sqlite_range = timed(one_range, args.repeat)
+    sqlite_all_t, sqlite_all = timed(all_by_day, 1)
+    
+    db.archive = archive
+    t0 = time.perf_counter()
+    for day in days:
+        db.archive_bars(day)
+    compact_t = time.perf_counter() - t0
+    
+    # Cold: no day mapped yet, as in a fresh process; warm: all mapped
+    unmap = archive._open.clear
+    archive_one_t, archive_one = timed(one_by_day, args.repeat, unmap)
+    archive_range_t, archive_range = timed(one_range, args.repeat, unmap)
+    warm_one_t, _ = timed(one_by_day, args.repeat)
+    warm_range_t, _ = timed(one_range, args.repeat)
+    archive_all_t, archive_all = timed(all_by_day, 1, unmap)
+    scan_t, n_rows = timed(lambda: sum(len(cols['close']) for _, _, cols, _
+                                       in archive.scan(days[0], days[-1])), args.repeat, unmap)
+    
+    assert archive_one == sqlite_one, "archive returned different bars"
+    assert archive_all == sqlite_all, "archive returned different bars"
+    assert archive_range == sqlite_range == [b for bars in sqlite_one for b in bars], \
+        "range read returned different bars"
+    check_late_fill(db, tickers[0], days[0])
+    db.close()
+    
+    print(f"{args.tickers} tickers x {len(days)} days x {args.bars} bars "
+          f"(compaction {compact_t:.2f}s), median of {args.repeat}")
+    print(f"one ticker, day by day sqlite={sqlite_one_t * 1000:7.1f}ms  "
+          f"archive cold={archive_one_t * 1000:7.1f}ms warm={warm_one_t * 1000:7.1f}ms")
+    print(f"one ticker, range read sqlite={sqlite_range_t * 1000:7.1f}ms  "
+          f"archive cold={archive_range_t * 1000:7.1f}ms warm={warm_range_t * 1000:7.1f}ms")
+    print(f"all tickers as dicts   sqlite={sqlite_all_t * 1000:7.1f}ms  archive={archive_all_t * 1000:7.1f}ms")
+    print(f"columnar scan          {n_rows} rows mapped in {scan_t * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Concurrency benchmark: /api/metrics with 1..N parallel clients, reading
+through the ReadPool vs one connection shared by every thread, while a
+writer keeps committing metrics in the background.
+
+Every request uses a distinct filter and the response cache is disabled,
+so each one hits SQLite. The pooled run must finish without a single
+ProgrammingError or "database is locked" failure.
+
+What the pool buys is isolation, not handler throughput: most of a
+request is turning rows into dicts and encoding JSON, which holds the
+GIL, so req/s stays roughly flat as threads are added (and cannot rise
+at all on one CPU). The "sql" column runs the same filtered queries
+through the pool as COUNT(*) only, so SQLite steps without the GIL: that
+is the part that can run in parallel on more cores, and with a shared
+connection it cannot. Each run reports its speedup over one thread; the
+pooled handler must not lose more than half its one-thread rate under
+contention.
+
+Then serves the app from a real werkzeug threaded server, which starts a
+thread per request: sequential and concurrent requests, JSON and streamed
+NDJSON, must all reuse the pool's bounded set of connections, every one
+of them must be back in the pool afterwards, and the process must not
+accumulate open file descriptors.
+
+Usage: python bench_concurrency.py [--tickers 500] [--threads 1 2 4 8 16] [--requests 400]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import requests
+from werkzeug.serving import make_server
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+import api_server
+from bench_api import seed
+from database import Database, ReadPool
+from response_cache import ResponseCache
+
+logging.disable(logging.ERROR)
+
+
+class SharedPool:
+    """The pre-pool behaviour: every thread reads through one connection"""
+    
+    def __init__(self, db):
+        self.db = db
+    
+    def acquire(self):
+        return self.db
+    
+    def release(self, db):
+        pass
+    
+    def size(self):
+        return 1
+
+
+def background_writer(db, tickers, target_date, stop):
+    start = datetime.combine(target_date, datetime.min.time()) + timedelta(hours=9.5)
+    i = 0
+    while not stop.is_set():
+        ticker = tickers[i % len(tickers)]
+        db.save_metrics(ticker, target_date,
+                        {'max_drawdown_pct': -1.0 - i % 7, 'drawdown_time': start, 'recovery_pct': 1.0},
+                        'bench')
+        i += 1
+        time.sleep(0.005)
+
+
+def run(pool, n_threads, n_requests, target_date):
+    api_server.read_pool = pool
+    errors = []
+    
+    def one(i):
+        response = api_server.app.test_client().get(f"/api/metrics?date={target_date.isoformat()}&min_market_cap={i}")
+        if response.status_code != 200:
+            errors.append(response.get_json().get('error'))
+    
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        list(executor.map(one, range(n_requests)))
+    elapsed = time.perf_counter() - t0
+    return n_requests / elapsed, errors
+
+
+def run_sql(pool, n_threads, n_requests, target_date):
+    """The handler's queries alone, counted in SQLite so no rows reach Python"""
+    def one(i):
+        db = pool.acquire()
+        try:
+            query, params = db._metrics_query(target_date, min_market_cap=i)
+            db.conn.execute(f"SELECT COUNT(*) FROM ({query})", params).fetchone()
+        finally:
+            pool.release(db)
+    
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        list(executor.map(one, range(n_requests)))
+    return n_requests / (time.perf_counter() - t0)
+
+
+def open_fds():
+    fd_dir = '/proc/self/fd'
+    return len(os.listdir(fd_dir)) if os.path.isdir(fd_dir) else None
+
+
+def check_threaded_server(path, target_date, n_requests, max_size=4):
+    pool = ReadPool({'file': path}, max_size=max_size)
+    api_server.read_pool = pool
+    server = make_server('127.0.0.1', 0, api_server.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.port}/api/metrics?date={target_date.isoformat()}"
+    
+    def one(i):
+        fmt = '&format=ndjson' if i % 4 == 0 else ''
+        response = requests.get(f"{base}&min_market_cap={i}{fmt}", timeout=30)
+        assert response.status_code == 200, response.text
+    
+    try:
+        one(0)
+        fds = open_fds()
+        for i in range(n_requests):
+            one(i)
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(one, range(n_requests)))
+        grown = open_fds() - fds if fds is not None else 0
+    finally:
+        server.shutdown()
+        thread.join()
+    
+    assert pool.size() <= max_size, f"{pool.size()} read connections for a pool of {max_size}"
+    assert pool.idle() == pool.size(), f"{pool.size() - pool.idle()} connections never returned"
+    assert grown < 16, f"{grown} file descriptors leaked over {2 * n_requests} requests"
+    print(f"ok    threaded server: {2 * n_requests} requests over {pool.size()} read connections, "
+          f"all returned, {grown} fds grown")
+    pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--requests', type=int, default=400)
+    args = parser.parse_args()
+    
+    target_date = date(2024, 6, 3)
+    path = os.path.join(tempfile.mkdtemp(), "bench_concurrency.db")
+    writer = Database({'file': path})
+    writer.connect()
+    seed(writer, args.tickers, target_date)
+    
+    shared = Database({'file': path})
+    shared.connect()
+    
+    api_server.db = writer
+    api_server.response_cache = ResponseCache(max_bytes=0)
+    
+    stop = threading.Event()
+    tickers = [f"T{i:05d}" for i in range(args.tickers)]
+    thread = threading.Thread(target=background_writer, args=(writer, tickers, target_date, stop))
+    thread.start()
+    
+    pooled_errors = []
+    base = {}
+    try:
+        print(f"/api/metrics, {args.tickers} tickers, {args.requests} requests per run, "
+              f"{os.cpu_count()} CPUs (req/s, x = speedup over the first thread count)")
+        for n in args.threads:
+            rates = {}
+            rates['pooled'], errors = run(ReadPool({'file': path}), n, args.requests, target_date)
+            pooled_errors.extend(errors)
+            rates['shared'], shared_errors = run(SharedPool(shared), n, args.requests, target_date)
+            rates['sql'] = run_sql(ReadPool({'file': path}), n, args.requests, target_date)
+            rates['shared sql'] = run_sql(SharedPool(shared), n, args.requests, target_date)
+            base = base or rates
+            print(f"threads={n:<3} " + "  ".join(
+                f"{name}={rate:7.1f} ({rate / base[name]:4.2f}x)" for name, rate in rates.items()
+            ) + f"  errors pooled={len(errors)} shared={len(shared_errors)}")
+            assert rates['pooled'] >= base['pooled'] / 2, \
+                f"pooled throughput collapsed at {n} threads: {rates['pooled']:.1f} req/s"
+        check_threaded_server(path, target_date, args.requests // 2)
+    finally:
+        stop.set()
+        thread.join()
+        shared.close()
+        writer.close()
+    
+    assert not pooled_errors, f"pooled reads failed: {sorted(set(pooled_errors))}"
+
+
+if __name__ == "__main__":
+    main()
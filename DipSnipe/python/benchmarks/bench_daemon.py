@@ -0,0 +1,263 @@
+"""
+Ingestion daemon benchmark and checks, offline against the simulated
+provider with a fake clock.
+
+Checks:
+- The scheduler: EOD falls due at the close plus the delay, only on
+  trading days (never on weekends or holidays), and the latest missed
+  one is caught up; intraday refresh slots only fall inside the session.
+- A scheduled slot is queued once however often the loop wakes, and a
+  job left running by a crashed daemon is queued again on restart.
+- A failed scheduled EOD run is retried with doubling backoff, is not
+  claimed before its retry time (which the loop wakes for), and is left
+  failed after max_attempts.
+- The control endpoint: a backfill POSTed over HTTP is queued, run by
+  the job loop, and its state, duration and stats are queryable; bad
+  requests are rejected.
+
+Times one day's EOD run as a cold `compute_metrics.py --simulate DATE`
+process (interpreter, imports, connection, client) against the same run
+as a job in the warm daemon.
+
+Usage: python bench_daemon.py [--tickers 200] [--runs 3]
+"""
+import argparse
+import copy
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import requests
+
+SRC = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(SRC))
+
+import ingest_daemon
+from config_loader import load_config
+from ingest_daemon import DaemonJobs, IngestDaemon, Scheduler, daemon_options
+from trading_calendar import trading_days
+
+logging.disable(logging.WARNING)
+
+NY = daemon_options({})['tz']
+# Friday; the following Monday is an ordinary trading day
+FRIDAY = date(2024, 6, 7)
+
+
+def at(day, hour, minute=0):
+    return datetime(day.year, day.month, day.day, hour, minute, tzinfo=NY)
+
+
+def check_scheduler():
+    config = {'daemon': {'eod_delay_minutes': 30, 'live_interval_minutes': 15}}
+    scheduler = Scheduler(daemon_options(config))
+    monday = FRIDAY + timedelta(days=3)
+
+    assert scheduler.last_eod(at(FRIDAY, 16, 29)) == FRIDAY - timedelta(days=1)
+    assert scheduler.last_eod(at(FRIDAY, 16, 30)) == FRIDAY
+    assert scheduler.last_eod(at(FRIDAY + timedelta(days=1), 12)) == FRIDAY, "weekend run"
+    assert scheduler.next_eod(at(FRIDAY, 17)) == at(monday, 16, 30)
+    # Independence Day 2024 is a Thursday holiday
+    assert scheduler.last_eod(at(date(2024, 7, 4), 18)) == date(2024, 7, 3)
+    assert scheduler.next_eod(at(date(2024, 7, 3), 17)) == at(date(2024, 7, 5), 16, 30)
+    print("ok    EOD falls due after close + delay on trading days only, missed ones catch up")
+
+    assert scheduler.live_slot(at(FRIDAY, 9, 29)) is None
+    assert scheduler.live_slot(at(FRIDAY, 10, 7)) == at(FRIDAY, 10)
+    assert scheduler.live_slot(at(FRIDAY, 16)) is None
+    assert scheduler.live_slot(at(FRIDAY + timedelta(days=1), 11)) is None
+    assert scheduler.next_live(at(FRIDAY, 10, 7)) == at(FRIDAY, 10, 15)
+    assert scheduler.next_live(at(FRIDAY, 15, 50)) == at(monday, 9, 30)
+    assert scheduler.next_wakeup(at(FRIDAY, 15, 50)) == at(FRIDAY, 16, 30)
+    assert [kind for kind, _, _ in scheduler.due(at(FRIDAY, 10, 7))] == ['eod', 'live']
+    print("ok    intraday refresh slots fall only inside the session")
+
+
+def daemon_config(workdir):
+    config = copy.deepcopy(load_config())
+    config['database'] = {**config['database'], 'file': os.path.join(workdir, "daemon.db"),
+                          'archive_dir': os.path.join(workdir, "archive")}
+    config['daemon'] = {**config.get('daemon', {}), 'port': 0, 'live_interval_minutes': 0}
+    config.setdefault('metrics', {})['textfile'] = ""
+    config['universe'] = {'min_market_cap': 0}
+    return config
+
+
+def seed(config, tickers):
+    from database import Database
+    db = Database(config['database'])
+    db.connect()
+    db.save_fundamentals_many([{
+        'ticker': t, 'sector': f"Sector {i % 11}", 'industry': f"Industry {i % 60}",
+        'market_cap': 10**9 + i
+    } for i, t in enumerate(tickers)])
+    db.close()
+
+
+def check_jobs(daemon, tickers):
+    saturday = at(FRIDAY + timedelta(days=1), 12)
+    queued = daemon.schedule(saturday)
+    assert len(queued) == 1 and daemon.schedule(saturday) == [], "slot queued twice"
+    assert daemon.jobs.get(queued[0])['args'] == {'date': FRIDAY.isoformat()}
+    assert daemon.run_pending() == 1
+    job = daemon.jobs.get(queued[0])
+    assert job['state'] == 'done' and job['stats']['processed'] == len(tickers), job
+    rows = daemon.db.conn.execute(
+        "SELECT COUNT(*) FROM intraday_metrics WHERE date = ?", (FRIDAY.isoformat(),)).fetchone()[0]
+    assert rows == len(tickers)
+    print(f"ok    the weekend wakeup ran Friday's EOD once ({rows} tickers) in "
+          f"{job['duration_seconds'] * 1e3:.0f}ms")
+
+    # A daemon that died mid-job left it running
+    crashed = DaemonJobs(daemon.db)
+    job_id = crashed.submit('eod', {'date': FRIDAY.isoformat()})
+    assert crashed.claim(daemon.clock())['id'] == job_id
+    assert crashed.requeue_interrupted() == 1
+    assert crashed.get(job_id)['state'] == 'queued'
+    daemon.run_pending()
+    assert crashed.get(job_id)['state'] == 'done'
+    print("ok    jobs interrupted by a crash are queued again and complete")
+
+
+def check_retries(daemon, tickers):
+    """Monday's EOD fails twice, then succeeds; Tuesday's never does"""
+    process_universe = ingest_daemon.process_universe
+    failures = {'2024-06-10': 2, '2024-06-11': 99}
+
+    def flaky(db, client, tickers, day, config):
+        if failures.get(day.isoformat(), 0) > 0:
+            failures[day.isoformat()] -= 1
+            raise ConnectionError("provider unavailable")
+        return process_universe(db, client, tickers, day, config)
+
+    clock, backoff = daemon.clock, daemon.options['retry_backoff']
+    now = at(FRIDAY + timedelta(days=3), 17)
+    daemon.clock = lambda: now
+    ingest_daemon.process_universe = flaky
+    logging.disable(logging.ERROR)  # the expected failures' tracebacks
+    try:
+        assert daemon.run_pending() == 1
+        job_id = daemon.jobs.recent(1)[0]['id']
+        job = daemon.jobs.get(job_id)
+        assert job['state'] == 'queued' and job['attempts'] == 1 and 'provider' in job['error'], job
+        assert daemon.next_wakeup(now) == now + backoff
+        assert daemon.run_pending() == 0, "retried before its backoff"
+
+        now += backoff
+        assert daemon.run_pending() == 1
+        assert daemon.jobs.get(job_id)['attempts'] == 2
+        assert daemon.next_wakeup(now) == now + 2 * backoff, "backoff did not double"
+        now += 2 * backoff
+        assert daemon.run_pending() == 1
+        job = daemon.jobs.get(job_id)
+        assert job['state'] == 'done' and job['attempts'] == 3 and job['retry_at'] is None, job
+        assert job['stats']['processed'] == len(tickers)
+        print("ok    a failed EOD run is retried after 1x then 2x backoff and completes")
+
+        now = at(FRIDAY + timedelta(days=4), 17)
+        for _ in range(daemon.options['max_attempts']):
+            daemon.run_pending()
+            now += 2 ** daemon.options['max_attempts'] * backoff
+        job = daemon.jobs.recent(1)[0]
+        assert job['state'] == 'failed' and job['attempts'] == daemon.options['max_attempts'], job
+        assert daemon.run_pending() == 0 and daemon.jobs.next_retry() is None
+        print(f"ok    an EOD run that keeps failing stops after {job['attempts']} attempts")
+    finally:
+        logging.disable(logging.WARNING)
+        ingest_daemon.process_universe = process_universe
+        daemon.clock = clock
+
+
+def check_control(daemon, tickers):
+    daemon.start_control()
+    base = f"http://127.0.0.1:{daemon._server.port}"
+    start, end = FRIDAY - timedelta(days=7), FRIDAY - timedelta(days=1)
+
+    response = requests.post(f"{base}/jobs/backfill", json={'start': start.isoformat(),
+                                                            'end': end.isoformat()})
+    assert response.status_code == 202, response.text
+    job_id = response.json()['id']
+    assert requests.get(f"{base}/jobs/{job_id}").json()['state'] == 'queued'
+    for body in ({}, {'start': end.isoformat(), 'end': start.isoformat()},
+                 {'start': '2999-01-01'}, {'start': start.isoformat(), 'tickers': 'AAPL'}):
+        assert requests.post(f"{base}/jobs/backfill", json=body).status_code == 400, body
+    assert requests.post(f"{base}/jobs/rebuild", json={}).status_code == 400
+    assert requests.get(f"{base}/jobs/999999").status_code == 404
+
+    daemon.run_pending()
+    job = requests.get(f"{base}/jobs/{job_id}").json()
+    days = len(trading_days(start, end))
+    assert job['state'] == 'done' and job['stats']['processed'] == len(tickers) * days, job
+    assert job['duration_seconds'] > 0 and job['started_at'] and job['finished_at']
+    listed = requests.get(f"{base}/jobs", params={'state': 'done'}).json()['jobs']
+    assert listed[0]['id'] == job_id
+    health = requests.get(f"{base}/health").json()
+    assert health['jobs']['queued'] == 0 and health['running_job'] is None, health
+    metrics = requests.get(f"{base}/metrics").text
+    assert 'dipsnipe_daemon_jobs_total{kind="backfill",outcome="done"}' in metrics
+    print(f"ok    backfill over HTTP: {len(tickers) * days} ticker-days, job {job_id} done in "
+          f"{job['duration_seconds'] * 1e3:.0f}ms, status and metrics queryable")
+
+
+def time_cold(workdir, tickers, days):
+    """Wall time of a fresh compute_metrics.py process per day"""
+    cold_dir = os.path.join(workdir, "cold")
+    os.makedirs(cold_dir, exist_ok=True)
+    times = []
+    for day in days:
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, str(SRC / "compute_metrics.py"), '--simulate',
+                        day.isoformat(), *tickers],
+                       cwd=cold_dir, check=True, capture_output=True)
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def time_warm(daemon, days):
+    """Duration of the same runs as jobs in the warm daemon"""
+    ids = [daemon.submit('eod', {'date': day.isoformat()}) for day in days]
+    daemon.run_pending()
+    jobs = [daemon.jobs.get(job_id) for job_id in ids]
+    assert all(job['state'] == 'done' for job in jobs)
+    return [job['duration_seconds'] for job in jobs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickers', type=int, default=200)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    check_scheduler()
+
+    workdir = tempfile.mkdtemp()
+    tickers = [f"T{i:05d}" for i in range(args.tickers)]
+    config = daemon_config(workdir)
+    seed(config, tickers)
+    daemon = IngestDaemon(config, simulate=True, clock=lambda: at(FRIDAY + timedelta(days=1), 12))
+    daemon.open()
+    try:
+        check_jobs(daemon, tickers)
+        check_retries(daemon, tickers)
+        check_control(daemon, tickers)
+
+        days = trading_days(FRIDAY - timedelta(days=40), FRIDAY - timedelta(days=10))[:args.runs]
+        cold = time_cold(workdir, tickers, days)
+        warm = time_warm(daemon, days)
+    finally:
+        daemon.close()
+
+    print(f"{args.tickers} tickers, EOD run per day (median of {len(days)}): "
+          f"cold process {statistics.median(cold) * 1e3:7.0f}ms  "
+          f"warm daemon job {statistics.median(warm) * 1e3:7.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark: per-ticker vs bulk vs concurrent bulk bar download against a
+local stand-in for Yahoo, then bulk download through a cold and a warm
+on-disk fetch cache. A few tickers are unknown to the stand-in, so the warm
+run also exercises negative entries and should make no requests at all.
+
+Usage: python bench_fetch.py [--tickers 500] [--latency 0.05] [--rate-limit 6000]
+
+The benchmark runs with a generous rate limit so it finishes quickly; the
+projected column shows the floor imposed by the production budget
+(60 requests/minute) for the number of requests each path made.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+import api_clients
+from api_clients import YahooFinanceClient
+from compute_metrics import fetch_bars_concurrently
+from fetch_cache import FetchCache
+from stub_provider import FakeYFinance
+
+logging.disable(logging.WARNING)
+
+PRODUCTION_RATE_PER_MINUTE = 60
+
+
+def run(label, fn, fake):
+    fake.requests = 0
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    projected = max(elapsed, fake.requests * 60.0 / PRODUCTION_RATE_PER_MINUTE)
+    print(f"{label:<16} requests={fake.requests:<5} wall={elapsed:8.2f}s  "
+          f"projected@{PRODUCTION_RATE_PER_MINUTE}/min={projected:8.1f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--rate-limit', type=int, default=6000)
+    parser.add_argument('--chunk-size', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+    
+    tickers = [f"T{i:04d}" for i in range(args.tickers)]
+    delisted = tickers[::50]
+    fake = FakeYFinance(latency=args.latency, missing=delisted)
+    api_clients.yf = fake
+    target_date = date(2024, 6, 3)
+    
+    def client(cache=None):
+        return YahooFinanceClient(rate_limit=args.rate_limit, chunk_size=args.chunk_size,
+                                  cache=cache)
+    
+    def concurrent():
+        merged = {}
+        for fetched, _ in fetch_bars_concurrently(client(), tickers, target_date, args.workers):
+            merged.update(fetched)
+        return merged
+    
+    print(f"{args.tickers} tickers, latency={args.latency}s, rate limit={args.rate_limit}/min")
+    serial = client()
+    old = run("per-ticker", lambda: {t: serial.get_intraday_bars(t, target_date) for t in tickers}, fake)
+    new = run("bulk", lambda: client().get_intraday_bars_bulk(tickers, target_date), fake)
+    par = run(f"bulk x{args.workers}", concurrent, fake)
+    
+    assert old == new == par, "fetch paths returned different bars"
+    
+    # A fresh FetchCache per run, as separate processes sharing one file would see it
+    path = os.path.join(tempfile.mkdtemp(), "fetch_cache.sqlite")
+    cold = run("bulk, cold cache", lambda: client(FetchCache(path)).get_intraday_bars_bulk(
+        tickers, target_date), fake)
+    warm = run("bulk, warm cache", lambda: client(FetchCache(path)).get_intraday_bars_bulk(
+        tickers, target_date), fake)
+    print(f"fetch cache: {FetchCache(path).stats()}")
+    
+    assert fake.requests == 0, "warm cache still went to the provider"
+    assert cold == warm == new, "cached bars differ from fetched bars"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Fundamentals refresh benchmark: a full refresh, then incremental refreshes
+with nothing stale and with a few new tickers, against a fake provider with
+fixed per-request latency, on a scratch SQLite file.
+
+Also checks that moving a ticker to another sector rebuilds the daily
+snapshot and sector ranks of the dates it has metrics on.
+
+Usage: python bench_fundamentals.py [--tickers 500] [--latency-ms 100] [--workers 8]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from database import Database
+from populate_fundamentals import refresh_fundamentals
+from ranks import refresh_ranks
+
+logging.disable(logging.INFO)
+
+
+def fake_fetch(latency):
+    def fetch(ticker):
+        time.sleep(latency)
+        return {'ticker': ticker, 'sector': 'Tech', 'industry': 'Software',
+                'market_cap': 1_000_000 * (hash(ticker) % 1000 + 1)}
+    return fetch
+
+
+def sector_count(db, day, sector):
+    snapshot = db.get_daily_snapshot(day)
+    return next((s['ticker_count'] for s in snapshot['sectors'] if s['name'] == sector), 0)
+
+
+def check_regrouping(db, tickers):
+    """Move the worst ticker out of Tech; its dates' snapshots and ranks follow"""
+    days = [date(2024, 6, 3), date(2024, 6, 4)]
+    db.save_metrics_many([
+        (ticker, day, {'max_drawdown_pct': -5.0 + i, 'drawdown_time': datetime(2024, 6, 3, 10),
+                       'recovery_pct': 1.0}, 'bench')
+        for day in days for i, ticker in enumerate(tickers[:20])
+    ])
+    for day in days:
+        db.refresh_daily_snapshot(day)
+        refresh_ranks(db, day)
+    assert sector_count(db, days[0], 'Tech') == 20
+
+    def fetch(ticker):
+        sector = 'Energy' if ticker == tickers[0] else 'Tech'
+        return {'ticker': ticker, 'sector': sector, 'industry': 'Software',
+                'market_cap': 1_000_000 * (hash(ticker) % 1000 + 1)}
+
+    summary = refresh_fundamentals(db, tickers[:20], full=True, fetch=fetch, rate_limit=1e6)
+    assert summary['dates_refreshed'] == len(days), summary
+    for day in days:
+        assert sector_count(db, day, 'Tech') == 19 and sector_count(db, day, 'Energy') == 1
+        ranks = {row['ticker']: row['sector_rank'] for row in db.get_rank_inputs(day)}
+        assert ranks[tickers[0]] == 1 and ranks[tickers[1]] == 1, ranks
+    print(f"  ok    a sector change rebuilt the snapshots and sector ranks of {len(days)} dates")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=100)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    tickers = [f"T{i:05d}" for i in range(args.tickers)]
+    fetch = fake_fetch(args.latency_ms / 1000)
+    path = os.path.join(tempfile.mkdtemp(), "bench_fundamentals.db")
+    db = Database({'file': path})
+    db.connect()
+    options = dict(max_workers=args.workers, rate_limit=1e6, fetch=fetch)
+
+    serial = args.tickers * (args.latency_ms / 1000 + 0.1)
+    print(f"{args.tickers} tickers, {args.latency_ms:.0f} ms/request "
+          f"(old serial loop: ~{serial:.0f}s)")
+
+    runs = [
+        ("full refresh", tickers, dict(full=True)),
+        ("nothing stale", tickers, {}),
+        ("5 new tickers", tickers + [f"N{i}" for i in range(5)], {}),
+        ("full, no change", tickers, dict(full=True)),
+    ]
+    for label, universe, extra in runs:
+        generation = db.get_data_generation()
+        t0 = time.perf_counter()
+        summary = refresh_fundamentals(db, universe, **options, **extra)
+        elapsed = time.perf_counter() - t0
+        bumped = db.get_data_generation() != generation
+        print(f"  {label:<15} {elapsed:7.2f}s  {summary}  cache invalidated={bumped}")
+
+    check_regrouping(db, tickers)
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Live refresh benchmark and exactness checks, offline against the simulator
+replayed through a trading session.
+
+The replay client serves, at step k, the day's first k bars with the k-th
+still forming (a narrower, partial version of its final values), so every
+refresh revises the latest bar and adds at most one new one. After each
+refresh the provisional metrics must equal a full recompute over the bars
+visible at that point; after the last bar they must equal the EOD values,
+and the EOD run must supersede the live state.
+
+Also checks that migration 13 rewrites bar timestamps stored before
+bars were UTC (naive exchange time or '-04:00') as UTC, dropping rows
+that duplicate an instant already stored, and that a ticker whose provider (or timestamp clock) changes
+mid-session is folded from scratch, and that one ticker with unfoldable
+bars fails on its own without stopping the refresh.
+
+Also times one refresh against a full recompute of the day.
+
+Usage: python bench_live.py [--tickers 2000]
+"""
+import argparse
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from compute_metrics import process_universe, refresh_live
+from database import Database
+from market_simulator import MarketSimulator, SimulatedMarketClient
+from metrics import compute_drawdown_metrics_many, fold_running_state, running_metrics
+from migrations import MIGRATIONS, migrate
+from rate_limiter import TokenBucket
+from trading_calendar import EXCHANGE_TZ
+
+logging.disable(logging.WARNING)
+
+TARGET_DATE = date(2024, 6, 3)
+CONFIG = {'apis': {'yahoo': {'max_workers': 4}}}
+
+
+class SessionReplay:
+    """The simulator's bars as they look `step` bars into the session"""
+
+    def __init__(self, simulator, chunk_size=100, name='replay'):
+        self.simulator = simulator
+        self.chunk_size = chunk_size
+        self.limiter = TokenBucket(1e9)
+        self.step = 1
+        self.name = name
+
+    def visible(self, tickers, day):
+        shown = {}
+        for ticker, bars in self.simulator.bars_many(tickers, day).items():
+            still_trading = self.step < len(bars)
+            bars = [dict(b) for b in bars[:self.step]]
+            if still_trading:
+                forming = bars[-1]
+                forming['close'] = (forming['open'] + forming['close']) / 2
+                forming['high'] = max(forming['open'], forming['close'])
+                forming['low'] = min(forming['open'], forming['close'])
+            shown[ticker] = bars
+        return shown
+
+    def get_intraday_bars_bulk(self, tickers, day, sources=None):
+        shown = self.visible(tickers, day)
+        if sources is not None:
+            sources.update(dict.fromkeys(shown, self.name))
+        return shown
+
+
+class NaiveReplay(SessionReplay):
+    """A provider that sends naive exchange-time timestamps, like old live state"""
+
+    def visible(self, tickers, day):
+        shown = super().visible(tickers, day)
+        for bars in shown.values():
+            for bar in bars:
+                bar['timestamp'] = bar['timestamp'].astimezone(EXCHANGE_TZ).replace(tzinfo=None)
+        return shown
+
+
+class BrokenReplay(SessionReplay):
+    """One ticker's bars cannot be ordered"""
+
+    def visible(self, tickers, day):
+        shown = super().visible(tickers, day)
+        if 'BROKEN' in shown:
+            shown['BROKEN'][0]['timestamp'] = None
+        return shown
+
+
+def stored_metrics(db):
+    return {
+        row['ticker']: (row['max_drawdown_pct'], row['recovery_pct'], row['drawdown_time'])
+        for row in db.conn.execute(
+            "SELECT ticker, max_drawdown_pct, recovery_pct, drawdown_time FROM intraday_metrics "
+            "WHERE date = ?", (TARGET_DATE.isoformat(),))
+    }
+
+
+def expected(bars_by_ticker):
+    return {
+        t: (m['max_drawdown_pct'], m['recovery_pct'], m['drawdown_time'].isoformat())
+        for t, m in compute_drawdown_metrics_many(bars_by_ticker).items()
+    }
+
+
+def check_fold_random_batches(sim):
+    """Folding bars in arbitrary batches, with revisions, equals a full recompute"""
+    rng = random.Random(7)
+    tickers = [f"F{i:03d}" for i in range(300)]
+    full = sim.bars_many(tickers, TARGET_DATE)
+    for ticker, bars in full.items():
+        state, seen = None, 0
+        while seen < len(bars):
+            # Everything since the last delivery, sometimes re-sending older bars
+            start = max(0, seen - rng.randint(0, 2))
+            seen = min(len(bars), seen + rng.randint(0, 3))
+            state = fold_running_state(state, bars[start:seen])
+        got = running_metrics(state)
+        want = compute_drawdown_metrics_many({ticker: bars})[ticker]
+        assert got == want, (ticker, got, want)
+    print("ok    folding random batches (with re-sent bars) equals a full recompute")
+
+
+def check_switch_and_failures(sim):
+    """Mid-session provider/clock switch restarts the fold; a broken ticker fails alone"""
+    tickers = [{'ticker': f"S{i:03d}"} for i in range(200)]
+    names = [t['ticker'] for t in tickers]
+    db = Database({'file': os.path.join(tempfile.mkdtemp(), "switch.db")})
+    db.connect()
+    naive, replay = NaiveReplay(sim, name='legacy'), SessionReplay(sim)
+    for step in range(1, 4):
+        naive.step = step
+        refresh_live(db, naive, tickers, TARGET_DATE, CONFIG)
+    for step in range(4, 6):
+        replay.step = step
+        stats = refresh_live(db, replay, tickers, TARGET_DATE, CONFIG)
+        assert stats['failed'] == 0, stats
+        assert stored_metrics(db) == expected(replay.visible(names, TARGET_DATE)), f"step {step}"
+    print("ok    a provider and timezone switch mid-session restarts the fold")
+
+    broken = BrokenReplay(sim)
+    broken.step = 6
+    stats = refresh_live(db, broken, tickers + [{'ticker': 'BROKEN'}], TARGET_DATE, CONFIG)
+    assert stats == {'processed': len(names), 'skipped': 0, 'failed': 1}, stats
+    stored = stored_metrics(db)
+    assert 'BROKEN' not in stored
+    assert stored == expected(broken.visible(names, TARGET_DATE))
+    print("ok    a ticker whose bars cannot be folded fails without stopping the refresh")
+    db.close()
+
+
+def check_utc_migration():
+    """Bars stored naive or with an exchange offset are rekeyed as UTC, once per instant"""
+    path = os.path.join(tempfile.mkdtemp(), "old.db")
+    conn = sqlite3.connect(path)
+    migrate(conn, [m for m in MIGRATIONS if m[0] < 13])
+    conn.execute("INSERT INTO tickers (ticker) VALUES ('OLD')")
+    conn.executemany(
+        "INSERT INTO intraday_bars (ticker, timestamp, open, high, low, close) VALUES ('OLD', ?, 1, 1, 1, 1)",
+        [('2024-06-03T09:30:00',), ('2024-06-03T10:30:00-04:00',),
+         ('2024-06-03T11:30:00',), ('2024-06-03T15:30:00+00:00',)]
+    )
+    conn.execute("""INSERT INTO intraday_metrics (ticker, date, max_drawdown_pct, drawdown_time, recovery_pct)
+                    VALUES ('OLD', '2024-06-03', 0, '2024-06-03T09:30:00', 0)""")
+    conn.commit()
+    conn.close()
+
+    db = Database({'file': path})
+    db.connect()
+    stamps = [b['timestamp'].isoformat() for b in db.get_intraday_bars('OLD', TARGET_DATE)]
+    assert stamps == ['2024-06-03T13:30:00+00:00', '2024-06-03T14:30:00+00:00',
+                      '2024-06-03T15:30:00+00:00'], stamps
+    dd_time = db.conn.execute("SELECT drawdown_time FROM intraday_metrics").fetchone()[0]
+    assert dd_time == '2024-06-03T13:30:00+00:00', dd_time
+    db.close()
+    print("ok    migration 13 rekeys naive and offset bar timestamps as UTC, once per instant")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickers', type=int, default=2000)
+    args = parser.parse_args()
+
+    check_utc_migration()
+    sim = MarketSimulator()
+    check_fold_random_batches(sim)
+    check_switch_and_failures(sim)
+
+    tickers = [{'ticker': f"T{i:05d}"} for i in range(args.tickers)]
+    names = [t['ticker'] for t in tickers]
+    db = Database({'file': os.path.join(tempfile.mkdtemp(), "live.db")})
+    db.connect()
+    replay = SessionReplay(sim)
+
+    bars_per_day = len(sim.bars(names[0], TARGET_DATE))
+    refresh_times = []
+    for step in range(1, bars_per_day + 1):
+        replay.step = step
+        t0 = time.perf_counter()
+        refresh_live(db, replay, tickers, TARGET_DATE, CONFIG)
+        refresh_times.append(time.perf_counter() - t0)
+        assert stored_metrics(db) == expected(replay.visible(names, TARGET_DATE)), f"step {step}"
+    print(f"ok    provisional metrics equal a full recompute after each of {bars_per_day} refreshes")
+
+    final = expected(sim.bars_many(names, TARGET_DATE))
+    assert stored_metrics(db) == final
+    assert len(db.get_live_state_many(TARGET_DATE)) == len(names)
+    assert not db.get_tickers_with_metrics(TARGET_DATE), "live rows counted as final"
+
+    process_universe(db, SimulatedMarketClient(sim), tickers, TARGET_DATE, CONFIG)
+    assert stored_metrics(db) == final
+    assert not db.get_live_state_many(TARGET_DATE), "EOD run left live state behind"
+    assert len(db.get_tickers_with_metrics(TARGET_DATE)) == len(names)
+    print("ok    live values match EOD; the EOD run superseded the live state")
+
+    refresh_live(db, replay, tickers, TARGET_DATE, CONFIG)
+    assert stored_metrics(db) == final and not db.get_live_state_many(TARGET_DATE)
+    print("ok    refreshes after EOD leave final metrics alone")
+    db.close()
+
+    db = Database({'file': os.path.join(tempfile.mkdtemp(), "full.db")})
+    db.connect()
+    t0 = time.perf_counter()
+    process_universe(db, SimulatedMarketClient(sim), tickers, TARGET_DATE, CONFIG)
+    full = time.perf_counter() - t0
+    db.close()
+
+    mid = sorted(refresh_times)[len(refresh_times) // 2]
+    print(f"{args.tickers} tickers  live refresh median {mid * 1e3:8.1f}ms  "
+          f"full day recompute {full * 1e3:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
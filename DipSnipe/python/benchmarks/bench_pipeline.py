@@ -0,0 +1,219 @@
+"""
+End-to-end pipeline benchmark: fetch -> compute -> store -> serve, fully
+offline against the simulated data provider, at several universe sizes.
+
+Each process_universe stage is timed on its own (plan_universe, fetching,
+compute_drawdown_metrics_many, the BatchWriter flushes of save_metrics_many
+and save_bars_many, refresh_daily_snapshot), then the whole
+process_universe call, then the /api/metrics and /api/intraday_bars
+handlers through the Flask test client, cold and warm.
+
+Results are written as JSON (median and min seconds per size and stage,
+plus the commit and library versions) so runs can be compared across
+commits with --compare.
+
+Usage: python bench_pipeline.py [--sizes 100 500 2000] [--repeat 3]
+                                [--output FILE] [--compare BASELINE.json]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import api_server
+from compute_metrics import fetch_bars_concurrently, plan_universe, process_universe
+from database import Database, ReadPool
+from market_simulator import MarketSimulator, SimulatedMarketClient
+from metrics import compute_drawdown_metrics_many
+
+logging.disable(logging.INFO)
+
+TARGET_DATE = date(2024, 6, 3)
+
+
+def fresh_db(workdir, name, n_tickers):
+    path = os.path.join(workdir, f"{name}.db")
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db = Database({'file': path, 'batch_size': 100, 'batch_seconds': 3600})
+    db.connect()
+    tickers = [{'ticker': f"T{i:05d}"} for i in range(n_tickers)]
+    db.save_fundamentals_many([{
+        'ticker': t['ticker'], 'sector': f"Sector {i % 11}",
+        'industry': f"Industry {i % 60}", 'market_cap': 1_000_000_000 + i
+    } for i, t in enumerate(tickers)])
+    return db, tickers
+
+
+def run_stages(db, client, tickers, max_workers):
+    """One pass through process_universe's stages, each timed separately"""
+    timings = {}
+
+    t0 = time.perf_counter()
+    skip, cached, to_fetch = plan_universe(db, tickers, TARGET_DATE)
+    timings['plan'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    fetched = {}
+    for chunk, _ in fetch_bars_concurrently(client, to_fetch, TARGET_DATE, max_workers):
+        fetched.update(chunk)
+    timings['fetch'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    computed = compute_drawdown_metrics_many(fetched)
+    timings['compute'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with db.batch_writer() as writer:
+        for ticker, bars in fetched.items():
+            if computed.get(ticker):
+                writer.add(ticker, TARGET_DATE, computed[ticker], 'bench', bars)
+    timings['store'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    db.refresh_daily_snapshot(TARGET_DATE)
+    timings['snapshot'] = time.perf_counter() - t0
+    return timings
+
+
+def time_requests(http, url, repeat, cold=False):
+    samples = []
+    for _ in range(repeat):
+        if cold:
+            api_server.response_cache = None
+        t0 = time.perf_counter()
+        response = http.get(url)
+        samples.append(time.perf_counter() - t0)
+        assert response.status_code == 200, (url, response.status_code)
+    return samples
+
+
+def serve_stages(db, repeat):
+    api_server.db = db
+    api_server.read_pool = ReadPool({'file': db.db_file})
+    api_server.response_cache = None
+    http = api_server.app.test_client()
+    day = TARGET_DATE.isoformat()
+    urls = {
+        'api_metrics': f"/api/metrics?date={day}",
+        'api_intraday_bars': f"/api/intraday_bars?ticker=T00000&date={day}",
+    }
+    samples = {}
+    for name, url in urls.items():
+        samples[f"{name}_cold"] = time_requests(http, url, repeat, cold=True)
+        samples[f"{name}_warm"] = time_requests(http, url, repeat)
+    api_server.read_pool.close()
+    return samples
+
+
+def summarize(samples):
+    return {
+        'median_s': statistics.median(samples),
+        'min_s': min(samples),
+        'samples': len(samples),
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old = {(r['size'], r['stage']): r['median_s'] for r in baseline['results']}
+    print(f"\nvs {baseline_path} (commit {baseline['environment'].get('commit')})")
+    for r in results:
+        before = old.get((r['size'], r['stage']))
+        if before:
+            change = (r['median_s'] - before) / before
+            print(f"  {r['size']:>6} {r['stage']:<24} {before * 1e3:10.2f}ms -> "
+                  f"{r['median_s'] * 1e3:10.2f}ms  {change:+7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 500, 2000])
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="pipeline passes per size (each on a fresh database)")
+    parser.add_argument('--requests', type=int, default=20, help="requests per handler sample")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="simulated provider latency per request, seconds")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--output', help="JSON results file (default: pipeline-<commit>.json)")
+    parser.add_argument('--compare', help="earlier results file to diff against")
+    args = parser.parse_args()
+
+    env = environment()
+    workdir = tempfile.mkdtemp()
+    client = SimulatedMarketClient(MarketSimulator(), chunk_size=100, latency=args.latency)
+    config = {'apis': {'yahoo': {'max_workers': args.workers}}}
+    results = []
+
+    for size in args.sizes:
+        samples = {}
+        for _ in range(args.repeat):
+            db, tickers = fresh_db(workdir, f"stages-{size}", size)
+            for stage, seconds in run_stages(db, client, tickers, args.workers).items():
+                samples.setdefault(stage, []).append(seconds)
+            db.close()
+
+            db, tickers = fresh_db(workdir, f"e2e-{size}", size)
+            t0 = time.perf_counter()
+            process_universe(db, client, tickers, TARGET_DATE, config)
+            samples.setdefault('process_universe', []).append(time.perf_counter() - t0)
+            db.close()
+
+        db = Database({'file': os.path.join(workdir, f"stages-{size}.db")})
+        db.connect()
+        samples.update(serve_stages(db, args.requests))
+        db.close()
+
+        for stage, values in samples.items():
+            row = {'size': size, 'stage': stage, **summarize(values)}
+            results.append(row)
+            print(f"{size:>6} tickers  {stage:<24} median {row['median_s'] * 1e3:10.2f}ms  "
+                  f"min {row['min_s'] * 1e3:10.2f}ms")
+
+    output = args.output or f"pipeline-{env['commit'] or 'local'}.json"
+    with open(output, 'w') as f:
+        json.dump({'benchmark': 'pipeline', 'environment': env,
+                   'parameters': vars(args), 'results': results}, f, indent=2)
+    print(f"\nWrote {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Provider fallback chain benchmark and checks, offline against a local
+stand-in for Yahoo that can be switched to "blocked".
+
+- Blocked Yahoo: the old client retries every chunk and then generates
+  synthetic bars; the chain trips Yahoo's circuit breaker after a few
+  failures and stops calling it. Requests made and wall time are compared.
+- Attribution: with Yahoo blocked, tickers with stale fetch cache entries
+  are served by fetch_cache, tickers with a dropped CSV by drop_dir and the
+  rest by the simulator, and process_universe stores that in data_source.
+  A chain with no rate-limited provider runs and reports no limiter wait.
+- Empty answers: a rate-limited Yahoo that answers with no data at all
+  leaves the fetch cache alone (no negatives, stale positives kept), so
+  the tickers are asked for again once it recovers.
+- Recovery: once Yahoo is unblocked, the breaker half-opens after
+  reset_seconds and the trial request closes it again.
+
+Usage: python bench_providers.py [--tickers 500] [--chunk-size 10] [--latency 0.05]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+import api_clients
+from api_clients import YahooFinanceClient, _encode_frame
+from compute_metrics import process_universe
+from database import Database
+from fetch_cache import NEGATIVE, FetchCache
+from market_simulator import MarketSimulator, SimulatedMarketClient
+from providers import DropDirProvider, FetchCacheProvider, ProviderChain
+from stub_provider import FakeYFinance
+
+logging.disable(logging.ERROR)
+
+TARGET_DATE = date(2024, 6, 3)
+
+
+def yahoo(args, cache=None):
+    return YahooFinanceClient(rate_limit=60000, chunk_size=args.chunk_size, max_retries=2,
+                              backoff_base=args.latency, cache=cache)
+
+
+def chain(args, cache, drop_dir, reset_seconds=300.0):
+    return ProviderChain(
+        [yahoo(args, cache), FetchCacheProvider(cache), DropDirProvider(drop_dir),
+         SimulatedMarketClient(MarketSimulator(), chunk_size=args.chunk_size)],
+        failure_threshold=3, reset_seconds=reset_seconds, chunk_size=args.chunk_size
+    )
+
+
+def seed_fallbacks(fake, cache, drop_dir, stale, dropped):
+    """Expired fetch cache entries for `stale`, CSV files for `dropped`"""
+    start = datetime.combine(TARGET_DATE, datetime.min.time())
+    end = start + timedelta(days=1)
+    cache.put_many({
+        YahooFinanceClient._cache_key(t, TARGET_DATE, TARGET_DATE): _encode_frame(fake._frame(t, start, end))
+        for t in stale
+    }, ttl=-1)
+    os.makedirs(drop_dir, exist_ok=True)
+    for ticker in dropped:
+        fake._frame(ticker, start, end).rename_axis('Datetime').to_csv(
+            os.path.join(drop_dir, f"{ticker}.csv"))
+
+
+def timed(label, fake, fn):
+    fake.requests = 0
+    t0 = time.perf_counter()
+    result = fn()
+    print(f"{label:<34} requests={fake.requests:<4} wall={time.perf_counter() - t0:7.2f}s")
+    return result
+
+
+def check_empty_answers(args, workdir):
+    chunk = [f"E{i:03d}" for i in range(args.chunk_size)]
+    fake = FakeYFinance(latency=0, missing=chunk)
+    cache = FetchCache(os.path.join(workdir, "empty_answers.sqlite"))
+    seed_fallbacks(fake, cache, os.path.join(workdir, "unused"), chunk[:1], [])
+    keys = [YahooFinanceClient._cache_key(t, TARGET_DATE, TARGET_DATE) for t in chunk]
+    client = yahoo(args, cache)
+    real_yf, api_clients.yf = api_clients.yf, fake
+    try:
+        try:
+            client.fetch_range(chunk, TARGET_DATE, TARGET_DATE)
+            raise AssertionError("an empty answer did not fail")
+        except api_clients.ProviderError:
+            pass
+        assert client._fetch_real_data(chunk[1], TARGET_DATE) == []
+        stored = cache.get_many(keys, include_expired=True)
+        assert NEGATIVE not in stored.values(), "empty answer cached as negatives"
+        assert keys[0] in stored, "empty answer replaced a stale positive entry"
+
+        fake.missing, fake.requests = set(), 0
+        served = client.fetch_range(chunk, TARGET_DATE, TARGET_DATE)
+        assert fake.requests == 1 and set(served) == set(chunk), (fake.requests, len(served))
+    finally:
+        api_clients.yf = real_yf
+    print("ok    empty answers are not cached; recovered Yahoo serves the same tickers")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--chunk-size', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    check_empty_answers(args, workdir)
+    tickers = [f"T{i:04d}" for i in range(args.tickers)]
+    stale, dropped = tickers[:20], tickers[20:30]
+    fake = FakeYFinance(latency=args.latency, blocked=True)
+    api_clients.yf = fake
+    cache = FetchCache(os.path.join(workdir, "fetch_cache.sqlite"))
+    drop_dir = os.path.join(workdir, "drop")
+    seed_fallbacks(fake, cache, drop_dir, stale, dropped)
+
+    print(f"{args.tickers} tickers, chunks of {args.chunk_size}, Yahoo blocked")
+    timed("old client (retry, then synthetic)", fake,
+          lambda: yahoo(args).get_intraday_bars_bulk(tickers, TARGET_DATE))
+    client = chain(args, cache, drop_dir)
+    sources = {}
+    bars = timed("provider chain", fake,
+                 lambda: client.get_intraday_bars_bulk(tickers, TARGET_DATE, sources=sources))
+    assert fake.requests <= 3 * (client.providers[0].max_retries + 1), "breaker did not stop requests"
+    assert client.breakers['yahoo'].state == 'open'
+    print("ok    Yahoo's circuit opened and later chunks skipped it")
+
+    assert len(bars) == len(tickers)
+    assert all(sources[t] == 'fetch_cache' for t in stale)
+    assert all(sources[t] == 'drop_dir' for t in dropped)
+    assert all(sources[t] == 'simulated' for t in tickers[30:])
+    sim_bars = MarketSimulator().bars_many(dropped + stale, TARGET_DATE)
+    for ticker in dropped + stale:
+        assert [b['close'] for b in bars[ticker]] == [b['close'] for b in sim_bars[ticker]], ticker
+    print("ok    stale cache, dropped files and simulator each served their tickers")
+
+    db = Database({'file': os.path.join(workdir, "providers.db")})
+    db.connect()
+    process_universe(db, chain(args, cache, drop_dir), [{'ticker': t} for t in tickers],
+                     TARGET_DATE, {'apis': {'yahoo': {'max_workers': 4}}})
+    stored = dict(db.conn.execute(
+        "SELECT data_source, COUNT(*) FROM intraday_metrics GROUP BY data_source").fetchall())
+    assert stored == {'fetch_cache': len(stale), 'drop_dir': len(dropped),
+                      'simulated': len(tickers) - 30}, stored
+    print(f"ok    data_source recorded per provider: {stored}")
+    db.close()
+
+    db = Database({'file': os.path.join(workdir, "unlimited.db")})
+    db.connect()
+    unlimited = ProviderChain([FetchCacheProvider(cache), DropDirProvider(drop_dir)],
+                              chunk_size=args.chunk_size)
+    stats = process_universe(db, unlimited, [{'ticker': t} for t in stale + dropped],
+                             TARGET_DATE, {'apis': {'yahoo': {'max_workers': 4}}})
+    assert stats['processed'] == len(stale + dropped) and unlimited.total_wait == 0, stats
+    print("ok    a chain without a rate-limited provider runs and reports 0s limiter wait")
+    db.close()
+
+    client = chain(args, cache, drop_dir, reset_seconds=0.2)
+    fake.asked.clear()
+    client.get_intraday_bars_bulk(tickers[:50], TARGET_DATE)
+    assert client.breakers['yahoo'].state == 'open'
+    # The trial asks for tickers Yahoo failed on while blocked
+    retry = sorted(fake.asked)[:args.chunk_size]
+    fake.blocked = False
+    time.sleep(0.25)
+    sources = {}
+    client.get_intraday_bars_bulk(retry, TARGET_DATE, sources=sources)
+    assert client.breakers['yahoo'].state == 'closed'
+    assert retry and set(sources) == set(retry) and set(sources.values()) == {'yahoo'}, sources
+    print("ok    breaker half-opened after reset_seconds and closed on a good trial")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Cross-sectional rank benchmark and exactness checks.
+
+- Stored universe / sector / industry ranks and percentiles must equal
+  pandas' groupby rank (method='min', ties included) for every row.
+- Late tickers for the same date re-rank the whole day (every percentile
+  moves with the group sizes); a rerun with nothing new rewrites no rows.
+- Times the rank refresh, then "bottom decile of each sector" served from
+  the stored percentiles against ranking the date on every request with a
+  window function, as the dashboard otherwise would.
+
+Usage: python bench_ranks.py [--tickers 5000] [--repeat 50]
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from database import Database
+from ranks import RANK_COLUMNS, refresh_ranks
+
+logging.disable(logging.INFO)
+
+TARGET_DATE = date(2024, 6, 3)
+
+WINDOW_SQL = """
+    SELECT ticker, max_drawdown_pct FROM (
+        SELECT m.ticker, m.max_drawdown_pct,
+               100.0 * RANK() OVER (PARTITION BY t.sector ORDER BY m.max_drawdown_pct)
+                     / COUNT(*) OVER (PARTITION BY t.sector) AS sector_pct
+        FROM intraday_metrics m JOIN tickers t ON t.ticker = m.ticker
+        WHERE m.date = ?
+    ) WHERE sector_pct <= 10 ORDER BY max_drawdown_pct, ticker
+"""
+
+
+def seed(db, tickers):
+    db.save_fundamentals_many([{
+        'ticker': t, 'sector': None if i % 101 == 0 else f"Sector {i % 11}",
+        'industry': f"Industry {i % 70}", 'market_cap': 10**9 + i
+    } for i, t in enumerate(tickers)])
+
+
+def save_returns(db, tickers, seed=9):
+    rng = random.Random(seed)
+    # Two decimals, so ties are common
+    db.save_metrics_many([
+        (t, TARGET_DATE, {'max_drawdown_pct': round(rng.gauss(0, 2), 2),
+                          'drawdown_time': datetime(2024, 6, 3, 10), 'recovery_pct': 1.0}, 'bench')
+        for t in tickers
+    ])
+
+
+def expected(db):
+    df = pd.read_sql_query(
+        """SELECT m.ticker, m.max_drawdown_pct, t.sector, t.industry
+           FROM intraday_metrics m LEFT JOIN tickers t ON t.ticker = m.ticker WHERE m.date = ?""",
+        db.conn, params=(TARGET_DATE.isoformat(),)).set_index('ticker')
+    out = pd.DataFrame(index=df.index)
+    df['universe'] = 0
+    for scope in ('universe', 'sector', 'industry'):
+        grouped = df.groupby(scope)['max_drawdown_pct']
+        out[f"{scope}_rank"] = grouped.rank(method='min')
+        out[f"{scope}_pct"] = 100.0 * out[f"{scope}_rank"] / grouped.transform('size')
+    return out
+
+
+def check(db, label):
+    want = expected(db)
+    got = pd.read_sql_query(
+        f"SELECT ticker, {', '.join(RANK_COLUMNS)} FROM intraday_metrics WHERE date = ?",
+        db.conn, params=(TARGET_DATE.isoformat(),)).set_index('ticker').loc[want.index]
+    for column in RANK_COLUMNS:
+        assert np.allclose(got[column].astype(float), want[column].astype(float),
+                           rtol=0, atol=1e-9, equal_nan=True), (label, column)
+    print(f"ok    {label}: {len(want)} rows match pandas groupby rank")
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return sorted(times)[len(times) // 2], result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickers', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    tickers = [f"T{i:05d}" for i in range(args.tickers)]
+    on_time, late = tickers[:int(args.tickers * 0.9)], tickers[int(args.tickers * 0.9):]
+    db = Database({'file': os.path.join(tempfile.mkdtemp(), "ranks.db")})
+    db.connect()
+    seed(db, tickers)
+
+    save_returns(db, on_time)
+    t0 = time.perf_counter()
+    written = refresh_ranks(db, TARGET_DATE)
+    first = time.perf_counter() - t0
+    assert written == len(on_time)
+    check(db, "first refresh")
+
+    save_returns(db, late, seed=10)
+    t0 = time.perf_counter()
+    moved = refresh_ranks(db, TARGET_DATE)
+    again = time.perf_counter() - t0
+    check(db, f"late tickers ({len(late)}) re-ranked the day")
+    assert moved >= len(late)
+    assert refresh_ranks(db, TARGET_DATE) == 0, "an idempotent rerun rewrote rows"
+    print(f"ok    late refresh rewrote {moved}/{len(tickers)} rows; a rerun rewrote none")
+
+    db.conn.execute("ANALYZE")
+    stored_time, stored = timed(lambda: db.get_metrics(TARGET_DATE, max_sector_pct=10), args.repeat)
+    window_time, window = timed(
+        lambda: db.conn.execute(WINDOW_SQL, (TARGET_DATE.isoformat(),)).fetchall(), args.repeat)
+    # Tickers without a sector are their own NULL partition in the window query
+    assert [m['ticker'] for m in stored] == [row[0] for row in window if row[0] in
+                                            {m['ticker'] for m in stored}]
+    assert len(window) - len(stored) <= len(tickers) // 101 + 1
+    db.close()
+
+    print(f"{args.tickers} tickers  refresh {first * 1e3:7.1f}ms (late {again * 1e3:6.1f}ms)  "
+          f"bottom sector decile: stored pct {stored_time * 1e3:6.2f}ms  "
+          f"window rank per request {window_time * 1e3:6.2f}ms  ({len(stored)} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Rolling metrics benchmark and exactness checks.
+
+Seeds a history of day returns (some tickers missing on some dates, some
+listed late), then:
+- advances rolling_metrics one date at a time, as daily runs do, and checks
+  every stored value against a plain-Python recomputation from the full
+  history of each ticker;
+- checks a full rebuild stores exactly the same rows;
+- fills in tickers for an older date, as a late backfill does, and checks
+  updating from that date re-chains every later date correctly;
+- times one incremental date against rescanning the whole history for it.
+
+Usage: python bench_rolling.py [--tickers 2000] [--days 120]
+"""
+import argparse
+import logging
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from database import Database
+from rolling import rebuild_rolling, rolling_options, update_rolling
+from trading_calendar import trading_days
+
+logging.disable(logging.INFO)
+
+CONFIG = {'rolling': {'cum_days': 5, 'vol_days': 20, 'min_vol_days': 5}}
+
+
+def seed_returns(tickers, days, seed=11):
+    """{(ticker, day): day return %}, with gaps and late listings"""
+    rng = random.Random(seed)
+    returns = {}
+    for i, ticker in enumerate(tickers):
+        listed = days[rng.randrange(len(days) // 3)] if i % 10 == 0 else days[0]
+        vol = rng.uniform(0.5, 3.0)
+        for day in days:
+            if day < listed or rng.random() < 0.03:
+                continue
+            # Some flat tickers, so zero volatility is exercised too
+            returns[(ticker, day)] = 0.0 if i % 97 == 0 else round(rng.gauss(-0.05, vol), 4)
+    return returns
+
+
+def save(db, returns):
+    db.save_metrics_many([
+        (ticker, day, {'max_drawdown_pct': r, 'drawdown_time': datetime.combine(day, datetime.min.time()),
+                       'recovery_pct': abs(r)}, 'bench')
+        for (ticker, day), r in returns.items()
+    ])
+
+
+def last_stats(values, options):
+    """(cum_return_pct, down_streak, return_zscore) for the last of a ticker's returns"""
+    r = values[-1]
+    trailing = values[:-1][-options['vol_days']:]
+    zscore = None
+    if len(trailing) >= options['min_vol_days']:
+        std = statistics.stdev(trailing)
+        if std > 0:
+            zscore = (r - statistics.fmean(trailing)) / std
+    streak = 0
+    for v in reversed(values):
+        if v >= 0:
+            break
+        streak += 1
+    growth = math.prod(1 + v / 100 for v in values[-options['cum_days']:])
+    return (growth - 1) * 100, streak, zscore
+
+
+def expected(returns, options):
+    """Rolling statistics recomputed from each ticker's whole history"""
+    history = {}
+    for (ticker, day), r in sorted(returns.items(), key=lambda item: item[0][1]):
+        history.setdefault(ticker, []).append((day, r))
+
+    result = {}
+    for ticker, series in history.items():
+        values = [r for _, r in series]
+        for k, (day, _) in enumerate(series):
+            result[(ticker, day.isoformat())] = last_stats(values[:k + 1], options)
+    return result
+
+
+def stored(db):
+    return {
+        (row['ticker'], row['date']): (row['cum_return_pct'], row['down_streak'], row['return_zscore'])
+        for row in db.conn.execute(
+            "SELECT ticker, date, cum_return_pct, down_streak, return_zscore FROM rolling_metrics")
+    }
+
+
+def check_equal(got, want, label):
+    assert got.keys() == want.keys(), f"{label}: {len(got)} rows stored, {len(want)} expected"
+    for key, (cum, streak, z) in want.items():
+        g_cum, g_streak, g_z = got[key]
+        assert g_streak == streak, (label, key, g_streak, streak)
+        assert math.isclose(g_cum, cum, rel_tol=1e-9, abs_tol=1e-9), (label, key, g_cum, cum)
+        assert (g_z is None) == (z is None), (label, key, g_z, z)
+        if z is not None:
+            assert math.isclose(g_z, z, rel_tol=1e-9, abs_tol=1e-9), (label, key, g_z, z)
+    print(f"ok    {label}: {len(want)} rows match the recomputation from full history")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickers', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=120)
+    args = parser.parse_args()
+
+    options = rolling_options(CONFIG)
+    tickers = [f"T{i:05d}" for i in range(args.tickers)]
+    days = trading_days(date(2024, 1, 2), date(2025, 12, 31))[:args.days]
+    returns = seed_returns(tickers, days)
+
+    # A late backfill: these (ticker, day) pairs arrive after everything else
+    rng = random.Random(3)
+    late_day = days[len(days) // 2]
+    late = {k: returns.pop(k) for k in list(returns) if k[1] == late_day and rng.random() < 0.2}
+
+    db = Database({'file': os.path.join(tempfile.mkdtemp(), "rolling.db")})
+    db.connect()
+
+    # Daily runs: each date's metrics land, then the stage advances it
+    step_times = []
+    for day in days:
+        save(db, {k: r for k, r in returns.items() if k[1] == day})
+        t0 = time.perf_counter()
+        update_rolling(db, day, CONFIG)
+        step_times.append(time.perf_counter() - t0)
+    check_equal(stored(db), expected(returns, options), "incremental daily updates")
+
+    t0 = time.perf_counter()
+    rebuild_rolling(db, CONFIG)
+    rebuild = time.perf_counter() - t0
+    check_equal(stored(db), expected(returns, options), "full rebuild")
+
+    save(db, late)
+    returns.update(late)
+    t0 = time.perf_counter()
+    update_rolling(db, late_day, CONFIG)
+    rechain = time.perf_counter() - t0
+    check_equal(stored(db), expected(returns, options), "late tickers re-chained forward")
+
+    # What a stage without stored state would do each day: read every
+    # ticker's whole history and recompute the last date from it
+    t0 = time.perf_counter()
+    rows = db.conn.execute(
+        "SELECT ticker, date, max_drawdown_pct FROM intraday_metrics WHERE date <= ?",
+        (days[-1].isoformat(),)).fetchall()
+    history = {}
+    for ticker, day, r in sorted(rows, key=lambda row: row[1]):
+        history.setdefault(ticker, []).append(r)
+    rescan_result = {ticker: last_stats(values, options) for ticker, values in history.items()}
+    rescan = time.perf_counter() - t0
+    db.close()
+
+    mid = sorted(step_times)[len(step_times) // 2]
+    print(f"{args.tickers} tickers x {args.days} days  "
+          f"incremental date median {mid * 1e3:7.1f}ms  "
+          f"history rescan for one date {rescan * 1e3:8.1f}ms ({len(rescan_result)} rows)")
+    print(f"{'':>24}full rebuild {rebuild:6.2f}s  re-chain from {late_day} {rechain:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
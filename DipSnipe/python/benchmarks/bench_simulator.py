@@ -0,0 +1,69 @@
+"""
+Market simulator benchmark and sanity checks: generation time at several
+universe sizes, per-(ticker, date) reproducibility, and the correlation
+structure (same-sector pairs should co-move more than cross-sector pairs).
+
+Usage: python bench_simulator.py [--tickers 500 5000] [--days 250]
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from market_simulator import MarketSimulator
+from trading_calendar import trading_days
+
+
+def check_reproducible(sim):
+    state = random.getstate()
+    day = date(2024, 6, 3)
+    alone = sim.bars('AAPL', day)
+    assert sim.bars_many(['MSFT', 'AAPL', 'XOM'], day)['AAPL'] == alone, "depends on batch"
+    assert sim.bars('AAPL', date(2024, 6, 4)) != alone, "same bars on every date"
+    assert random.getstate() == state, "touched global random state"
+    print("ok    (ticker, date) bars reproduce in isolation and differ by date")
+
+
+def check_correlation(sim, days):
+    tickers = [f"C{i:03d}" for i in range(200)]
+    out = sim.simulate(tickers, days)
+    daily = np.log(out['close'][:, :, -1] / out['open'][:, :, 0])
+    corr = np.corrcoef(daily)
+    sectors = np.array([sim.sector_of(t) for t in tickers])
+    same = sectors[:, None] == sectors[None, :]
+    upper = np.triu(np.ones_like(same), k=1).astype(bool)
+    within, across = corr[same & upper].mean(), corr[~same & upper].mean()
+    print(f"ok    daily-return correlation: same sector {within:.2f}, "
+          f"cross sector {across:.2f}, daily vol {daily.std():.2%}")
+    assert within > across > 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tickers', type=int, nargs='+', default=[500, 5000])
+    parser.add_argument('--days', type=int, default=250)
+    args = parser.parse_args()
+
+    sim = MarketSimulator()
+    days = trading_days(date(2024, 1, 1), date(2025, 6, 30))[:args.days]
+    check_reproducible(sim)
+    check_correlation(sim, days[:60])
+
+    for n in args.tickers:
+        tickers = [f"T{i:05d}" for i in range(n)]
+        t0 = time.perf_counter()
+        out = sim.simulate(tickers, days)
+        elapsed = time.perf_counter() - t0
+        bars = out['close'].size
+        print(f"{n:>6} tickers x {len(days)} days  {bars:>10,} bars  "
+              f"{elapsed:6.2f}s  ({bars / elapsed / 1e6:.2f}M bars/s)")
+
+
+if __name__ == "__main__":
+    main()
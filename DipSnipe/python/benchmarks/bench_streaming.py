@@ -0,0 +1,102 @@
+"""
+Streaming benchmark: time to first byte, total time and peak Python heap
+of /api/metrics as JSON vs format=ndjson vs format=arrow (if pyarrow is
+installed), on a 5,000-ticker day with the response cache disabled.
+
+Peak heap is measured with tracemalloc, so it counts the result lists and
+the serialized body but not SQLite's own page cache.
+
+Also checks that paging a streamed format with limit/after, following its
+X-Next-Cursor header, returns the same pages as the JSON next_cursor.
+
+Usage: python bench_streaming.py [--tickers 5000]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+import api_server
+from bench_api import seed
+from database import Database, ReadPool
+from response_cache import ResponseCache
+
+logging.disable(logging.INFO)
+
+
+def measure(client, url):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    t0 = time.perf_counter()
+    response = client.get(url, buffered=False)
+    chunks = iter(response.response)
+    first = next(chunks, b'')
+    ttfb = time.perf_counter() - t0
+    size = len(first) + sum(len(chunk) for chunk in chunks)
+    total = time.perf_counter() - t0
+    response.close()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return response.status_code, ttfb, total, size, peak
+
+
+def check_pagination(client, target_date, limit=700):
+    """Walk every page as JSON and as NDJSON; the tickers and cursors must agree"""
+    base = f"/api/metrics?date={target_date.isoformat()}&limit={limit}"
+    pages = 0
+    json_cursor = ndjson_cursor = None
+    while True:
+        after = f"&after={json_cursor}" if json_cursor else ""
+        page = client.get(base + after).get_json()
+        streamed = client.get(base + after + "&format=ndjson")
+        tickers = [json.loads(line)['ticker'] for line in streamed.get_data(as_text=True).splitlines()]
+        assert tickers == [m['ticker'] for m in page['metrics']], f"page {pages} differs"
+        json_cursor = page['next_cursor']
+        ndjson_cursor = streamed.headers.get('X-Next-Cursor')
+        assert ndjson_cursor == json_cursor, (ndjson_cursor, json_cursor)
+        pages += 1
+        if json_cursor is None:
+            break
+    print(f"ok    format=ndjson pages by X-Next-Cursor match the JSON next_cursor ({pages} pages)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tickers', type=int, default=5000)
+    args = parser.parse_args()
+    
+    target_date = date(2024, 6, 3)
+    path = os.path.join(tempfile.mkdtemp(), "bench_streaming.db")
+    db = Database({'file': path})
+    db.connect()
+    seed(db, args.tickers, target_date)
+    
+    api_server.db = db
+    api_server.read_pool = ReadPool({'file': path})
+    api_server.response_cache = ResponseCache(max_bytes=0)
+    client = api_server.app.test_client()
+    
+    formats = ['json', 'ndjson'] + (['arrow'] if api_server.pa is not None else [])
+    print(f"/api/metrics, {args.tickers} tickers")
+    for fmt in formats:
+        url = f"/api/metrics?date={target_date.isoformat()}&format={fmt}"
+        measure(client, url)  # warm SQLite's page cache
+        status, ttfb, total, size, peak = measure(client, url)
+        assert status == 200
+        print(f"{fmt:<7} ttfb={ttfb * 1000:8.2f}ms  total={total * 1000:8.2f}ms  "
+              f"bytes={size:>9}  peak heap={peak / 1024:9.1f}KiB")
+    check_pagination(client, target_date)
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Multi-process ingestion benchmark and queue checks, offline against the
+simulated provider.
+
+Checks: an expired lease is reclaimed by the next claim, a worker whose
+lease was reclaimed cannot complete the job, and a job that keeps failing
+is parked as failed with its error after max_attempts. A range with no
+trading days returns zero counts without starting workers.
+
+Scaling: drains the same (ticker, date) queue with 1, 2 and 4 worker
+processes, with simulated per-request latency, then verifies every job is
+done, each (ticker, date) has exactly one metrics row, and the values match
+a single-process compute. The most workers must beat one worker. Each run
+also reports its fixed overhead, timed by rerunning it with nothing left to
+queue: starting the workers plus the snapshot/ranks/rolling pass. A second
+pass with a tight rate limit shows throughput flattening at the limit.
+
+Usage: python bench_workers.py [--tickers 400] [--days 3] [--workers 1 2 4]
+                               [--latency 0.2] [--rate-limit 600]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from database import Database
+from ingest_workers import run_workers
+from job_queue import JobQueue
+from market_simulator import MarketSimulator
+from metrics import compute_drawdown_metrics_many
+from trading_calendar import trading_days
+
+logging.disable(logging.WARNING)
+
+START = date(2024, 6, 3)
+
+
+def fresh_db(workdir, name):
+    path = os.path.join(workdir, f"{name}.db")
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db = Database({'file': path})
+    db.connect()
+    return db
+
+
+def check_queue(workdir):
+    db = fresh_db(workdir, "queue")
+    queue = JobQueue(db, max_attempts=2)
+    day = START
+    queue.enqueue([('AAA', day), ('BBB', day)])
+
+    assert queue.claim('dead', 1, -1, day, day) == [('AAA', day)]
+    reclaimed = queue.claim('alive', 10, 60, day, day)
+    assert ('AAA', day) in reclaimed, "expired lease was not reclaimed"
+    assert queue.complete('dead', [('AAA', day)]) == [], "stale lease holder completed a job"
+    assert queue.complete('alive', [('AAA', day)]) == [('AAA', day)]
+    print("ok    expired leases are reclaimed; stale holders cannot complete")
+
+    queue.fail('alive', [('BBB', day)], "boom")
+    queue.fail('alive', queue.claim('alive', 10, 60, day, day), "boom again")
+    counts = queue.counts(day, day)
+    assert counts == {'pending': 0, 'leased': 0, 'done': 1, 'failed': 1}, counts
+    assert queue.errors(day, day)[0][2:] == (2, "boom again")
+    assert queue.enqueue([('AAA', day), ('BBB', day)]) == 1, "failed job not re-armed"
+    print("ok    errors are recorded and jobs park as failed after max_attempts")
+    db.close()
+
+
+def check_empty_range(workdir):
+    db = fresh_db(workdir, "empty")
+    weekend = trading_days(date(2024, 6, 8), date(2024, 6, 9))
+    counts = run_workers(db, {'database': {'file': db.db_file}}, [{'ticker': 'AAA'}], weekend, 2)
+    assert counts == {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}, counts
+    print("ok    a range with no trading days queues nothing")
+    db.close()
+
+
+def check_exactly_once(db, tickers, days):
+    expected = len(tickers) * len(days)
+    rows = db.conn.execute(
+        "SELECT COUNT(*), COUNT(DISTINCT ticker || date) FROM intraday_metrics"
+    ).fetchone()
+    assert tuple(rows) == (expected, expected), (tuple(rows), expected)
+
+    sim = MarketSimulator()
+    names = [t['ticker'] for t in tickers[:50]]
+    want = compute_drawdown_metrics_many(sim.bars_many(names, days[-1]))
+    got = dict(db.conn.execute(
+        "SELECT ticker, max_drawdown_pct FROM intraday_metrics WHERE date = ?",
+        (days[-1].isoformat(),)
+    ).fetchall())
+    for ticker in names:
+        assert got[ticker] == want[ticker]['max_drawdown_pct'], ticker
+
+
+def run(workdir, tickers, days, n_workers, latency, rate_limit):
+    name = f"workers-{n_workers}-{rate_limit or 'unlimited'}"
+    db = fresh_db(workdir, name)
+    config = {
+        'database': {'file': db.db_file},
+        'apis': {'yahoo': {'chunk_size': 20},
+                 'simulated': {'seed': 0, 'latency_seconds': latency,
+                               'rate_limit_per_minute': rate_limit}},
+        'ingest': {'batch_size': 40, 'lease_seconds': 60, 'max_attempts': 3, 'poll_seconds': 0.1},
+    }
+    t0 = time.perf_counter()
+    counts = run_workers(db, config, tickers, days, n_workers, simulate=True)
+    elapsed = time.perf_counter() - t0
+    assert counts['done'] == len(tickers) * len(days) and counts['failed'] == 0, counts
+    check_exactly_once(db, tickers, days)
+    # Nothing left to queue: what remains is starting the workers and the
+    # snapshot/ranks/rolling pass, the part more workers cannot shorten
+    t0 = time.perf_counter()
+    run_workers(db, config, tickers, days, n_workers, simulate=True)
+    overhead = time.perf_counter() - t0
+    db.close()
+    return elapsed, overhead
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickers', type=int, default=400)
+    parser.add_argument('--days', type=int, default=3)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--latency', type=float, default=0.2,
+                        help="simulated provider latency per request, seconds")
+    parser.add_argument('--rate-limit', type=float, default=600,
+                        help="requests/minute for the rate-limited pass (split across workers)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    check_queue(workdir)
+    check_empty_range(workdir)
+
+    tickers = [{'ticker': f"T{i:05d}"} for i in range(args.tickers)]
+    days = trading_days(START, date(2024, 12, 31))[:args.days]
+    jobs = len(tickers) * len(days)
+    for rate_limit in (None, args.rate_limit):
+        label = f"{rate_limit:.0f} req/min" if rate_limit else "no rate limit"
+        rates = {}
+        for n in args.workers:
+            elapsed, overhead = run(workdir, tickers, days, n, args.latency, rate_limit)
+            rates[n] = jobs / elapsed
+            print(f"{label:>14}  {n} workers  {jobs} jobs  {elapsed:6.2f}s  "
+                  f"({rates[n]:7.1f} jobs/s, fixed overhead {overhead:5.2f}s)  exactly once: ok")
+        if not rate_limit and len(rates) > 1:
+            fewest, most = min(rates), max(rates)
+            assert rates[most] > rates[fewest], \
+                f"{most} workers ({rates[most]:.1f} jobs/s) no faster than {fewest} ({rates[fewest]:.1f})"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Write-throughput benchmark: commit-per-row save_metrics/save_intraday_bars
+vs BatchWriter transactions, on a scratch SQLite file.
+
+Usage: python bench_writes.py [--tickers 500] [--bars 7] [--batch-size 100]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from database import Database
+
+logging.disable(logging.INFO)
+
+
+def make_rows(n_tickers, n_bars):
+    start = datetime(2024, 6, 3, 9, 30)
+    rows = []
+    for i in range(n_tickers):
+        bars = [{
+            'timestamp': start + timedelta(hours=j),
+            'open': 100.0 + j, 'high': 101.0 + j, 'low': 99.0 + j, 'close': 100.5 + j
+        } for j in range(n_bars)]
+        metrics = {'max_drawdown_pct': -1.5, 'drawdown_time': start, 'recovery_pct': 2.0}
+        rows.append((f"T{i:05d}", metrics, bars))
+    return rows
+
+
+def fresh_db(path, batch_size):
+    if os.path.exists(path):
+        os.remove(path)
+    db = Database({'file': path, 'batch_size': batch_size, 'batch_seconds': 3600})
+    db.connect()
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--bars', type=int, default=7)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+    
+    rows = make_rows(args.tickers, args.bars)
+    target_date = date(2024, 6, 3)
+    path = os.path.join(tempfile.mkdtemp(), "bench_writes.db")
+    
+    db = fresh_db(path, args.batch_size)
+    t0 = time.perf_counter()
+    for ticker, metrics, bars in rows:
+        db.save_metrics(ticker, target_date, metrics, 'bench')
+        db.save_intraday_bars(ticker, bars)
+    per_row = time.perf_counter() - t0
+    db.close()
+    
+    db = fresh_db(path, args.batch_size)
+    t0 = time.perf_counter()
+    with db.batch_writer() as writer:
+        for ticker, metrics, bars in rows:
+            writer.add(ticker, target_date, metrics, 'bench', bars)
+    batched = time.perf_counter() - t0
+    count = db.conn.execute("SELECT COUNT(*) FROM intraday_metrics").fetchone()[0]
+    db.close()
+    assert count == args.tickers
+    
+    print(f"{args.tickers} tickers x {args.bars} bars")
+    print(f"commit-per-row  commits={2 * args.tickers:<6} {per_row:7.3f}s  "
+          f"{args.tickers / per_row:9.0f} tickers/s")
+    print(f"batched         commits={writer.flushes:<6} {batched:7.3f}s  "
+          f"{args.tickers / batched:9.0f} tickers/s  ({per_row / batched:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Query-plan check: run every hot Database read against a migrated scratch
+database, capture the SQL it issues, and fail if EXPLAIN QUERY PLAN shows
+a full table scan for any of it. Leaderboard top-N pages must also be a
+bounded index walk, with no temporary sort.
+
+Usage: python check_query_plans.py [--tickers 500]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from database import Database
+from migrations import full_table_scans, temp_sorts
+from ranks import refresh_ranks
+from rolling import update_rolling
+
+logging.disable(logging.INFO)
+
+
+def seed(db, n_tickers, target_date):
+    start = datetime.combine(target_date, datetime.min.time()) + timedelta(hours=9.5)
+    tickers = [f"T{i:05d}" for i in range(n_tickers)]
+    db.save_fundamentals_many([{
+        'ticker': t, 'sector': f"Sector {i % 11}",
+        'industry': f"Industry {i % 60}", 'market_cap': 1_000_000_000 + i
+    } for i, t in enumerate(tickers)])
+    db.conn.executemany("UPDATE tickers SET avg_volume = ? WHERE ticker = ?",
+                        [(1000 * (i % 97), t) for i, t in enumerate(tickers)])
+    # A week of history before target_date gives the rolling stage some state
+    days = [target_date - timedelta(days=k) for k in range(7, -1, -1)]
+    db.save_metrics_many([
+        (t, day, {'max_drawdown_pct': -5.0 + i / n_tickers + (i * k % 7), 'drawdown_time': start,
+                  'recovery_pct': 2.0}, 'bench')
+        for k, day in enumerate(days)
+        for i, t in enumerate(tickers)
+    ])
+    db.save_bars_many({
+        t: [{'timestamp': start + timedelta(hours=h), 'open': 100.0, 'high': 101.0,
+             'low': 99.0, 'close': 100.5, 'volume': 1000} for h in range(7)]
+        for t in tickers
+    })
+    for day in days:
+        refresh_ranks(db, day)
+    update_rolling(db, days[0], {})
+    db.conn.execute("ANALYZE")
+    db.conn.commit()
+    return tickers
+
+
+def hot_queries(db, tickers, target_date):
+    """Every read the pipeline and the API issue on their hot paths"""
+    db.get_metrics(target_date)
+    db.get_metrics(target_date, min_market_cap=10**9, max_market_cap=10**12, min_volume=1)
+    db.get_metrics(target_date, sector="Sector 3")
+    db.get_metrics(target_date, sector="Sector 3", industry="Industry 14")
+    db.get_metrics(target_date, max_cum_return=-3.0, min_down_streak=1, max_zscore=0.0)
+    db.get_metrics(target_date, max_sector_pct=10)
+    db.get_metrics(target_date, max_industry_pct=10, sector="Sector 3")
+    db.get_metrics(target_date, max_universe_pct=5)
+    db.get_filtered_tickers(min_market_cap=10**9)
+    db.get_filtered_tickers(sector="Sector 3", industry="Industry 14")
+    db.get_tickers_with_metrics(target_date)
+    db.get_metric_keys(target_date - timedelta(days=30), target_date)
+    db.get_intraday_bars(tickers[0], target_date)
+    db.get_intraday_bars_many(tickers[:50], target_date)
+    db.get_sectors()
+    db.get_industries()
+    db.get_industries("Sector 3")
+    db.get_daily_snapshot(target_date)
+    db.get_metric_dates(target_date)
+    db.get_rolling_inputs(target_date)
+    db.get_rank_inputs(target_date)
+    db.get_data_generation()
+
+
+def top_n_queries(db, target_date):
+    """Leaderboard pages: first page and a keyset page for every sort"""
+    for sort in db.METRIC_SORTS:
+        first = db.get_metrics(target_date, max_market_cap=10**15, sort=sort, limit=50)
+        last = first[-1]
+        db.get_metrics(target_date, max_market_cap=10**15, sort=sort, limit=50,
+                       after=(last['sort_key'], last['ticker']))
+    db.get_metrics(target_date, max_market_cap=10**15, losers_only=True, limit=50)
+
+
+def capture(db, fn, *args):
+    """SELECT statements issued by fn(db, *args), deduplicated, in order"""
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    fn(db, *args)
+    db.conn.set_trace_callback(None)
+    return list(dict.fromkeys(s for s in statements if s.lstrip().upper().startswith('SELECT')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tickers', type=int, default=500)
+    args = parser.parse_args()
+    
+    target_date = date(2024, 6, 3)
+    path = os.path.join(tempfile.mkdtemp(), "check_query_plans.db")
+    db = Database({'file': path})
+    db.connect()
+    tickers = seed(db, args.tickers, target_date)
+    
+    checks = [(sql, False) for sql in capture(db, hot_queries, tickers, target_date)]
+    checks += [(sql, True) for sql in capture(db, top_n_queries, target_date)]
+    
+    failures = 0
+    for sql, top_n in checks:
+        problems = full_table_scans(db.conn, sql) + (temp_sorts(db.conn, sql) if top_n else [])
+        failures += bool(problems)
+        print(f"{'FAIL' if problems else 'ok':<5} {' '.join(sql.split())[:114]}")
+        for detail in problems:
+            print(f"      -> {detail}")
+    db.close()
+    
+    assert not failures, f"{failures} hot queries fall back to a full table scan or sort"
+
+
+if __name__ == "__main__":
+    main()
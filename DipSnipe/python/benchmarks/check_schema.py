@@ -0,0 +1,51 @@
+"""
+Schema drift check: database/schema.sql must be exactly what the
+migrations in migrations.py produce on an empty database. Fails with a
+diff when a migration was added or changed without regenerating it.
+
+Usage: python check_schema.py [--write]
+"""
+import argparse
+import difflib
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from migrations import schema_sql
+
+SCHEMA_FILE = Path(__file__).parent.parent.parent / "database" / "schema.sql"
+
+HEADER = """\
+-- DipHunter SQLite schema, generated from python/src/migrations.py.
+-- Do not edit: add a migration, then run
+--   python python/benchmarks/check_schema.py --write
+-- The application migrates its database itself on connect; this file
+-- documents the result and can create one: sqlite3 diphunter.db < database/schema.sql
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--write', action='store_true', help="regenerate schema.sql")
+    args = parser.parse_args()
+
+    expected = HEADER + schema_sql()
+    if args.write:
+        SCHEMA_FILE.write_text(expected)
+        print(f"wrote {SCHEMA_FILE}")
+        return
+
+    current = SCHEMA_FILE.read_text() if SCHEMA_FILE.exists() else ""
+    if current != expected:
+        sys.stdout.writelines(difflib.unified_diff(
+            current.splitlines(keepends=True), expected.splitlines(keepends=True),
+            'schema.sql', 'migrations'))
+        print("FAIL  schema.sql is out of date; run check_schema.py --write")
+        sys.exit(1)
+    print(f"ok    schema.sql matches the migrations ({expected.splitlines()[5].lstrip('- ')})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Consistency check: the daily_snapshot rows written by
+Database.refresh_daily_snapshot must match a recomputation in Python from
+the raw intraday_metrics rows, overall and per sector and industry, and
+/api/snapshot must serve the stored row.
+
+Usage: python check_snapshot.py [--tickers 500] [--days 5]
+"""
+import argparse
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import api_server
+from database import Database, ReadPool
+from trading_calendar import trading_days
+
+logging.disable(logging.INFO)
+
+
+def recompute(rows):
+    """Snapshot aggregates for a list of metric rows, computed in Python"""
+    returns = [r['max_drawdown_pct'] for r in rows]
+    worst = min(returns)
+    return {
+        'ticker_count': len(rows),
+        'avg_return_pct': sum(returns) / len(returns),
+        'worst_return_pct': worst,
+        'worst_tickers': {r['ticker'] for r in rows if r['max_drawdown_pct'] == worst},
+        'losers': sum(1 for r in returns if r < 0),
+    }
+
+
+def compare(label, stored, expected):
+    """Mismatches between a stored aggregate row and its recomputation"""
+    problems = []
+    for key in ('ticker_count', 'losers', 'worst_return_pct'):
+        if stored[key] != expected[key]:
+            problems.append(f"{label} {key}: stored {stored[key]}, expected {expected[key]}")
+    if not math.isclose(stored['avg_return_pct'], expected['avg_return_pct'], abs_tol=1e-9):
+        problems.append(f"{label} avg_return_pct: stored {stored['avg_return_pct']}, "
+                        f"expected {expected['avg_return_pct']}")
+    if stored['worst_ticker'] not in expected['worst_tickers']:
+        problems.append(f"{label} worst_ticker: {stored['worst_ticker']} is not a worst performer")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tickers', type=int, default=500)
+    parser.add_argument('--days', type=int, default=5)
+    args = parser.parse_args()
+    
+    rng = random.Random(0)
+    path = os.path.join(tempfile.mkdtemp(), "check_snapshot.db")
+    db = Database({'file': path})
+    db.connect()
+    
+    tickers = [f"T{i:05d}" for i in range(args.tickers)]
+    db.save_fundamentals_many([{
+        'ticker': t, 'sector': f"Sector {i % 11}",
+        'industry': f"Industry {i % 60}", 'market_cap': 1_000_000_000 + i
+    } for i, t in enumerate(tickers)])
+    
+    days = trading_days(date(2024, 6, 3), date(2024, 12, 31))[:args.days]
+    for day in days:
+        low_time = datetime.combine(day, datetime.min.time()) + timedelta(hours=11)
+        # Some tickers skip some days; returns are rounded so ties happen
+        db.save_metrics_many([
+            (t, day, {'max_drawdown_pct': round(rng.uniform(-6, 6), 1),
+                      'drawdown_time': low_time, 'recovery_pct': 1.0}, 'check')
+            for t in tickers if rng.random() < 0.9
+        ])
+        db.refresh_daily_snapshot(day)
+    
+    api_server.db = db
+    api_server.read_pool = ReadPool({'file': path})
+    client = api_server.app.test_client()
+    
+    problems = []
+    for day in days:
+        rows = db.get_metrics(day)
+        stored = db.get_daily_snapshot(day)
+        problems += compare(f"{day} overall", stored, recompute(rows))
+        
+        for column, breakdown in (('sector', stored['sectors']), ('industry', stored['industries'])):
+            groups = {}
+            for r in rows:
+                groups.setdefault(r[column], []).append(r)
+            if sorted(groups) != [g['name'] for g in breakdown]:
+                problems.append(f"{day} {column} groups differ")
+            for g in breakdown:
+                if g['name'] in groups:
+                    problems += compare(f"{day} {column}={g['name']}", g, recompute(groups[g['name']]))
+        
+        served = client.get(f"/api/snapshot?date={day.isoformat()}").get_json()['snapshot']
+        if served != stored:
+            problems.append(f"{day} /api/snapshot differs from the stored row")
+    
+    if client.get("/api/snapshot?date=2024-01-01").status_code != 404:
+        problems.append("/api/snapshot did not 404 for a date without metrics")
+    db.close()
+    
+    for problem in problems:
+        print(problem)
+    assert not problems, f"{len(problems)} snapshot mismatches"
+    print(f"{len(days)} daily snapshots match a recomputation from intraday_metrics")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Local stand-in for the yfinance module used by the benchmarks"""
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from market_simulator import MarketSimulator
+
+
+class FakeYFinance:
+    """
+    Mimics the parts of yfinance that api_clients uses.
+    Every call sleeps for a fixed request latency plus a small per-ticker
+    cost so the benchmarks reflect the shape of the real network round trip.
+    Tickers in `missing` behave like invalid or delisted symbols: Yahoo
+    answers, but with no bars for them. While `blocked` is set every
+    request fails after the usual round trip, as when Yahoo rate-limits us.
+    `asked` collects every ticker requested, blocked or not.
+    """
+    
+    def __init__(self, latency: float = 0.05, per_ticker: float = 0.0005, missing=(),
+                 blocked: bool = False):
+        self.latency = latency
+        self.per_ticker = per_ticker
+        self.missing = set(missing)
+        self.blocked = blocked
+        self.requests = 0
+        self.asked = set()
+        self.simulator = MarketSimulator()
+    
+    def _frame(self, ticker: str, start: datetime, end: datetime) -> pd.DataFrame:
+        days = [d.date() for d in pd.bdate_range(start, end - timedelta(days=1))]
+        sim = self.simulator.simulate([ticker], days)
+        return pd.DataFrame({
+            'Open': sim['open'][0].ravel(),
+            'High': sim['high'][0].ravel(),
+            'Low': sim['low'][0].ravel(),
+            'Close': sim['close'][0].ravel(),
+            'Volume': sim['volume'][0].ravel(),
+        }, index=pd.DatetimeIndex(sim['timestamp'].ravel()))
+    
+    def Ticker(self, ticker: str):
+        fake = self
+        
+        class _Ticker:
+            def history(self, start, end, interval="1h", auto_adjust=True):
+                fake.requests += 1
+                fake.asked.add(ticker)
+                time.sleep(fake.latency + fake.per_ticker)
+                if fake.blocked:
+                    raise RuntimeError("Too Many Requests. Rate limited. Try after a while.")
+                if ticker in fake.missing:
+                    return pd.DataFrame()
+                return fake._frame(ticker, start, end)
+        
+        return _Ticker()
+    
+    def download(self, tickers, start, end, interval="1h", auto_adjust=True,
+                 group_by="ticker", progress=False, threads=False):
+        self.requests += 1
+        self.asked.update(tickers)
+        time.sleep(self.latency + self.per_ticker * len(tickers))
+        if self.blocked:
+            raise RuntimeError("Too Many Requests. Rate limited. Try after a while.")
+        frames = {t: self._frame(t, start, end) for t in tickers if t not in self.missing}
+        return pd.concat(frames, axis=1) if frames else pd.DataFrame()
@@ -1,20 +1,89 @@
 """API clients for fetching market data with Simulation Fallback"""
+import json
 import logging
-import random
 import time
+import zlib
 from datetime import date, datetime, timedelta
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 import yfinance as yf
 import pandas as pd
 import numpy as np
 
+from fetch_cache import NEGATIVE, FetchCache
+from market_simulator import MarketSimulator
+from rate_limiter import TokenBucket, backoff_delay
+from telemetry import REGISTRY
+from trading_calendar import EXCHANGE_TZ, trading_days
+
 logger = logging.getLogger(__name__)
 
+FETCH_REQUESTS = REGISTRY.counter(
+    'dipsnipe_fetch_requests_total', 'Provider requests by outcome (success, retry, failure)',
+    ('provider', 'outcome'))
+FETCH_TICKERS = REGISTRY.counter(
+    'dipsnipe_fetch_tickers_total', 'Tickers served by the provider (success) or by synthetic fallback',
+    ('provider', 'outcome'))
+LIMITER_WAIT = REGISTRY.counter(
+    'dipsnipe_rate_limiter_wait_seconds_total', 'Time fetch workers spent waiting on the rate limiter',
+    ('provider',))
+FETCH_CACHE = REGISTRY.counter(
+    'dipsnipe_fetch_cache_lookups_total', 'Fetch cache lookups by outcome (hit, negative, miss)',
+    ('outcome',))
+
+def _encode_frame(df: pd.DataFrame) -> bytes:
+    """One ticker's raw provider frame as compressed JSON, timezone included"""
+    index = df.index
+    tz = str(index.tz) if index.tz is not None else None
+    stamps = (index.tz_convert('UTC') if tz else index).as_unit('ns').asi8
+    return zlib.compress(json.dumps({
+        'tz': tz,
+        'index': stamps.tolist(),
+        'columns': list(df.columns),
+        'data': df.to_numpy(dtype=float).tolist()
+    }).encode())
+
+def _decode_frame(payload: bytes) -> pd.DataFrame:
+    raw = json.loads(zlib.decompress(payload))
+    index = pd.to_datetime(raw['index'], unit='ns', utc=raw['tz'] is not None)
+    if raw['tz'] is not None:
+        index = index.tz_convert(raw['tz'])
+    return pd.DataFrame(raw['data'], index=index, columns=raw['columns'])
+
+class ProviderError(Exception):
+    """
+    A market data provider failed as a whole (request error, blocked,
+    empty answer), as opposed to simply having no bars for some tickers.
+    `served` holds anything it still managed to return.
+    """
+    
+    def __init__(self, message: str, served: Dict = None):
+        super().__init__(message)
+        self.served = served or {}
+
 class YahooFinanceClient:
     """Client for Yahoo Finance with Synthetic Fallback"""
     
-    def __init__(self, rate_limit: int = 60):
+    name = 'yahoo'
+    
+    def __init__(self, rate_limit: int = 60, chunk_size: int = 100,
+                 max_retries: int = 3, backoff_base: float = 1.0,
+                 cache: FetchCache = None, live_ttl: float = 300):
         self.rate_limit = rate_limit
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        # Raw responses already fetched (or known to be empty), shared
+        # across runs; windows that reach today expire after live_ttl
+        self.cache = cache
+        self.live_ttl = live_ttl
+        # Shared by every worker thread using this client
+        self.limiter = TokenBucket(rate_limit)
+        self.simulator = MarketSimulator()
+    
+    @property
+    def total_wait(self) -> float:
+        """Seconds spent waiting on the rate limiter"""
+        return self.limiter.total_wait
     
     def get_intraday_bars(self, ticker: str, target_date: date) -> List[Dict]:
         """
@@ -25,16 +94,115 @@ class YahooFinanceClient:
         
         if not bars:
             logger.warning(f"Yahoo API failed for {ticker}. Switching to SIMULATION MODE.")
+            FETCH_TICKERS.inc(provider='yahoo', outcome='synthetic')
             return self._generate_synthetic_data(ticker, target_date)
         
+        FETCH_TICKERS.inc(provider='yahoo', outcome='success')
         return bars
 
+    def get_intraday_bars_bulk(self, tickers: List[str], target_date: date,
+                               sources: Dict[str, str] = None) -> Dict[str, List[Dict]]:
+        """
+        Fetch bars for many tickers, one Yahoo request per chunk of the universe.
+        Tickers missing from the response fall back to synthetic data.
+        If given, sources is filled with 'yahoo' or 'synthetic' per ticker.
+        """
+        results = {}
+        for i in range(0, len(tickers), self.chunk_size):
+            chunk = tickers[i:i + self.chunk_size]
+            fetched = self._fetch_real_data_bulk(chunk, target_date)
+            
+            for ticker in chunk:
+                bars = fetched.get(ticker)
+                if not bars:
+                    logger.warning(f"Yahoo API failed for {ticker}. Switching to SIMULATION MODE.")
+                    FETCH_TICKERS.inc(provider='yahoo', outcome='synthetic')
+                    bars = self._generate_synthetic_data(ticker, target_date)
+                else:
+                    FETCH_TICKERS.inc(provider='yahoo', outcome='success')
+                results[ticker] = bars
+                if sources is not None:
+                    sources[ticker] = 'yahoo' if fetched.get(ticker) else 'synthetic'
+        
+        return results
+
+    def get_intraday_bars_range(self, tickers: List[str], start_date: date, end_date: date,
+                                sources: Dict[str, str] = None) -> Dict[str, Dict[date, List[Dict]]]:
+        """
+        Fetch each ticker's bars for the whole [start_date, end_date] window,
+        one Yahoo request per chunk, split by trading day. Tickers missing
+        from the response get synthetic bars for every trading day.
+        """
+        results = {}
+        for i in range(0, len(tickers), self.chunk_size):
+            chunk = tickers[i:i + self.chunk_size]
+            fetched = self._fetch_real_data_range(chunk, start_date, end_date)
+            
+            for ticker in chunk:
+                days = fetched.get(ticker)
+                if not days:
+                    logger.warning(f"Yahoo API failed for {ticker}. Switching to SIMULATION MODE.")
+                    FETCH_TICKERS.inc(provider='yahoo', outcome='synthetic')
+                    days = {
+                        d: self._generate_synthetic_data(ticker, d)
+                        for d in trading_days(start_date, end_date)
+                    }
+                else:
+                    FETCH_TICKERS.inc(provider='yahoo', outcome='success')
+                results[ticker] = days
+                if sources is not None:
+                    sources[ticker] = 'yahoo' if fetched.get(ticker) else 'synthetic'
+        
+        return results
+
+    @staticmethod
+    def _cache_key(ticker: str, start_date: date, end_date: date) -> Tuple[str, str, str, str]:
+        return (ticker, '1h', start_date.isoformat(), end_date.isoformat())
+
+    def _from_cache(self, tickers: List[str], start_date: date,
+                    end_date: date) -> Tuple[Dict[str, pd.DataFrame], List[str]]:
+        """
+        Split tickers into ({ticker: cached frame}, tickers to fetch).
+        Tickers with a negative entry are in neither: the provider is known
+        to have nothing for them.
+        """
+        if self.cache is None:
+            return {}, list(tickers)
+        found = self.cache.get_many(self._cache_key(t, start_date, end_date) for t in tickers)
+        frames = {}
+        misses = []
+        for ticker in tickers:
+            payload = found.get(self._cache_key(ticker, start_date, end_date))
+            if payload is None:
+                misses.append(ticker)
+                FETCH_CACHE.inc(outcome='miss')
+            elif payload is NEGATIVE:
+                FETCH_CACHE.inc(outcome='negative')
+            else:
+                frames[ticker] = _decode_frame(payload)
+                FETCH_CACHE.inc(outcome='hit')
+        return frames, misses
+
+    def _to_cache(self, fetched: Dict[str, Optional[pd.DataFrame]], start_date: date, end_date: date):
+        """Remember what the provider returned for each ticker (None: nothing)"""
+        if self.cache is None:
+            return
+        # Bars for a day still trading (or not yet traded) will change
+        ttl = self.live_ttl if end_date >= date.today() else None
+        self.cache.put_many({
+            self._cache_key(ticker, start_date, end_date):
+                _encode_frame(df) if df is not None and not df.empty else None
+            for ticker, df in fetched.items()
+        }, ttl)
+
     def _fetch_real_data(self, ticker: str, target_date: date) -> List[Dict]:
         """Try to fetch real 1-hour bars from Yahoo."""
+        frames, misses = self._from_cache([ticker], target_date, target_date)
+        if not misses:
+            df = frames.get(ticker)
+            return self._frame_to_bars(df, target_date) if df is not None else []
+        
         try:
-            # Sleep to be nice to API
-            time.sleep(1.0)
-            
             # Define window: Start of target date to End of target date
             start = datetime.combine(target_date, datetime.min.time())
             end = start + timedelta(days=1)
@@ -42,61 +210,158 @@ class YahooFinanceClient:
             stock = yf.Ticker(ticker)
             
             # Attempt 1h fetch
-            df = stock.history(start=start, end=end, interval="1h", auto_adjust=True)
-            
-            if df.empty:
+            df = self._request(
+                lambda: stock.history(start=start, end=end, interval="1h", auto_adjust=True),
+                ticker
+            )
+            # An empty answer is how a rate-limited Yahoo looks: not a negative
+            if df is None or df.empty:
                 return []
+            self._to_cache({ticker: df}, target_date, target_date)
             
-            bars = []
-            for idx, row in df.iterrows():
-                bar_date = idx.to_pydatetime()
-                if bar_date.date() == target_date:
-                    bars.append({
-                        'timestamp': bar_date,
-                        'open': float(row['Open']),
-                        'high': float(row['High']),
-                        'low': float(row['Low']),
-                        'close': float(row['Close'])
-                    })
-            return bars
+            return self._frame_to_bars(df, target_date)
             
         except Exception as e:
             logger.error(f"Real data fetch failed: {e}")
             return []
 
-    def _generate_synthetic_data(self, ticker: str, target_date: date) -> List[Dict]:
-        """Generates realistic-looking intraday price action."""
-        logger.info(f"Generating synthetic data for {ticker} on {target_date}")
+    def _fetch_real_data_bulk(self, tickers: List[str], target_date: date) -> Dict[str, List[Dict]]:
+        """Try to fetch real 1-hour bars for a chunk of tickers in a single request."""
+        by_day = self._fetch_real_data_range(tickers, target_date, target_date)
+        return {
+            ticker: days[target_date]
+            for ticker, days in by_day.items()
+            if days.get(target_date)
+        }
+
+    def _fetch_real_data_range(self, tickers: List[str], start_date: date,
+                               end_date: date) -> Dict[str, Dict[date, List[Dict]]]:
+        """fetch_range, logging a failed or empty request instead of raising"""
+        try:
+            return self.fetch_range(tickers, start_date, end_date)
+        except ProviderError as e:
+            logger.error(f"Bulk data fetch failed for {len(tickers)} tickers: {e}")
+            return e.served
+
+    def fetch_range(self, tickers: List[str], start_date: date,
+                    end_date: date) -> Dict[str, Dict[date, List[Dict]]]:
+        """
+        Fetch real 1-hour bars for a chunk of tickers over [start_date,
+        end_date] in a single request, split by trading day. Only tickers
+        the fetch cache knows nothing about go to Yahoo.
         
-        # Seed random for consistent "fake" charts per ticker
-        random.seed(ticker)
+        Raises ProviderError if the request fails, or if it was made and
+        nothing at all came back (how a blocked client usually looks); the
+        error carries whatever the cache did serve.
+        """
+        frames, misses = self._from_cache(tickers, start_date, end_date)
+        error = None
         
-        # Base price roughly based on ticker length to vary it (Arbitrary)
-        price = 100.0 + (len(ticker) * 20) + random.randint(-10, 10)
+        if misses:
+            try:
+                start = datetime.combine(start_date, datetime.min.time())
+                end = datetime.combine(end_date, datetime.min.time()) + timedelta(days=1)
+                
+                df = self._request(
+                    lambda: yf.download(
+                        misses, start=start, end=end, interval="1h",
+                        auto_adjust=True, group_by="ticker", progress=False, threads=False
+                    ),
+                    f"{len(misses)} tickers"
+                )
+                
+                fetched = {}
+                # An empty answer is how a rate-limited Yahoo looks, so it
+                # says nothing about the tickers and nothing is cached
+                for ticker in misses if df is not None and not df.empty else []:
+                    if isinstance(df.columns, pd.MultiIndex):
+                        sub = df[ticker] if ticker in df.columns.get_level_values(0) else None
+                    else:
+                        # Single-ticker downloads come back with flat columns
+                        sub = df
+                    if sub is not None:
+                        # Tickers that traded fewer bars are padded with NaN rows
+                        sub = sub.dropna(subset=['Open', 'High', 'Low', 'Close'])
+                        frames[ticker] = sub
+                    fetched[ticker] = sub
+                
+                # The provider answered: tickers missing from a non-empty
+                # response are remembered as negatives too
+                self._to_cache(fetched, start_date, end_date)
+                
+            except Exception as e:
+                error = str(e)
         
-        bars = []
-        # Create 7 hourly bars (9:30 AM to 3:30 PM)
-        start_time = datetime.combine(target_date, datetime.strptime("09:30", "%H:%M").time())
+        results = {}
+        for ticker, sub in frames.items():
+            days = self._frame_to_bars_by_day(sub)
+            if days:
+                results[ticker] = days
         
-        for i in range(7):
-            timestamp = start_time + timedelta(hours=i)
-            
-            # Random walk
-            change = random.uniform(-0.02, 0.02) # +/- 2% moves
-            open_p = price
-            close_p = price * (1 + change)
-            high_p = max(open_p, close_p) * (1 + random.uniform(0, 0.005))
-            low_p = min(open_p, close_p) * (1 - random.uniform(0, 0.005))
-            
-            bars.append({
-                'timestamp': timestamp,
-                'open': round(open_p, 2),
-                'high': round(high_p, 2),
-                'low': round(low_p, 2),
-                'close': round(close_p, 2)
-            })
-            
-            # Update price for next bar
-            price = close_p
-            
-        return bars
+        if error is None and misses and not results:
+            error = f"no data for any of {len(misses)} tickers"
+        if error is not None:
+            raise ProviderError(error, results)
+        return results
+
+    def _request(self, fn, label: str):
+        """
+        Run one provider call under the shared rate limit, retrying
+        failures with jittered exponential backoff.
+        """
+        for attempt in range(self.max_retries + 1):
+            LIMITER_WAIT.inc(self.limiter.acquire(), provider='yahoo')
+            try:
+                result = fn()
+                FETCH_REQUESTS.inc(provider='yahoo', outcome='success')
+                return result
+            except Exception as e:
+                if attempt == self.max_retries:
+                    FETCH_REQUESTS.inc(provider='yahoo', outcome='failure')
+                    raise
+                FETCH_REQUESTS.inc(provider='yahoo', outcome='retry')
+                delay = backoff_delay(attempt, self.backoff_base)
+                logger.warning(f"Fetch for {label} failed ({e}), "
+                               f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    @staticmethod
+    def _frame_to_bars_by_day(df: pd.DataFrame) -> Dict[date, List[Dict]]:
+        """
+        Convert a Yahoo OHLC frame into bar dicts grouped by trading day.
+        Timestamps come out UTC-aware whatever the frame's timezone (a
+        naive index is taken as exchange time), so bars from every provider
+        compare and store alike; days are the exchange's.
+        """
+        days = {}
+        has_volume = 'Volume' in df.columns
+        index = df.index
+        if index.tz is None:
+            index = index.tz_localize(EXCHANGE_TZ)
+        trading_dates = index.tz_convert(EXCHANGE_TZ).date
+        stamps = index.tz_convert('UTC').to_pydatetime()
+        for bar_date, day, (_, row) in zip(stamps, trading_dates, df.iterrows()):
+            bar = {
+                'timestamp': bar_date,
+                'open': float(row['Open']),
+                'high': float(row['High']),
+                'low': float(row['Low']),
+                'close': float(row['Close'])
+            }
+            if has_volume and pd.notna(row['Volume']):
+                bar['volume'] = int(row['Volume'])
+            days.setdefault(day, []).append(bar)
+        return days
+
+    @classmethod
+    def _frame_to_bars(cls, df: pd.DataFrame, target_date: date) -> List[Dict]:
+        """Convert a Yahoo OHLC frame into bar dicts for the target date."""
+        return cls._frame_to_bars_by_day(df).get(target_date, [])
+
+    def _generate_synthetic_data(self, ticker: str, target_date: date) -> List[Dict]:
+        """Generates realistic-looking intraday price action."""
+        logger.info(f"Generating synthetic data for {ticker} on {target_date}")
+        # Seeded per (ticker, date): the same day always gets the same chart,
+        # different days differ, and global random state is left alone
+        return self.simulator.bars(ticker, target_date)
+
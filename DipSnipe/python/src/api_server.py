@@ -1,18 +1,37 @@
 """Flask API server for DipHunter - Improved Version"""
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
+from werkzeug.exceptions import NotFound
+import gzip
+import hashlib
+import io
+import json
 import logging
 import sys
+import threading
+import time
 from pathlib import Path
 from datetime import date, datetime
 
 sys.path.insert(0, str(Path(__file__).parent))
 
 from config_loader import load_config
-from database import Database
+from database import Database, ReadPool
+from response_cache import ResponseCache
+from telemetry import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is always available
+    brotli = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional: only needed for /api/metrics?format=arrow
+    pa = None
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Next-Cursor"])
 
 logging.basicConfig(
     level=logging.INFO,
@@ -20,20 +39,301 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-db = None
+db = None          # writer connection: schema setup only
+read_pool = None   # query-only connections, one checked out per request
+_init_lock = threading.Lock()
+response_cache = None
+compress_min_bytes = None
+
+REQUESTS = REGISTRY.counter(
+    'dipsnipe_http_requests_total', 'HTTP requests served', ('route', 'method', 'status'))
+REQUEST_SECONDS = REGISTRY.histogram(
+    'dipsnipe_http_request_duration_seconds', 'Time to build each HTTP response', ('route', 'method'))
+QUERY_SECONDS = REGISTRY.histogram(
+    'dipsnipe_db_query_duration_seconds', 'Time spent in Database reads', ('query',))
+QUERY_ROWS = REGISTRY.counter(
+    'dipsnipe_db_rows_returned_total', 'Rows returned by Database reads', ('query',))
+for _stat in ('hits', 'misses', 'invalidations'):
+    REGISTRY.callback(
+        f'dipsnipe_response_cache_{_stat}_total', f'Response cache {_stat}',
+        lambda stat=_stat: get_response_cache().stats()[stat], kind='counter')
+REGISTRY.callback('dipsnipe_response_cache_bytes', 'Bytes held by the response cache',
+                  lambda: get_response_cache().stats()['bytes'])
 
 def get_db():
-    global db
-    if db is None:
-        try:
-            config = load_config()
-            db = Database(config['database'])
-            db.connect()
-            logger.info("Database connected successfully")
-        except Exception as e:
-            logger.error(f"Failed to connect to database: {e}")
-            raise
-    return db
+    """The read-only Database checked out for the current request"""
+    read_db = g.get('read_db')
+    if read_db is None:
+        read_db = g.read_db = _get_read_pool().acquire()
+    return read_db
+
+def _get_read_pool():
+    global db, read_pool
+    with _init_lock:
+        if read_pool is None:
+            try:
+                config = load_config()
+                if db is None:
+                    db = Database(config['database'])
+                    db.connect()
+                read_pool = ReadPool(config['database'])
+                logger.info("Database connected successfully")
+            except Exception as e:
+                logger.error(f"Failed to connect to database: {e}")
+                raise
+    return read_pool
+
+def _hand_off_db(response):
+    """
+    Keep the request's connection checked out until a streamed body has
+    been sent: the body is generated after the request has torn down.
+    """
+    read_db = g.pop('read_db', None)
+    if read_db is not None:
+        response.call_on_close(lambda: read_pool.release(read_db))
+    return response
+
+def get_response_cache():
+    global response_cache
+    if response_cache is None:
+        config = load_config()
+        cache_mb = config.get('api', {}).get('response_cache_mb', 32)
+        response_cache = ResponseCache(max_bytes=int(cache_mb * 1024 * 1024))
+    return response_cache
+
+def get_compress_min_bytes():
+    global compress_min_bytes
+    if compress_min_bytes is None:
+        config = load_config()
+        compress_min_bytes = config.get('api', {}).get('compress_min_bytes', 1024)
+    return compress_min_bytes
+
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+@app.teardown_request
+def _release_db(error):
+    read_db = g.pop('read_db', None)
+    if read_db is not None:
+        read_pool.release(read_db)
+
+@app.after_request
+def _record_request(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    start = g.get('request_start')
+    if start is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, route=route, method=request.method)
+    return response
+
+def _query(name, fn, *args, **kwargs):
+    """Run one Database read, recording its latency and the rows it returned"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    QUERY_SECONDS.observe(time.perf_counter() - start, query=name)
+    QUERY_ROWS.inc(len(result) if isinstance(result, list) else int(result is not None), query=name)
+    return result
+
+def _counted_chunks(name, chunks):
+    """Pass fetchmany chunks through, recording cursor time and rows as they stream"""
+    chunks = iter(chunks)
+    while True:
+        start = time.perf_counter()
+        rows = next(chunks, None)
+        QUERY_SECONDS.observe(time.perf_counter() - start, query=name)
+        if rows is None:
+            return
+        QUERY_ROWS.inc(len(rows), query=name)
+        yield rows
+
+def _negotiate_encoding():
+    """Best content coding the client accepts: br (if available), gzip or None"""
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(offered)
+
+def _encode(body: bytes, encoding):
+    if encoding == 'br':
+        return brotli.compress(body)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+def _etag(key, generation, encoding=None) -> str:
+    """Strong ETag for one representation of request.path + key at a data generation"""
+    digest = hashlib.sha1(repr((request.path, key, generation)).encode()).hexdigest()
+    return f"{digest}-{encoding}" if encoding else digest
+
+def _not_modified(key, generation, encoding=None):
+    """304 response if If-None-Match holds a current tag for key, else None"""
+    # The client may hold the identity or the encoded variant's tag
+    for tag in (_etag(key, generation, encoding), _etag(key, generation)):
+        if request.if_none_match.contains(tag):
+            response = Response(status=304)
+            response.set_etag(tag)
+            response.vary.add('Accept-Encoding')
+            return response
+    return None
+
+def _conditional_json(key, build):
+    """
+    Serve the JSON payload returned by build() with a strong ETag derived
+    from the data generation and the normalized query parameters in `key`.
+
+    A matching If-None-Match gets 304 Not Modified without touching the
+    data. Otherwise the body comes from the response cache, or build() is
+    called and the result stored there. Bodies of at least
+    api.compress_min_bytes are sent gzip- or brotli-encoded when the client
+    accepts it; each encoding carries its own ETag.
+    """
+    generation = get_db().get_data_generation()
+    encoding = _negotiate_encoding()
+    
+    not_modified = _not_modified(key, generation, encoding)
+    if not_modified is not None:
+        return not_modified
+    
+    cache = get_response_cache()
+    body = cache.get((request.path, key, None), generation)
+    if body is None:
+        body = jsonify(build()).get_data()
+        cache.put((request.path, key, None), generation, body)
+    
+    # Small bodies go out as-is whatever the client accepts
+    if encoding and len(body) < get_compress_min_bytes():
+        encoding = None
+    if encoding:
+        encoded = cache.get((request.path, key, encoding), generation)
+        if encoded is None:
+            encoded = _encode(body, encoding)
+            cache.put((request.path, key, encoding), generation, encoded)
+        body = encoded
+    
+    response = Response(body, mimetype='application/json')
+    if encoding:
+        response.content_encoding = encoding
+    response.set_etag(_etag(key, generation, encoding))
+    response.vary.add('Accept-Encoding')
+    return response
+
+def _metric_record(m) -> dict:
+    """One /api/metrics row as served to clients"""
+    return {
+        'ticker': m['ticker'],
+        'sector': m['sector'],
+        'industry': m['industry'],
+        'market_cap': m['market_cap'],
+        'avg_volume': m['avg_volume'],
+        'max_drawdown_pct': float(m['max_drawdown_pct']),
+        'drawdown_time': m['drawdown_time'],
+        'recovery_pct': float(m['recovery_pct']),
+        'data_source': m['data_source'],
+        'cum_return_pct': m['cum_return_pct'],
+        'down_streak': m['down_streak'],
+        'return_zscore': m['return_zscore'],
+        'universe_rank': m['universe_rank'],
+        'universe_pct': m['universe_pct'],
+        'sector_rank': m['sector_rank'],
+        'sector_pct': m['sector_pct'],
+        'industry_rank': m['industry_rank'],
+        'industry_pct': m['industry_pct']
+    }
+
+# Sorts whose keys are whole numbers; the rest are REAL columns
+_INTEGER_SORTS = {'volume', 'market_cap', 'down_streak'}
+
+def _parse_after(raw, sort):
+    """Keyset cursor 'sort_key,ticker' from a previous page -> (sort_key, ticker)"""
+    value, ticker = raw.split(',', 1)
+    return (int(value) if sort in _INTEGER_SORTS else float(value)), ticker
+
+def _next_cursor(rows, limit):
+    """Cursor for the page after `rows`, or None if this was the last page"""
+    if not limit or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return f"{last['sort_key']!r},{last['ticker']}"
+
+def _ndjson_body(chunks):
+    """One JSON object per line, encoded chunk by chunk as rows come off the cursor"""
+    for rows in chunks:
+        yield ''.join(json.dumps(_metric_record(m)) + '\n' for m in rows).encode()
+
+def _arrow_body(chunks):
+    """Arrow IPC stream: the schema, then one record batch per chunk of rows"""
+    schema = pa.schema([
+        ('ticker', pa.string()),
+        ('sector', pa.string()),
+        ('industry', pa.string()),
+        ('market_cap', pa.int64()),
+        ('avg_volume', pa.int64()),
+        ('max_drawdown_pct', pa.float64()),
+        ('drawdown_time', pa.string()),
+        ('recovery_pct', pa.float64()),
+        ('data_source', pa.string()),
+        ('cum_return_pct', pa.float64()),
+        ('down_streak', pa.int64()),
+        ('return_zscore', pa.float64()),
+        ('universe_rank', pa.int64()),
+        ('universe_pct', pa.float64()),
+        ('sector_rank', pa.int64()),
+        ('sector_pct', pa.float64()),
+        ('industry_rank', pa.int64()),
+        ('industry_pct', pa.float64())
+    ])
+    sink = io.BytesIO()
+    
+    def drain():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+    
+    with pa.ipc.new_stream(sink, schema) as writer:
+        yield drain()
+        for rows in chunks:
+            columns = {name: [m[name] for m in rows] for name in schema.names}
+            writer.write_batch(pa.RecordBatch.from_pydict(columns, schema=schema))
+            yield drain()
+    yield drain()
+
+_STREAM_FORMATS = {
+    'ndjson': ('application/x-ndjson', _ndjson_body),
+    'arrow': ('application/vnd.apache.arrow.stream', _arrow_body),
+}
+
+def _stream_metrics(fmt, key, target_date, filters):
+    """
+    Stream /api/metrics rows straight from the SQLite cursor as NDJSON or an
+    Arrow IPC stream. Nothing is cached or compressed, but the response
+    carries the same kind of ETag and honours If-None-Match.
+    
+    A page requested with `limit` is read before the body starts so its
+    cursor can go in an X-Next-Cursor header (absent on the last page);
+    it holds at most `limit` rows. Unlimited requests stream as they come.
+    """
+    if fmt == 'arrow' and pa is None:
+        return jsonify({'error': 'format=arrow requires pyarrow on the server'}), 501
+    
+    db = get_db()
+    key = key + (fmt,)
+    generation = db.get_data_generation()
+    not_modified = _not_modified(key, generation)
+    if not_modified is not None:
+        return not_modified
+    
+    logger.debug(f"Streaming metrics for {target_date} as {fmt}")
+    mimetype, body = _STREAM_FORMATS[fmt]
+    chunks = _counted_chunks('iter_metrics', db.iter_metrics(target_date, **filters))
+    next_cursor = None
+    if filters['limit']:
+        chunks = list(chunks)
+        next_cursor = _next_cursor([row for rows in chunks for row in rows], filters['limit'])
+    response = Response(body(chunks), mimetype=mimetype)
+    response.set_etag(_etag(key, generation))
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return _hand_off_db(response)
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -55,9 +355,12 @@ def health_check():
 def get_sectors():
     """Get list of all sectors"""
     try:
-        sectors = get_db().get_sectors()
-        logger.info(f"Returning {len(sectors)} sectors")
-        return jsonify({'sectors': sectors})
+        def build():
+            sectors = _query('get_sectors', get_db().get_sectors)
+            logger.debug(f"Returning {len(sectors)} sectors")
+            return {'sectors': sectors}
+        
+        return _conditional_json((), build)
     except Exception as e:
         logger.error(f"Error fetching sectors: {e}")
         return jsonify({'error': str(e)}), 500
@@ -67,9 +370,13 @@ def get_industries():
     """Get list of industries, optionally filtered by sector"""
     try:
         sector = request.args.get('sector', '')
-        industries = get_db().get_industries(sector if sector else None)
-        logger.info(f"Returning {len(industries)} industries")
-        return jsonify({'industries': industries})
+        
+        def build():
+            industries = _query('get_industries', get_db().get_industries, sector if sector else None)
+            logger.debug(f"Returning {len(industries)} industries")
+            return {'industries': industries}
+        
+        return _conditional_json((sector,), build)
     except Exception as e:
         logger.error(f"Error fetching industries: {e}")
         return jsonify({'error': str(e)}), 500
@@ -91,36 +398,79 @@ def get_metrics():
         min_vol = int(request.args.get('min_volume', 0))
         sector = request.args.get('sector', '')
         industry = request.args.get('industry', '')
+        fmt = request.args.get('format', 'json')
+        if fmt != 'json' and fmt not in _STREAM_FORMATS:
+            return jsonify({'error': f'Unknown format: {fmt}'}), 400
+        
+        # Leaderboard: server-side sort, top-N and keyset pagination
+        sort = request.args.get('sort', 'return')
+        if sort not in Database.METRIC_SORTS:
+            return jsonify({'error': f'Unknown sort: {sort}'}), 400
+        order = request.args.get('order', '')
+        if order not in ('', 'asc', 'desc'):
+            return jsonify({'error': f'Unknown order: {order}'}), 400
+        limit = int(request.args.get('limit', 0))
+        if limit < 0:
+            raise ValueError("limit must not be negative")
+        losers_only = request.args.get('losers_only', '').lower() in ('1', 'true', 'yes')
+        
+        # Rolling multi-day filters (see rolling.py)
+        max_cum_return = request.args.get('max_cum_return', '')
+        max_cum_return = float(max_cum_return) if max_cum_return else None
+        min_down_streak = int(request.args.get('min_down_streak', 0))
+        max_zscore = request.args.get('max_zscore', '')
+        max_zscore = float(max_zscore) if max_zscore else None
         
-        logger.info(f"Fetching metrics for {target_date} with filters: "
-                   f"cap={min_cap}-{max_cap}, vol={min_vol}, "
-                   f"sector={sector}, industry={industry}")
-        
-        # Query database
-        raw_metrics = get_db().get_metrics(
-            target_date=target_date,
-            min_market_cap=min_cap,
-            max_market_cap=max_cap,
-            min_volume=min_vol,
-            sector=sector if sector else None,
-            industry=industry if industry else None
-        )
-        
-        results = []
-        for m in raw_metrics:
-            results.append({
-                'ticker': m['ticker'],
-                'sector': m['sector'],
-                'industry': m['industry'],
-                'market_cap': m['market_cap'],
-                'max_drawdown_pct': float(m['max_drawdown_pct']),
-                'drawdown_time': m['drawdown_time'],
-                'recovery_pct': float(m['recovery_pct']),
-                'data_source': m['data_source']
-            })
-        
-        logger.info(f"Returning {len(results)} metrics")
-        return jsonify({'metrics': results})
+        # Worst-first percentile ceilings, e.g. max_sector_pct=10 for each
+        # sector's bottom decile (see ranks.py)
+        pct_filters = {}
+        for name in ('max_universe_pct', 'max_sector_pct', 'max_industry_pct'):
+            value = request.args.get(name, '')
+            pct_filters[name] = float(value) if value else None
+        after_str = request.args.get('after', '')
+        after = _parse_after(after_str, sort) if after_str else None
+        
+        filters = {
+            'min_market_cap': min_cap,
+            'max_market_cap': max_cap,
+            'min_volume': min_vol,
+            'sector': sector if sector else None,
+            'industry': industry if industry else None,
+            'losers_only': losers_only,
+            'max_cum_return': max_cum_return,
+            'min_down_streak': min_down_streak,
+            'max_zscore': max_zscore,
+            **pct_filters,
+            'sort': sort,
+            'descending': {'asc': False, 'desc': True}.get(order),
+            'after': after,
+            'limit': limit or None
+        }
+        cache_key = (target_date.isoformat(), min_cap, max_cap, min_vol, sector, industry,
+                     losers_only, max_cum_return, min_down_streak, max_zscore,
+                     *pct_filters.values(), sort, order, after, limit)
+        
+        if fmt != 'json':
+            return _stream_metrics(fmt, cache_key, target_date, filters)
+        
+        def build():
+            logger.debug(f"Fetching metrics for {target_date} with filters: "
+                       f"cap={min_cap}-{max_cap}, vol={min_vol}, "
+                       f"sector={sector}, industry={industry}, "
+                       f"sort={sort} {order}, limit={limit}, after={after}")
+            
+            # Query database
+            raw_metrics = _query('get_metrics', get_db().get_metrics, target_date=target_date, **filters)
+            results = [_metric_record(m) for m in raw_metrics]
+            
+            logger.debug(f"Returning {len(results)} metrics")
+            payload = {'metrics': results}
+            if limit:
+                payload['next_cursor'] = _next_cursor(raw_metrics, limit)
+            return payload
+        
+        # Serve repeat queries from cache (or 304) until the data changes
+        return _conditional_json(cache_key, build)
         
     except ValueError as e:
         logger.error(f"Invalid parameter: {e}")
@@ -140,35 +490,73 @@ def get_bars():
             return jsonify({'error': 'Ticker and date required'}), 400
         
         target_date = date.fromisoformat(date_str)
-        bars = get_db().get_intraday_bars(ticker, target_date)
         
-        results = []
-        for bar in bars:
-            results.append({
-                'timestamp': bar['timestamp'].isoformat(),
-                'open': float(bar['open']),
-                'high': float(bar['high']),
-                'low': float(bar['low']),
-                'close': float(bar['close'])
-            })
+        def build():
+            bars = _query('get_intraday_bars', get_db().get_intraday_bars, ticker, target_date)
+            
+            results = []
+            for bar in bars:
+                results.append({
+                    'timestamp': bar['timestamp'].isoformat(),
+                    'open': float(bar['open']),
+                    'high': float(bar['high']),
+                    'low': float(bar['low']),
+                    'close': float(bar['close'])
+                })
+            
+            logger.debug(f"Returning {len(results)} bars for {ticker}")
+            return {'bars': results}
         
-        logger.info(f"Returning {len(results)} bars for {ticker}")
-        return jsonify({'bars': results})
+        return _conditional_json((ticker, target_date.isoformat()), build)
         
     except Exception as e:
         logger.error(f"Error fetching bars: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/snapshot', methods=['GET'])
+def get_snapshot():
+    """Get the materialized daily snapshot, with sector and industry breakdowns"""
+    try:
+        date_str = request.args.get('date')
+        if not date_str:
+            return jsonify({'error': 'Date parameter required'}), 400
+        
+        target_date = date.fromisoformat(date_str)
+        
+        def build():
+            snapshot = _query('get_daily_snapshot', get_db().get_daily_snapshot, target_date)
+            if snapshot is None:
+                raise NotFound(f"No snapshot for {target_date.isoformat()}")
+            return {'snapshot': snapshot}
+        
+        return _conditional_json((target_date.isoformat(),), build)
+        
+    except NotFound as e:
+        return jsonify({'error': e.description}), 404
+    except ValueError as e:
+        logger.error(f"Invalid parameter: {e}")
+        return jsonify({'error': f'Invalid parameter: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Error fetching snapshot: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """Get database statistics"""
     try:
         stats = get_db().get_stats()
+        stats['response_cache'] = get_response_cache().stats()
+        stats['read_connections'] = read_pool.size()
         return jsonify(stats)
     except Exception as e:
         logger.error(f"Error fetching stats: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Counters and histograms in the Prometheus text exposition format"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Endpoint not found'}), 404
@@ -185,6 +573,8 @@ if __name__ == '__main__':
     logger.info("  GET /api/industries")
     logger.info("  GET /api/metrics")
     logger.info("  GET /api/intraday_bars")
+    logger.info("  GET /api/snapshot")
     logger.info("  GET /api/stats")
+    logger.info("  GET /metrics")
     
-    app.run(host='0.0.0.0', port=8080, debug=True)
+    app.run(host='0.0.0.0', port=8080, debug=True, threaded=True)
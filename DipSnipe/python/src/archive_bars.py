@@ -0,0 +1,68 @@
+"""Compact closed trading days out of intraday_bars into the columnar archive"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+from datetime import date, timedelta
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from config_loader import load_config
+from database import Database
+from trading_calendar import trading_days
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def archive_closed_days(db: Database, before: date) -> int:
+    """Archive every day before `before` that still has bars in SQLite; returns bars moved"""
+    days = [d for d in db.get_bar_dates() if d < before]
+    logger.info(f"Archiving {len(days)} closed trading days before {before}")
+    
+    moved = 0
+    for day in days:
+        moved += db.archive_bars(day)
+    
+    logger.info(f"Completed: {moved} bars moved to {db.archive.root}")
+    return moved
+
+def default_before(today: date, keep_days: int) -> date:
+    """
+    First of the keep_days most recent trading days up to today: those stay
+    in intraday_bars, where single-ticker reads (the dashboard's) are
+    cheapest, and everything older is archived
+    """
+    if keep_days <= 0:
+        return today
+    recent = trading_days(today - timedelta(days=2 * keep_days + 10), today)
+    return recent[-keep_days] if len(recent) >= keep_days else recent[0]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--before', help="archive days strictly before this date "
+                                         "(default: keep database.archive_keep_days trading days)")
+    args = parser.parse_args()
+    
+    config = load_config()
+    try:
+        if args.before:
+            before = date.fromisoformat(args.before)
+        else:
+            before = default_before(date.today(), config['database'].get('archive_keep_days', 20))
+    except ValueError:
+        print("Error: Date must be in YYYY-MM-DD format")
+        sys.exit(1)
+    
+    db = Database(config['database'])
+    if db.archive is None:
+        print("Error: set database.archive_dir in config.yaml to enable the archive")
+        sys.exit(1)
+    
+    try:
+        db.connect()
+        archive_closed_days(db, before)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""Columnar, memory-mapped archive of intraday bars for closed trading days"""
+import logging
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# utc_offset value for bars whose timestamp carried no timezone
+_NAIVE = np.iinfo(np.int64).min
+# volume value for bars saved without one
+_NO_VOLUME = -1
+
+# bars.bin: magic, then int64 ticker count, row count and ticker width
+# (characters), then the sections below, each 8-byte aligned
+_MAGIC = b'DSBARS01'
+_HEADER = struct.Struct('<8sqqq')
+_DAY_FILE = "bars.bin"
+
+DayColumns = Tuple[np.ndarray, Dict[str, np.ndarray], np.ndarray]
+
+
+def _aligned(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def merge_bars(archived: List[Dict], late: List[Dict]) -> List[Dict]:
+    """
+    One ticker-day's archived bars plus rows written to intraday_bars after
+    the day was archived, in time order. Like INSERT OR IGNORE on the table,
+    a timestamp already archived keeps its archived bar.
+    """
+    if not late:
+        return archived
+    merged = {bar['timestamp'].isoformat(): bar for bar in late}
+    merged.update((bar['timestamp'].isoformat(), bar) for bar in archived)
+    return [merged[key] for key in sorted(merged)]
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_archive(root: str) -> 'BarArchive':
+    """
+    The process's BarArchive for root, so every Database on the same
+    archive (e.g. each pooled API read connection) shares its open mappings
+    """
+    key = os.path.abspath(root)
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = BarArchive(key)
+        return _shared[key]
+
+
+class BarArchive:
+    """
+    One file per trading day (root/date=YYYY-MM-DD/bars.bin) in the same
+    layout pack_bars produces: tickers are sorted, offsets[i] is where
+    tickers[i]'s bars start, and rows are sorted by ticker then time, stored
+    column after column (open/high/low/close as float64, then timestamp/
+    utc_offset/volume as int64). A day is mapped with a single mmap and
+    every column is a view into it: reads page in only what they touch.
+
+    Mappings stay open (up to max_open_days) and are checked against the
+    file's identity on every read, so a day rewritten by another process is
+    remapped instead of served stale. A day is replaced by renaming a new
+    file over it, so readers never see a half-written one.
+
+    Timestamps are stored as wall-clock datetime64[us] plus a utc_offset in
+    seconds, so reads return the same datetimes as the intraday_bars table
+    did.
+    """
+
+    def __init__(self, root: str, max_open_days: int = 64):
+        self.root = Path(root)
+        self._root = str(self.root)
+        self.max_open_days = max_open_days
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _day_dir(self, day: date) -> Path:
+        return self.root / f"date={day.isoformat()}"
+
+    def has_day(self, day: date) -> bool:
+        return self._find(day) is not None
+
+    def days(self, start: date = None, end: date = None) -> List[date]:
+        """
+        Days with a partition directory in [start, end] (default: all), in
+        order. A directory left without data reads as an empty day.
+        """
+        try:
+            names = os.listdir(self._root)
+        except FileNotFoundError:
+            return []
+        low = f"date={start.isoformat()}" if start else "date="
+        high = f"date={end.isoformat()}" if end else "date=~"
+        return [date.fromisoformat(name[len("date="):]) for name in sorted(names)
+                if low <= name <= high and '.' not in name]
+
+    def write_day(self, day: date, bars_by_ticker: Dict[str, List[Dict]]) -> int:
+        """
+        Write (or replace) one day's partition and return the number of bars.
+        The file is built under a scratch name and renamed into place.
+        """
+        tickers = sorted(t for t, bars in bars_by_ticker.items() if bars)
+        if not tickers:
+            return 0
+
+        rows = []
+        offsets = []
+        for ticker in tickers:
+            offsets.append(len(rows))
+            rows.extend(sorted(bars_by_ticker[ticker], key=lambda b: b['timestamp'].isoformat()))
+
+        wall = []
+        utc_offset = []
+        for bar in rows:
+            ts = bar['timestamp']
+            wall.append(ts.replace(tzinfo=None))
+            off = ts.utcoffset()
+            utc_offset.append(int(off.total_seconds()) if off is not None else int(_NAIVE))
+
+        width = max(len(t) for t in tickers)
+        names = np.array(tickers, dtype=f'<U{width}')
+        prices = np.array([
+            [b['open'] for b in rows],
+            [b['high'] for b in rows],
+            [b['low'] for b in rows],
+            [b['close'] for b in rows],
+        ], dtype='<f8')
+        ints = np.stack([
+            np.array(wall, dtype='datetime64[us]').view(np.int64),
+            np.array(utc_offset, dtype=np.int64),
+            np.array([b['volume'] if b.get('volume') is not None else _NO_VOLUME for b in rows],
+                     dtype=np.int64),
+        ]).astype('<i8')
+
+        final_dir = self._day_dir(day)
+        final_dir.mkdir(parents=True, exist_ok=True)
+        final = final_dir / _DAY_FILE
+        scratch = final_dir / f"{_DAY_FILE}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(scratch, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, len(tickers), len(rows), width))
+            for section in (names, np.array(offsets, dtype='<i8'), prices, ints):
+                data = section.tobytes()
+                f.write(data + b'\0' * (_aligned(len(data)) - len(data)))
+        os.replace(scratch, final)
+
+        with self._lock:
+            self._open.pop(day, None)
+        logger.debug(f"Archived {len(rows)} bars for {len(tickers)} tickers on {day}")
+        return len(rows)
+
+    @staticmethod
+    def _map_file(path: str):
+        with open(path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_tickers, n_rows, width = _HEADER.unpack_from(buf)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a bar archive file")
+        pos = _HEADER.size
+        tickers = np.frombuffer(buf, dtype=f'<U{width}', count=n_tickers, offset=pos)
+        pos += _aligned(4 * width * n_tickers)
+        offsets = np.frombuffer(buf, dtype='<i8', count=n_tickers, offset=pos)
+        pos += 8 * n_tickers
+        prices = np.frombuffer(buf, dtype='<f8', count=4 * n_rows, offset=pos).reshape(4, n_rows)
+        pos += 32 * n_rows
+        ints = np.frombuffer(buf, dtype='<i8', count=3 * n_rows, offset=pos).reshape(3, n_rows)
+        return tickers, prices, ints, offsets
+
+    def _find(self, day: date) -> Optional[Tuple[str, tuple]]:
+        """(path, identity) of day's data, or None if the day is not archived"""
+        # Plain strings: this runs on every read
+        path = os.path.join(self._root, f"date={day.isoformat()}", _DAY_FILE)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return path, (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def load_day(self, day: date) -> DayColumns:
+        """
+        Memory-map one day as (tickers, columns, offsets), ready for
+        metrics.compute_drawdown_metrics_batch. Raises FileNotFoundError if
+        the day is not archived.
+        """
+        loaded = self._load(day)
+        if loaded is None:
+            raise FileNotFoundError(f"{day} is not archived under {self.root}")
+        return loaded
+
+    def _load(self, day: date) -> Optional[DayColumns]:
+        found = self._find(day)
+        with self._lock:
+            cached = self._open.get(day)
+            if found is None:
+                self._open.pop(day, None)
+                return None
+            if cached is not None and cached[0] == found[1]:
+                self._open.move_to_end(day)
+                return cached[1]
+
+        path, identity = found
+        tickers, prices, ints, offsets = self._map_file(path)
+        # Every column is a row view into the mapped data
+        columns = {
+            'timestamp': ints[0].view('datetime64[us]'),
+            'utc_offset': ints[1],
+            'open': prices[0],
+            'high': prices[1],
+            'low': prices[2],
+            'close': prices[3],
+            'volume': ints[2],
+        }
+        loaded = (tickers, columns, offsets)
+
+        with self._lock:
+            self._open[day] = (identity, loaded)
+            self._open.move_to_end(day)
+            while len(self._open) > self.max_open_days:
+                self._open.popitem(last=False)
+        return loaded
+
+    def scan(self, start: date, end: date) -> Iterator[Tuple[date, np.ndarray, Dict[str, np.ndarray], np.ndarray]]:
+        """Yield (day, tickers, columns, offsets) for every archived day in [start, end], zero-copy"""
+        for day in self.days(start, end):
+            loaded = self._load(day)
+            if loaded is not None:
+                yield (day, *loaded)
+
+    @staticmethod
+    def _segment(tickers: np.ndarray, offsets: np.ndarray, n_rows: int, ticker: str) -> Tuple[int, int]:
+        """[start, end) row range of ticker's bars, or (0, 0) if it has none"""
+        i = int(np.searchsorted(tickers, ticker))
+        if i == len(tickers) or tickers[i] != ticker:
+            return 0, 0
+        end = int(offsets[i + 1]) if i + 1 < len(offsets) else n_rows
+        return int(offsets[i]), end
+
+    @staticmethod
+    def _bars(columns: Dict[str, np.ndarray], start: int, end: int) -> List[Dict]:
+        """Bar dicts for rows [start, end), shaped like Database.get_intraday_bars"""
+        wall = columns['timestamp'][start:end].tolist()
+        utc_offset = columns['utc_offset'][start:end].tolist()
+        opens = columns['open'][start:end].tolist()
+        highs = columns['high'][start:end].tolist()
+        lows = columns['low'][start:end].tolist()
+        closes = columns['close'][start:end].tolist()
+        volumes = columns['volume'][start:end].tolist()
+
+        bars = []
+        for i, ts in enumerate(wall):
+            if utc_offset[i] != _NAIVE:
+                ts = ts.replace(tzinfo=timezone(timedelta(seconds=utc_offset[i])))
+            bars.append({
+                'timestamp': ts,
+                'open': opens[i],
+                'high': highs[i],
+                'low': lows[i],
+                'close': closes[i],
+                'volume': volumes[i] if volumes[i] != _NO_VOLUME else None
+            })
+        return bars
+
+    def get_bars(self, ticker: str, day: date) -> List[Dict]:
+        """One ticker's archived bars for day, in time order; empty if the day or ticker isn't archived"""
+        loaded = self._load(day)
+        if loaded is None:
+            return []
+        tickers, columns, offsets = loaded
+        start, end = self._segment(tickers, offsets, len(columns['open']), ticker)
+        return self._bars(columns, start, end)
+
+    def get_bars_range(self, ticker: str, days: Iterable[date]) -> Dict[date, List[Dict]]:
+        """
+        One ticker's archived bars on each of days that has any, converted
+        to dicts in one pass over all days' slices
+        """
+        segments = []
+        for day in days:
+            loaded = self._load(day)
+            if loaded is None:
+                continue
+            tickers, columns, offsets = loaded
+            start, end = self._segment(tickers, offsets, len(columns['open']), ticker)
+            if end > start:
+                segments.append((day, columns, start, end))
+        if not segments:
+            return {}
+        joined = {name: np.concatenate([columns[name][start:end] for _, columns, start, end in segments])
+                  for name in segments[0][1]}
+        bars = self._bars(joined, 0, len(joined['open']))
+        by_day = {}
+        pos = 0
+        for day, _, start, end in segments:
+            by_day[day] = bars[pos:pos + end - start]
+            pos += end - start
+        return by_day
+
+    def get_bars_many(self, tickers: Iterable[str], day: date) -> Dict[str, List[Dict]]:
+        """Archived bars for day grouped by ticker; tickers without bars are absent"""
+        loaded = self._load(day)
+        if loaded is None:
+            return {}
+        names, columns, offsets = loaded
+        n_rows = len(columns['open'])
+        grouped = {}
+        for ticker in tickers:
+            start, end = self._segment(names, offsets, n_rows, ticker)
+            if end > start:
+                grouped[ticker] = self._bars(columns, start, end)
+        return grouped
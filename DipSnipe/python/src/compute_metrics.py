@@ -1,79 +1,417 @@
 """Main script for computing intraday metrics"""
+import argparse
 import logging
 import sys
 from pathlib import Path
 from datetime import date
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from config_loader import load_config
 from database import Database
-from api_clients import YahooFinanceClient
-from metrics import compute_drawdown_metrics
+from providers import client_from_config
+from ingest_workers import run_workers
+from metrics import compute_drawdown_metrics_many, fold_running_state, running_metrics
+from ranks import refresh_ranks
+from rolling import rebuild_rolling, update_rolling
+from telemetry import REGISTRY
+from trading_calendar import trading_days
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+STAGE_SECONDS = REGISTRY.counter(
+    'dipsnipe_pipeline_stage_seconds_total',
+    'Time spent in each ingestion stage (plan, fetch, compute, store, snapshot, ranks, rolling)', ('stage',))
+TICKERS = REGISTRY.counter(
+    'dipsnipe_pipeline_tickers_total',
+    'Tickers (ticker-days for backfills) by outcome: processed, skipped, failed', ('mode', 'outcome'))
+RUN_SECONDS = REGISTRY.gauge(
+    'dipsnipe_pipeline_last_run_duration_seconds', 'Wall time of the last ingestion run', ('mode',))
+LAST_RUN = REGISTRY.gauge(
+    'dipsnipe_pipeline_last_run_timestamp_seconds', 'Unix time the last ingestion run ended', ('mode',))
+LAST_SUCCESS = REGISTRY.gauge(
+    'dipsnipe_pipeline_last_run_success', '1 if the last ingestion run finished without an error', ('mode',))
+
+_DONE = object()
+
+def _timed(iterable, stage):
+    """Yield from iterable, charging the time spent waiting for each item to stage"""
+    items = iter(iterable)
+    while True:
+        with STAGE_SECONDS.time(stage=stage):
+            item = next(items, _DONE)
+        if item is _DONE:
+            return
+        yield item
+
+def _record_run(mode, stats, store_seconds, started):
+    """Export one run's outcome counts, write time and duration"""
+    for outcome in ('processed', 'skipped', 'failed'):
+        TICKERS.inc(stats[outcome], mode=mode, outcome=outcome)
+    STAGE_SECONDS.inc(store_seconds, stage='store')
+    RUN_SECONDS.set(time.monotonic() - started, mode=mode)
+    LAST_RUN.set(time.time(), mode=mode)
+
+def _compute_and_save_many(writer, bars_by_ticker, target_date, sources, stats):
+    """
+    Compute metrics for a batch of tickers in one vectorized pass and queue
+    the writes, recording each ticker's data source from `sources`
+    """
+    with STAGE_SECONDS.time(stage='compute'):
+        computed = compute_drawdown_metrics_many(bars_by_ticker)
+    
+    for ticker, bars in bars_by_ticker.items():
+        metrics = computed.get(ticker)
+        if metrics:
+            # Bars ride along so they are cached to save time later
+            writer.add(ticker, target_date, metrics, sources[ticker], bars)
+            stats['processed'] += 1
+            logger.info(f"Computed {ticker}: {metrics['max_drawdown_pct']}% DD")
+        else:
+            stats['failed'] += 1
+            logger.warning(f"No data for {ticker}")
+
+def _fetch_with_sources(fetch, chunk, *args):
+    sources = {}
+    return fetch(chunk, *args, sources=sources), sources
+
+def _fetch_chunks_concurrently(fetch, tickers, chunk_size, max_workers, *args):
+    """
+    Run fetch(chunk, *args) for every chunk of `tickers` on a thread pool,
+    yielding (result, {ticker: data source}) as each completes
+    """
+    chunks = [tickers[i:i + chunk_size] for i in range(0, len(tickers), chunk_size)]
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_fetch_with_sources, fetch, chunk, *args) for chunk in chunks]
+        for future in as_completed(futures):
+            yield future.result()
+
+def fetch_bars_concurrently(yahoo_client, tickers, target_date, max_workers=4):
+    """
+    Fetch bars for `tickers` with up to `max_workers` chunk requests in flight.
+    All workers share the client's token bucket, so the configured per-minute
+    budget holds no matter how many are running. Yields one ({ticker: bars},
+    {ticker: data source}) pair per chunk as soon as it completes.
+    """
+    return _fetch_chunks_concurrently(
+        yahoo_client.get_intraday_bars_bulk, tickers, yahoo_client.chunk_size,
+        max_workers, target_date
+    )
+
+def fetch_range_concurrently(yahoo_client, tickers, start_date, end_date, max_workers=4):
+    """Range counterpart of fetch_bars_concurrently, yielding ({ticker: {day: bars}}, sources) per chunk"""
+    return _fetch_chunks_concurrently(
+        yahoo_client.get_intraday_bars_range, tickers, yahoo_client.chunk_size,
+        max_workers, start_date, end_date
+    )
+
+def plan_universe(db, tickers, target_date):
+    """
+    Split the universe into (skip, cached, to_fetch) with two set-based
+    queries instead of per-ticker lookups:
+      skip     - tickers that already have metrics for target_date
+      cached   - {ticker: bars} for tickers whose bars are already in the DB
+      to_fetch - everything else, in universe order
+    """
+    names = [t_obj['ticker'] for t_obj in tickers]
+    
+    have_metrics = db.get_tickers_with_metrics(target_date)
+    skip = [t for t in names if t in have_metrics]
+    pending = [t for t in names if t not in have_metrics]
+    
+    cached = db.get_intraday_bars_many(pending, target_date)
+    to_fetch = [t for t in pending if t not in cached]
+    
+    return skip, cached, to_fetch
+
 def process_universe(db, yahoo_client, tickers, target_date, config):
     logger.info(f"Processing {len(tickers)} tickers for {target_date}")
     
+    started = time.monotonic()
     stats = {'processed': 0, 'skipped': 0, 'failed': 0}
+    max_workers = config.get('apis', {}).get('yahoo', {}).get('max_workers', 4)
+    
+    # 1-2. Plan the whole run up front: skip / compute-from-cache / fetch
+    with STAGE_SECONDS.time(stage='plan'):
+        skip, cached, to_fetch = plan_universe(db, tickers, target_date)
+    stats['skipped'] = len(skip)
+    logger.info(f"Plan: {len(skip)} skip, {len(cached)} from cache, {len(to_fetch)} to fetch")
     
-    for t_obj in tickers:
-        ticker = t_obj['ticker']
+    # Writes are flushed every batch_size tickers or batch_seconds,
+    # so an interrupted run loses at most one batch
+    with db.batch_writer() as writer:
+        _compute_and_save_many(writer, cached, target_date, dict.fromkeys(cached, 'cache'), stats)
         
-        # 1. Check if we already have metrics
-        if db.check_metrics_exist(ticker, target_date):
-            stats['skipped'] += 1
-            continue
+        # 3. Fetch the rest from the providers, computing each chunk as it
+        #    lands. DB writes stay on this thread; workers only do network I/O.
+        done = 0
+        for fetched, sources in _timed(fetch_bars_concurrently(yahoo_client, to_fetch, target_date,
+                                                               max_workers), 'fetch'):
+            _compute_and_save_many(writer, fetched, target_date, sources, stats)
+            done += len(fetched)
+            logger.info(f"Fetched {done}/{len(to_fetch)} tickers")
             
-        # 2. Check if we have raw bars in DB cache
-        bars = db.get_intraday_bars(ticker, target_date)
-        source = 'cache'
-        
-        # 3. If no cache, fetch from Yahoo
-        if not bars:
-            bars = yahoo_client.get_intraday_bars(ticker, target_date)
-            source = 'yahoo'
+    # 4. Materialize the day's snapshot aggregates and cross-sectional
+    #    ranks for the dashboard; late tickers re-rank the whole day
+    with STAGE_SECONDS.time(stage='snapshot'):
+        db.refresh_daily_snapshot(target_date)
+    with STAGE_SECONDS.time(stage='ranks'):
+        refresh_ranks(db, target_date)
+    
+    # 5. Advance the multi-day statistics from the previous date's state
+    with STAGE_SECONDS.time(stage='rolling'):
+        update_rolling(db, target_date, config)
+    
+    _record_run('daily', stats, writer.flush_seconds, started)
+    logger.info(f"Run Stats: {stats} in {writer.flushes} write batches")
+    logger.info(f"Rate limiter wait: {yahoo_client.total_wait:.1f}s")
+    return stats
+
+def backfill_range(db, yahoo_client, tickers, start_date, end_date, config):
+    """
+    Compute every missing (ticker, date) metric in [start_date, end_date].
+    
+    Each ticker's whole range is fetched in one request (per chunk) and split
+    by trading day. Pairs that already have metrics are never refetched, and
+    writes are flushed in batches, so an interrupted backfill resumes where
+    it stopped when rerun with the same arguments.
+    """
+    started = time.monotonic()
+    days = trading_days(start_date, end_date)
+    names = [t_obj['ticker'] for t_obj in tickers]
+    logger.info(f"Backfilling {len(names)} tickers x {len(days)} trading days "
+                f"({start_date} to {end_date})")
+    
+    with STAGE_SECONDS.time(stage='plan'):
+        done = db.get_metric_keys(start_date, end_date)
+        missing = {}
+        for ticker in names:
+            todo = [d for d in days if (ticker, d) not in done]
+            if todo:
+                missing[ticker] = set(todo)
+    
+    total = sum(len(todo) for todo in missing.values())
+    stats = {'processed': 0, 'skipped': len(names) * len(days) - total, 'failed': 0}
+    logger.info(f"Plan: {stats['skipped']} ticker-days done, {total} missing "
+                f"across {len(missing)} tickers")
+    
+    max_workers = config.get('apis', {}).get('yahoo', {}).get('max_workers', 4)
+    t0 = time.monotonic()
+    touched = set()
+    
+    with db.batch_writer() as writer:
+        for fetched, sources in _timed(fetch_range_concurrently(yahoo_client, list(missing),
+                                                                start_date, end_date, max_workers),
+                                       'fetch'):
+            # Key by (ticker, day) so the whole chunk goes through the kernel at once
+            batch = {}
+            for ticker, by_day in fetched.items():
+                for day in missing[ticker]:
+                    if by_day.get(day):
+                        batch[(ticker, day)] = by_day[day]
+                    else:
+                        stats['failed'] += 1
             
-        # 4. Compute and Save
-        if bars:
-            metrics = compute_drawdown_metrics(bars)
-            if metrics:
-                db.save_metrics(ticker, target_date, metrics, source)
-                # Cache the bars to save time later
-                db.save_intraday_bars(ticker, bars)
+            with STAGE_SECONDS.time(stage='compute'):
+                computed = compute_drawdown_metrics_many(batch)
+            for (ticker, day), metrics in computed.items():
+                writer.add(ticker, day, metrics, sources[ticker], batch[(ticker, day)])
                 stats['processed'] += 1
-                logger.info(f"Computed {ticker}: {metrics['max_drawdown_pct']}% DD")
-            else:
-                stats['failed'] += 1
-        else:
-            stats['failed'] += 1
-            logger.warning(f"No data for {ticker}")
+                touched.add(day)
             
-    logger.info(f"Run Stats: {stats}")
+            elapsed = time.monotonic() - t0
+            rate = stats['processed'] / elapsed if elapsed > 0 else 0.0
+            logger.info(f"Backfilled {stats['processed'] + stats['failed']}/{total} ticker-days "
+                        f"({rate:.1f} ticker-days/s)")
+    
+    with STAGE_SECONDS.time(stage='snapshot'):
+        for day in sorted(touched):
+            db.refresh_daily_snapshot(day)
+    with STAGE_SECONDS.time(stage='ranks'):
+        for day in sorted(touched):
+            refresh_ranks(db, day)
+    
+    # Every date after the first one filled in rests on it, so the rolling
+    # state is rebuilt from there forward
+    if touched:
+        with STAGE_SECONDS.time(stage='rolling'):
+            update_rolling(db, min(touched), config)
+    
+    _record_run('backfill', stats, writer.flush_seconds, started)
+    logger.info(f"Backfill Stats: {stats} in {writer.flushes} write batches")
+    logger.info(f"Rate limiter wait: {yahoo_client.total_wait:.1f}s")
+    return stats
+
+def _resumable(state, state_source, bars, source) -> bool:
+    """
+    True if a live state can be advanced with bars: it came from the same
+    provider and its timestamps are on the same clock, so a switch of
+    provider or a state saved under another timezone (or none) starts the
+    day over.
+    """
+    return (state_source == source
+            and all(b['timestamp'].utcoffset() == state['last_time'].utcoffset() for b in bars))
+
+def refresh_live(db, yahoo_client, tickers, target_date, config):
+    """
+    Intraday refresh: bring every ticker's metrics for target_date up to
+    the latest bar without recomputing the day.
+    
+    Each ticker's running state (see metrics.fold_running_state) advances
+    by only the bars from its last seen timestamp onwards, and the metrics
+    row is upserted as provisional. Providers are still asked for the
+    whole day: one chunk request costs the same however many of its bars
+    are new, and none of them can serve "bars after T" for a chunk of
+    tickers with different cursors. Tickers whose final metrics already
+    exist are skipped; the EOD run recomputes the rest in full and clears
+    their live state, so the values it stores match a full recompute.
+    Bars are not cached until then. A ticker now served by another provider
+    is folded from scratch, and one whose bars cannot be folded counts as
+    failed without stopping the refresh.
+    """
+    logger.info(f"Live refresh of {len(tickers)} tickers for {target_date}")
+    
+    started = time.monotonic()
+    stats = {'processed': 0, 'skipped': 0, 'failed': 0}
+    max_workers = config.get('apis', {}).get('yahoo', {}).get('max_workers', 4)
+    store_seconds = 0.0
+    
+    with STAGE_SECONDS.time(stage='plan'):
+        final = db.get_tickers_with_metrics(target_date)
+        names = [t['ticker'] for t in tickers if t['ticker'] not in final]
+        states = db.get_live_state_many(target_date)
+        live_sources = {ticker: state.pop('source') for ticker, state in states.items()}
+    stats['skipped'] = len(tickers) - len(names)
+    
+    unchanged = 0
+    # One transaction per refresh: readers see the universe move together
+    with db.batch():
+        for fetched, sources in _timed(fetch_bars_concurrently(yahoo_client, names, target_date,
+                                                               max_workers), 'fetch'):
+            rows = []
+            with STAGE_SECONDS.time(stage='compute'):
+                for ticker in fetched:
+                    previous = states.get(ticker)
+                    try:
+                        if previous is not None and not _resumable(
+                                previous, live_sources[ticker], fetched[ticker], sources[ticker]):
+                            logger.info(f"{ticker}: live state from {live_sources[ticker]} "
+                                        f"restarted for bars from {sources[ticker]}")
+                            previous = None
+                        state = fold_running_state(previous, fetched[ticker])
+                        if state is not None and state != previous:
+                            metrics = running_metrics(state)
+                    except Exception as e:
+                        logger.warning(f"Live refresh failed for {ticker}: {e}")
+                        stats['failed'] += 1
+                        continue
+                    if state is None:
+                        stats['failed'] += 1
+                    elif state == previous:
+                        unchanged += 1
+                    else:
+                        states[ticker] = state
+                        rows.append((ticker, target_date, state, metrics, sources[ticker]))
+            t0 = time.perf_counter()
+            db.save_live_many(rows)
+            store_seconds += time.perf_counter() - t0
+            stats['processed'] += len(rows)
+    stats['failed'] += len(names) - stats['processed'] - stats['failed'] - unchanged
+    
+    with STAGE_SECONDS.time(stage='snapshot'):
+        db.refresh_daily_snapshot(target_date)
+    with STAGE_SECONDS.time(stage='ranks'):
+        refresh_ranks(db, target_date)
+    
+    _record_run('live', stats, store_seconds, started)
+    logger.info(f"Live Stats: {stats}, {unchanged} without new bars")
+    return stats
+
+def rebuild_main(start_date, rolling, ranks):
+    """
+    compute_metrics.py --rebuild-rolling / --rebuild-ranks: recompute the
+    derived tables from stored metrics without fetching anything
+    """
+    config = load_config()
+    db = Database(config['database'])
+    try:
+        db.connect()
+        if ranks:
+            with STAGE_SECONDS.time(stage='ranks'):
+                days = db.get_metric_dates(start_date)
+                changed = sum(refresh_ranks(db, day) for day in days)
+            logger.info(f"Re-ranked {len(days)} dates, {changed} rows changed")
+        if rolling:
+            with STAGE_SECONDS.time(stage='rolling'):
+                written = rebuild_rolling(db, config, start_date)
+            logger.info(f"Rebuilt {written} rolling metric rows")
+    finally:
+        db.close()
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python compute_metrics.py YYYY-MM-DD [TICKER ...]")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Compute intraday metrics for one date or backfill a date range.",
+        usage="python compute_metrics.py YYYY-MM-DD [TICKER ...]\n"
+              "       python compute_metrics.py --from YYYY-MM-DD --to YYYY-MM-DD [TICKER ...]\n"
+              "       python compute_metrics.py --workers N (YYYY-MM-DD | --from ... --to ...) [TICKER ...]\n"
+              "       python compute_metrics.py --live [YYYY-MM-DD] [TICKER ...]\n"
+              "       python compute_metrics.py (--rebuild-rolling | --rebuild-ranks) [--from YYYY-MM-DD]"
+    )
+    parser.add_argument('args', nargs='*', help="date (single-day mode) followed by optional tickers")
+    parser.add_argument('--from', dest='start', help="first date of a backfill range")
+    parser.add_argument('--to', dest='end', help="last date of a backfill range (default: --from)")
+    parser.add_argument('--simulate', action='store_true',
+                        help="use simulated bars instead of Yahoo (offline runs and load tests)")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="compute in N worker processes over the durable job queue")
+    parser.add_argument('--live', action='store_true',
+                        help="incremental intraday refresh of provisional metrics (default date: today)")
+    parser.add_argument('--rebuild-rolling', action='store_true',
+                        help="recompute the rolling multi-day metrics from stored metrics "
+                             "(from --from, if given) and exit")
+    parser.add_argument('--rebuild-ranks', action='store_true',
+                        help="recompute universe, sector and industry ranks of every date "
+                             "(from --from, if given) and exit")
+    args = parser.parse_args()
+    if args.live and (args.workers or args.start):
+        parser.error("--live refreshes a single date in one process")
+    if args.rebuild_rolling or args.rebuild_ranks:
+        if args.args or args.live or args.workers or args.end:
+            parser.error("--rebuild-rolling and --rebuild-ranks take no dates, tickers "
+                         "or other modes (only --from)")
+        rebuild_main(date.fromisoformat(args.start) if args.start else None,
+                     rolling=args.rebuild_rolling, ranks=args.rebuild_ranks)
+        return
     
     try:
-        target_date = date.fromisoformat(sys.argv[1])
+        if args.start:
+            start_date = date.fromisoformat(args.start)
+            end_date = date.fromisoformat(args.end) if args.end else start_date
+            specific_tickers = args.args
+        elif args.live:
+            dated = bool(args.args) and args.args[0][:1].isdigit()
+            target_date = date.fromisoformat(args.args[0]) if dated else date.today()
+            specific_tickers = args.args[1:] if dated else args.args
+        elif args.args:
+            target_date = date.fromisoformat(args.args[0])
+            specific_tickers = args.args[1:]
+        else:
+            parser.print_usage()
+            sys.exit(1)
     except ValueError:
         print("Error: Date must be in YYYY-MM-DD format")
         sys.exit(1)
 
-    # Optional: specific tickers from command line
-    specific_tickers = sys.argv[2:] if len(sys.argv) > 2 else None
-
     config = load_config()
     db = Database(config['database'])
     
-    # Init Client (Only Yahoo now)
-    yahoo_client = YahooFinanceClient()
+    mode = 'live' if args.live else 'backfill' if args.start else 'daily'
+    succeeded = False
     
     try:
         db.connect()
@@ -85,9 +423,36 @@ def main():
                 min_market_cap=config['universe']['min_market_cap']
             )
         
-        process_universe(db, yahoo_client, tickers, target_date, config)
+        if args.workers:
+            days = trading_days(start_date, end_date) if args.start else [target_date]
+            started = time.monotonic()
+            counts = run_workers(db, config, tickers, days, args.workers, simulate=args.simulate)
+            TICKERS.inc(counts['done'], mode=mode, outcome='processed')
+            TICKERS.inc(counts['failed'], mode=mode, outcome='failed')
+            RUN_SECONDS.set(time.monotonic() - started, mode=mode)
+            LAST_RUN.set(time.time(), mode=mode)
+            succeeded = counts['pending'] + counts['leased'] == 0
+        else:
+            yahoo_client = client_from_config(
+                config, simulate=args.simulate,
+                sectors={t['ticker']: t.get('sector') for t in tickers}
+            )
+            if args.live:
+                refresh_live(db, yahoo_client, tickers, target_date, config)
+            elif args.start:
+                backfill_range(db, yahoo_client, tickers, start_date, end_date, config)
+            else:
+                process_universe(db, yahoo_client, tickers, target_date, config)
+            succeeded = True
         
     finally:
+        LAST_SUCCESS.set(int(succeeded), mode=mode)
+        # For node_exporter's textfile collector: alert on slow or failing
+        # runs and on dipsnipe_fetch_tickers_total{outcome="synthetic"}
+        textfile = config.get('metrics', {}).get('textfile')
+        if textfile:
+            REGISTRY.write_textfile(textfile)
+            logger.info(f"Wrote run metrics to {textfile}")
         db.close()
 
 if __name__ == "__main__":
@@ -1,9 +1,17 @@
 """SQLite Database operations for DipHunter - Enhanced Version"""
+import json
+import queue
 import sqlite3
 import logging
-from typing import List, Dict, Optional
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Tuple, Set, Iterable, Iterator
 from datetime import date, datetime
 
+from bar_archive import merge_bars, shared_archive
+from migrations import migrate
+
 logger = logging.getLogger(__name__)
 
 class Database:
@@ -11,12 +19,22 @@ class Database:
     
     def __init__(self, config: dict):
         self.db_file = config['file']
+        self.batch_size = config.get('batch_size', 100)
+        self.batch_seconds = config.get('batch_seconds', 5.0)
+        self.read_cache_mb = config.get('read_cache_mb', 16)
+        self.read_mmap_mb = config.get('read_mmap_mb', 256)
+        # How long a writer waits for another process's write lock
+        self.busy_timeout = config.get('busy_timeout_seconds', 30)
+        # Closed trading days whose bars were compacted out of intraday_bars
+        self.archive = shared_archive(config['archive_dir']) if config.get('archive_dir') else None
         self.conn = None
+        self._batch_depth = 0
     
     def connect(self):
         """Establish database connection"""
         try:
-            self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            self.conn = sqlite3.connect(self.db_file, check_same_thread=False,
+                                        timeout=self.busy_timeout)
             self.conn.row_factory = sqlite3.Row
             self.conn.execute("PRAGMA journal_mode=WAL;")
             logger.info(f"Connected to SQLite: {self.db_file}")
@@ -25,48 +43,31 @@ class Database:
             logger.error(f"Failed to connect to database: {e}")
             raise
 
+    def connect_read_only(self):
+        """
+        Open a query-only connection for the calling thread.
+        
+        Readers never create or migrate the schema (a writer connection must
+        have done that already). They may move between threads, as ReadPool
+        hands them out, but must only be used by one thread at a time.
+        WAL lets them run alongside each other and alongside the writer.
+        """
+        try:
+            self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+            self.conn.execute("PRAGMA journal_mode=WAL;")
+            self.conn.execute("PRAGMA query_only=ON;")
+            self.conn.execute(f"PRAGMA cache_size=-{int(self.read_cache_mb * 1024)};")
+            self.conn.execute(f"PRAGMA mmap_size={int(self.read_mmap_mb * 1024 * 1024)};")
+            logger.debug(f"Opened read-only SQLite connection: {self.db_file}")
+        except Exception as e:
+            logger.error(f"Failed to open read-only connection: {e}")
+            raise
+
     def _create_tables(self):
-        """Initialize schema automatically"""
-        schema = """
-        CREATE TABLE IF NOT EXISTS tickers (
-            ticker TEXT PRIMARY KEY,
-            sector TEXT,
-            industry TEXT,
-            market_cap INTEGER,
-            avg_volume INTEGER,
-            last_updated TEXT
-        );
-        
-        CREATE INDEX IF NOT EXISTS idx_tickers_cap ON tickers(market_cap);
-        CREATE INDEX IF NOT EXISTS idx_tickers_sector ON tickers(sector);
-        CREATE INDEX IF NOT EXISTS idx_tickers_industry ON tickers(industry);
-
-        CREATE TABLE IF NOT EXISTS intraday_metrics (
-            ticker TEXT NOT NULL,
-            date TEXT NOT NULL,
-            max_drawdown_pct REAL,
-            drawdown_time TEXT,
-            recovery_pct REAL,
-            data_source TEXT,
-            computed_at TEXT,
-            PRIMARY KEY (ticker, date),
-            FOREIGN KEY (ticker) REFERENCES tickers(ticker) ON DELETE CASCADE
-        );
-
-        CREATE TABLE IF NOT EXISTS intraday_bars (
-            ticker TEXT NOT NULL,
-            timestamp TEXT NOT NULL,
-            open REAL,
-            high REAL,
-            low REAL,
-            close REAL,
-            PRIMARY KEY (ticker, timestamp),
-            FOREIGN KEY (ticker) REFERENCES tickers(ticker) ON DELETE CASCADE
-        );
-        """
-        self.conn.executescript(schema)
-        self.conn.commit()
-        logger.info("Database schema verified")
+        """Bring the schema up to date by applying pending migrations"""
+        version = migrate(self.conn)
+        logger.info(f"Database schema verified (version {version})")
     
     def close(self):
         if self.conn:
@@ -80,6 +81,34 @@ class Database:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
+    @contextmanager
+    def batch(self):
+        """
+        Group every write inside the block into a single transaction.
+        Commits once on exit, rolls back if the block raises. Nests safely.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        except Exception:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.conn.rollback()
+            raise
+        else:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.conn.commit()
+
+    def _commit(self):
+        """Commit unless an enclosing batch() will commit for us"""
+        if self._batch_depth == 0:
+            self.conn.commit()
+
+    def batch_writer(self) -> 'BatchWriter':
+        """Create a BatchWriter using this database's flush thresholds"""
+        return BatchWriter(self, max_tickers=self.batch_size, max_seconds=self.batch_seconds)
+
     def get_filtered_tickers(
         self, 
         min_market_cap: int = 0,
@@ -118,6 +147,59 @@ class Database:
         cur.execute(query, params)
         return [dict(row) for row in cur.fetchall()]
 
+    def get_fundamentals(self, ttl_hours: float = None) -> Dict[str, Dict]:
+        """
+        Stored fundamentals keyed by ticker. With ttl_hours, each row also
+        carries 'stale': True when last_updated is missing or older than that.
+        """
+        stale = "1"
+        params = []
+        if ttl_hours is not None:
+            stale = "(last_updated IS NULL OR last_updated < datetime('now', ?))"
+            params.append(f"-{float(ttl_hours)} hours")
+        cur = self.conn.execute(
+            f"""SELECT ticker, sector, industry, market_cap, {stale} AS stale
+                FROM tickers""",
+            params
+        )
+        return {
+            row['ticker']: {**dict(row), 'stale': bool(row['stale'])}
+            for row in cur.fetchall()
+        }
+
+    def save_fundamentals_many(self, rows: List[Dict]):
+        """Upsert ticker fundamentals (ticker, sector, industry, market_cap) in one transaction"""
+        if not rows:
+            return
+        
+        with self.batch():
+            # Update in place rather than INSERT OR REPLACE, which would
+            # delete the row and lose avg_volume
+            self.conn.executemany(
+                """INSERT INTO tickers (ticker, sector, industry, market_cap, last_updated)
+                   VALUES (?, ?, ?, ?, datetime('now'))
+                   ON CONFLICT(ticker) DO UPDATE SET
+                       sector = excluded.sector,
+                       industry = excluded.industry,
+                       market_cap = excluded.market_cap,
+                       last_updated = excluded.last_updated""",
+                [(r['ticker'], r['sector'], r['industry'], r['market_cap']) for r in rows]
+            )
+        logger.debug(f"Saved fundamentals for {len(rows)} tickers")
+
+    def touch_fundamentals(self, tickers: Iterable[str]):
+        """Mark tickers' fundamentals as freshly checked without changing them"""
+        rows = [(t,) for t in tickers]
+        if not rows:
+            return
+        
+        with self.batch():
+            self.conn.executemany(
+                "UPDATE tickers SET last_updated = datetime('now') WHERE ticker = ?",
+                rows
+            )
+        logger.debug(f"Marked fundamentals fresh for {len(rows)} tickers")
+
     def get_sectors(self) -> List[str]:
         """Get list of unique sectors"""
         cur = self.conn.cursor()
@@ -162,41 +244,338 @@ class Database:
         )
         return cur.fetchone() is not None
 
+    # Provisional rows written by the live refresh don't count as computed
+    _FINAL = "NOT EXISTS (SELECT 1 FROM live_state l WHERE l.ticker = m.ticker AND l.date = m.date)"
+
+    def get_tickers_with_metrics(self, target_date: date) -> Set[str]:
+        """All tickers that already have final metrics for target_date, in one query"""
+        cur = self.conn.cursor()
+        cur.execute(
+            f"SELECT ticker FROM intraday_metrics m WHERE date = ? AND {self._FINAL}",
+            (target_date.isoformat(),)
+        )
+        return {row['ticker'] for row in cur.fetchall()}
+
+    def get_metric_keys(self, start_date: date, end_date: date) -> Set[Tuple[str, date]]:
+        """All (ticker, date) pairs with final metrics in [start_date, end_date], in one query"""
+        cur = self.conn.cursor()
+        cur.execute(
+            f"""SELECT ticker, date FROM intraday_metrics m
+                WHERE date >= ? AND date <= ? AND {self._FINAL}""",
+            (start_date.isoformat(), end_date.isoformat())
+        )
+        return {(row['ticker'], date.fromisoformat(row['date'])) for row in cur.fetchall()}
+
+    # Stay well under SQLite's bound-parameter limit on older builds
+    _MAX_IN_PARAMS = 500
+
+    def get_intraday_bars_many(self, tickers: Iterable[str], target_date: date) -> Dict[str, List[Dict]]:
+        """
+        Cached bars for target_date for every ticker in `tickers`, grouped by
+        ticker. Tickers with no cached bars are absent from the result.
+        """
+        tickers = list(tickers)
+        date_str_start = f"{target_date.isoformat()}T00:00:00"
+        date_str_end = f"{target_date.isoformat()}T23:59:59"
+        
+        grouped = {}
+        cur = self.conn.cursor()
+        for i in range(0, len(tickers), self._MAX_IN_PARAMS):
+            chunk = tickers[i:i + self._MAX_IN_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            cur.execute(
+                f"""SELECT ticker, timestamp, open, high, low, close, volume
+                    FROM intraday_bars
+                    WHERE ticker IN ({placeholders}) AND timestamp >= ? AND timestamp <= ?
+                    ORDER BY ticker, timestamp""",
+                (*chunk, date_str_start, date_str_end)
+            )
+            for row in cur.fetchall():
+                d = dict(row)
+                ticker = d.pop('ticker')
+                d['timestamp'] = datetime.fromisoformat(d['timestamp'])
+                grouped.setdefault(ticker, []).append(d)
+        
+        # An archived day can still gain rows in intraday_bars (a late fill)
+        if self.archive:
+            for ticker, archived in self.archive.get_bars_many(tickers, target_date).items():
+                grouped[ticker] = merge_bars(archived, grouped.get(ticker))
+        
+        logger.debug(f"Retrieved cached bars for {len(grouped)}/{len(tickers)} tickers")
+        return grouped
+
+    _SAVE_METRICS_SQL = """INSERT OR REPLACE INTO intraday_metrics 
+               (ticker, date, max_drawdown_pct, drawdown_time, recovery_pct, data_source, computed_at)
+               VALUES (?, ?, ?, ?, ?, ?, datetime('now'))"""
+
+    @staticmethod
+    def _metrics_row(ticker: str, target_date: date, metrics: Dict, source: str) -> Tuple:
+        dd_time_str = metrics['drawdown_time'].isoformat() if metrics['drawdown_time'] else None
+        return (
+            ticker,
+            target_date.isoformat(),
+            metrics['max_drawdown_pct'],
+            dd_time_str,
+            metrics['recovery_pct'],
+            source
+        )
+
+    def _clear_live_state(self, keys: List[Tuple[str, str]]):
+        """Final metrics supersede the live refresh's running state"""
+        if self.conn.execute("SELECT EXISTS (SELECT 1 FROM live_state)").fetchone()[0]:
+            self.conn.executemany("DELETE FROM live_state WHERE ticker = ? AND date = ?", keys)
+
     def save_metrics(self, ticker: str, target_date: date, metrics: Dict, source: str):
         """Save computed metrics to database"""
-        date_str = target_date.isoformat()
-        dd_time_str = metrics['drawdown_time'].isoformat() if metrics['drawdown_time'] else None
+        cur = self.conn.cursor()
+        cur.execute(self._SAVE_METRICS_SQL, self._metrics_row(ticker, target_date, metrics, source))
+        self._clear_live_state([(ticker, target_date.isoformat())])
+        self._commit()
+        logger.debug(f"Saved metrics for {ticker} on {target_date.isoformat()}")
+
+    def save_metrics_many(self, rows: List[Tuple[str, date, Dict, str]]):
+        """Save (ticker, date, metrics, source) rows in one transaction"""
+        if not rows:
+            return
         
+        with self.batch():
+            self.conn.executemany(
+                self._SAVE_METRICS_SQL,
+                [self._metrics_row(*row) for row in rows]
+            )
+            self._clear_live_state([(row[0], row[1].isoformat()) for row in rows])
+        logger.debug(f"Saved metrics for {len(rows)} tickers")
+
+    _LIVE_FIELDS = ('settled', 'open', 'high', 'low', 'low_time',
+                    'last_time', 'last_open', 'last_high', 'last_low', 'last_close')
+
+    def get_live_state_many(self, target_date: date) -> Dict[str, Dict]:
+        """
+        Running state of every ticker refreshed live on target_date (see
+        metrics.fold_running_state), with the provider that served it under
+        'source'
+        """
         cur = self.conn.cursor()
         cur.execute(
-            """INSERT OR REPLACE INTO intraday_metrics 
-               (ticker, date, max_drawdown_pct, drawdown_time, recovery_pct, data_source, computed_at)
-               VALUES (?, ?, ?, ?, ?, ?, datetime('now'))""",
-            (
-                ticker, 
-                date_str, 
-                metrics['max_drawdown_pct'],
-                dd_time_str,
-                metrics['recovery_pct'],
-                source
+            f"""SELECT l.ticker, {', '.join(f'l.{field}' for field in self._LIVE_FIELDS)},
+                       m.data_source AS source
+                FROM live_state l
+                LEFT JOIN intraday_metrics m ON m.ticker = l.ticker AND m.date = l.date
+                WHERE l.date = ?""",
+            (target_date.isoformat(),)
+        )
+        states = {}
+        for row in cur.fetchall():
+            state = dict(row)
+            for key in ('low_time', 'last_time'):
+                if state[key] is not None:
+                    state[key] = datetime.fromisoformat(state[key])
+            states[state.pop('ticker')] = state
+        return states
+
+    def save_live_many(self, rows: List[Tuple[str, date, Dict, Dict, str]]):
+        """
+        Save (ticker, date, running state, metrics, source) rows from the
+        live refresh in one transaction. The metrics row is upserted as
+        provisional until a final write for the same day replaces it.
+        """
+        if not rows:
+            return
+        
+        state_rows = []
+        for ticker, target_date, state, _, _ in rows:
+            values = [state[key] for key in self._LIVE_FIELDS]
+            for i, key in enumerate(self._LIVE_FIELDS):
+                if key in ('low_time', 'last_time') and values[i] is not None:
+                    values[i] = values[i].isoformat()
+            state_rows.append((ticker, target_date.isoformat(), *values))
+        
+        with self.batch():
+            self.conn.executemany(
+                f"""INSERT OR REPLACE INTO live_state
+                    (ticker, date, {', '.join(self._LIVE_FIELDS)}, updated_at)
+                    VALUES (?, ?, {', '.join('?' * len(self._LIVE_FIELDS))}, datetime('now'))""",
+                state_rows
             )
+            self.conn.executemany(
+                self._SAVE_METRICS_SQL,
+                [self._metrics_row(ticker, d, metrics, source) for ticker, d, _, metrics, source in rows]
+            )
+        logger.debug(f"Saved live state for {len(rows)} tickers")
+
+    _RANK_FIELDS = ('universe_rank', 'universe_pct', 'sector_rank', 'sector_pct',
+                    'industry_rank', 'industry_pct')
+
+    def get_rank_inputs(self, target_date: date) -> List[Dict]:
+        """
+        Every metrics row of target_date with the ticker's sector and
+        industry and its currently stored ranks (see ranks.refresh_ranks)
+        """
+        cur = self.conn.cursor()
+        cur.execute(
+            f"""SELECT m.ticker, m.max_drawdown_pct, t.sector, t.industry,
+                       {', '.join(f'm.{field}' for field in self._RANK_FIELDS)}
+                FROM intraday_metrics m
+                LEFT JOIN tickers t ON t.ticker = m.ticker
+                WHERE m.date = ? AND m.max_drawdown_pct IS NOT NULL""",
+            (target_date.isoformat(),)
         )
-        self.conn.commit()
-        logger.debug(f"Saved metrics for {ticker} on {date_str}")
+        return [dict(row) for row in cur.fetchall()]
 
-    def get_metrics(
-        self, 
+    def save_ranks(self, target_date: date, rows: List[Dict]):
+        """Store ranks for target_date from dicts holding ticker and every rank field, in one transaction"""
+        if not rows:
+            return
+        
+        with self.batch():
+            self.conn.executemany(
+                f"""UPDATE intraday_metrics
+                    SET {', '.join(f'{field} = :{field}' for field in self._RANK_FIELDS)}
+                    WHERE ticker = :ticker AND date = :date""",
+                [{**row, 'date': target_date.isoformat()} for row in rows]
+            )
+        logger.debug(f"Saved ranks for {len(rows)} tickers on {target_date.isoformat()}")
+
+    def get_metric_dates(self, start_date: date = None, tickers: Iterable[str] = None) -> List[date]:
+        """
+        Every date with metrics (from start_date on, if given), oldest first;
+        with tickers, only dates on which one of them has metrics
+        """
+        start = (start_date or date.min).isoformat()
+        cur = self.conn.cursor()
+        if tickers is None:
+            cur.execute(
+                "SELECT DISTINCT date FROM intraday_metrics WHERE date >= ? ORDER BY date",
+                (start,)
+            )
+            return [date.fromisoformat(row['date']) for row in cur.fetchall()]
+        
+        tickers = list(tickers)
+        dates = set()
+        for i in range(0, len(tickers), self._MAX_IN_PARAMS):
+            chunk = tickers[i:i + self._MAX_IN_PARAMS]
+            cur.execute(
+                f"""SELECT DISTINCT date FROM intraday_metrics
+                    WHERE ticker IN ({",".join("?" * len(chunk))}) AND date >= ?""",
+                (*chunk, start)
+            )
+            dates.update(row['date'] for row in cur.fetchall())
+        return [date.fromisoformat(d) for d in sorted(dates)]
+
+    def get_rolling_inputs(self, target_date: date) -> List[Dict]:
+        """
+        Every ticker's final day return for target_date with its rolling state
+        (return_window, down_streak) as of its latest earlier date, or None
+        for both on its first date. The state lookup is a primary-key seek per
+        ticker, so the cost does not grow with history.
+        """
+        cur = self.conn.cursor()
+        cur.execute(
+            f"""SELECT m.ticker, m.max_drawdown_pct AS day_return, r.return_window, r.down_streak
+                FROM intraday_metrics m
+                LEFT JOIN rolling_metrics r ON r.ticker = m.ticker AND r.date = (
+                    SELECT MAX(p.date) FROM rolling_metrics p
+                    WHERE p.ticker = m.ticker AND p.date < m.date
+                )
+                WHERE m.date = ? AND m.max_drawdown_pct IS NOT NULL AND {self._FINAL}
+                ORDER BY m.ticker""",
+            (target_date.isoformat(),)
+        )
+        return [dict(row) for row in cur.fetchall()]
+
+    def save_rolling_day(self, target_date: date, rows: List[Tuple[str, float, int, Optional[float], bytes]]):
+        """
+        Replace target_date's rolling_metrics with (ticker, cum_return_pct,
+        down_streak, return_zscore, return_window) rows in one transaction
+        """
+        date_str = target_date.isoformat()
+        with self.batch():
+            self.conn.execute("DELETE FROM rolling_metrics WHERE date = ?", (date_str,))
+            self.conn.executemany(
+                """INSERT INTO rolling_metrics
+                   (ticker, date, cum_return_pct, down_streak, return_zscore, return_window, computed_at)
+                   VALUES (?, ?, ?, ?, ?, ?, datetime('now'))""",
+                [(ticker, date_str, *values) for ticker, *values in rows]
+            )
+        logger.debug(f"Saved rolling metrics for {len(rows)} tickers on {date_str}")
+
+    def clear_rolling(self, start_date: date = None) -> int:
+        """Delete rolling_metrics from start_date on (all of it if None); returns rows deleted"""
+        cur = self.conn.cursor()
+        cur.execute("DELETE FROM rolling_metrics WHERE date >= ?",
+                    ((start_date or date.min).isoformat(),))
+        self._commit()
+        return cur.rowcount
+
+    # sort name -> (sort key expression, tie-breaker, descending by default).
+    # Each key leads an index so a LIMIT is a bounded index walk (migrations
+    # 4, 9 and 10). Rows without a value for a rolling or percentile sort
+    # are left out of it.
+    METRIC_SORTS = {
+        'return': ('m.max_drawdown_pct', 'm.ticker', False),
+        'volume': ('COALESCE(t.avg_volume, 0)', 't.ticker', True),
+        'market_cap': ('t.market_cap', 't.ticker', True),
+        'cum_return': ('r.cum_return_pct', 'r.ticker', False),
+        'down_streak': ('r.down_streak', 'r.ticker', True),
+        'zscore': ('r.return_zscore', 'r.ticker', False),
+        'sector_pct': ('m.sector_pct', 'm.ticker', False),
+        'industry_pct': ('m.industry_pct', 'm.ticker', False),
+    }
+    _NULLABLE_SORTS = {'cum_return', 'down_streak', 'zscore', 'sector_pct', 'industry_pct'}
+
+    @classmethod
+    def _metrics_query(
+        cls,
         target_date: date,
         min_market_cap: int = 0,
         max_market_cap: int = None,
         min_volume: int = 0,
         sector: str = None,
-        industry: str = None
-    ) -> List[Dict]:
-        """Get metrics with comprehensive filtering"""
-        date_str = target_date.isoformat()
+        industry: str = None,
+        losers_only: bool = False,
+        max_cum_return: float = None,
+        min_down_streak: int = 0,
+        max_zscore: float = None,
+        max_universe_pct: float = None,
+        max_sector_pct: float = None,
+        max_industry_pct: float = None,
+        sort: str = 'return',
+        descending: bool = None,
+        after: Tuple = None,
+        limit: int = None
+    ) -> Tuple[str, List]:
+        """
+        SQL and parameters shared by get_metrics and iter_metrics.
         
-        query = """
+        Rows are ordered by `sort` (see METRIC_SORTS) then ticker, and carry
+        the sort value as sort_key. `after` is the (sort_key, ticker) of the
+        last row of the previous page; only rows strictly after it are returned.
+        The rolling_metrics columns (see rolling.py) are None for rows the
+        rolling stage has not reached yet.
+        """
+        key, tie, default_desc = cls.METRIC_SORTS[sort]
+        descending = default_desc if descending is None else descending
+        rolling = "LEFT JOIN rolling_metrics r ON r.ticker = m.ticker AND r.date = m.date"
+        # Sorts on a tickers or rolling_metrics column pin that table as the
+        # outer loop (CROSS JOIN) so the sort index, not the planner's row
+        # estimate, drives the walk
+        if tie == 'm.ticker':
+            source = f"""intraday_metrics m
+            JOIN tickers t ON m.ticker = t.ticker
+            {rolling}"""
+            date_column = 'm.date'
+        elif tie == 't.ticker':
+            source = f"""tickers t
+            CROSS JOIN intraday_metrics m ON m.ticker = t.ticker
+            {rolling}"""
+            date_column = 'm.date'
+        else:
+            source = """rolling_metrics r
+            CROSS JOIN intraday_metrics m ON m.ticker = r.ticker AND m.date = r.date
+            JOIN tickers t ON t.ticker = r.ticker"""
+            date_column = 'r.date'
+        
+        query = f"""
             SELECT 
                 m.ticker,
                 m.max_drawdown_pct,
@@ -206,16 +585,30 @@ class Database:
                 t.sector,
                 t.industry,
                 t.market_cap,
-                t.avg_volume
-            FROM intraday_metrics m
-            JOIN tickers t ON m.ticker = t.ticker
-            WHERE m.date = ?
-            AND t.market_cap >= ?
+                t.avg_volume,
+                r.cum_return_pct,
+                r.down_streak,
+                r.return_zscore,
+                m.universe_rank,
+                m.universe_pct,
+                m.sector_rank,
+                m.sector_pct,
+                m.industry_rank,
+                m.industry_pct,
+                {key} AS sort_key
+            FROM {source}
+            WHERE {date_column} = ?
         """
-        params = [date_str, min_market_cap]
+        params = [target_date.isoformat()]
+        
+        # Unary + keeps the (always present) cap range from steering the
+        # planner onto the cap index unless that is the sort order
+        cap = 't.market_cap' if sort == 'market_cap' else '+t.market_cap'
+        query += f" AND {cap} >= ?"
+        params.append(min_market_cap)
         
         if max_market_cap:
-            query += " AND t.market_cap <= ?"
+            query += f" AND {cap} <= ?"
             params.append(max_market_cap)
             
         if min_volume > 0:
@@ -229,63 +622,301 @@ class Database:
         if industry:
             query += " AND t.industry = ?"
             params.append(industry)
-            
-        query += " ORDER BY m.max_drawdown_pct ASC"
+        
+        if losers_only:
+            query += " AND m.max_drawdown_pct < 0"
+        
+        if max_cum_return is not None:
+            query += " AND r.cum_return_pct <= ?"
+            params.append(max_cum_return)
+        
+        if min_down_streak > 0:
+            query += " AND r.down_streak >= ?"
+            params.append(min_down_streak)
+        
+        if max_zscore is not None:
+            query += " AND r.return_zscore <= ?"
+            params.append(max_zscore)
+        
+        # Worst-first percentiles: 10 keeps each group's bottom decile
+        ranked = False
+        for column, ceiling in (('universe_pct', max_universe_pct), ('sector_pct', max_sector_pct),
+                                ('industry_pct', max_industry_pct)):
+            if ceiling is not None:
+                query += f" AND m.{column} <= ?"
+                params.append(ceiling)
+                ranked = True
+        
+        if sort in cls._NULLABLE_SORTS:
+            query += f" AND {key} IS NOT NULL"
+        
+        if after is not None:
+            # Written out rather than as a row value so the first term is an index range
+            op = '<' if descending else '>'
+            query += f" AND {key} {op}= ? AND ({key} {op} ? OR {tie} {op} ?)"
+            params.extend([after[0], after[0], after[1]])
+        
+        direction = 'DESC' if descending else 'ASC'
+        # A percentile ceiling keeps a small slice of the date: unary + lets
+        # the planner seek it on the percentile index and sort just those
+        # rows, rather than walk the whole date in sort order to filter it
+        order = f"+{key}" if ranked and tie == 'm.ticker' else key
+        query += f" ORDER BY {order} {direction}, {tie} {direction}"
+        
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        return query, params
+
+    def get_metrics(
+        self, 
+        target_date: date,
+        min_market_cap: int = 0,
+        max_market_cap: int = None,
+        min_volume: int = 0,
+        sector: str = None,
+        industry: str = None,
+        losers_only: bool = False,
+        max_cum_return: float = None,
+        min_down_streak: int = 0,
+        max_zscore: float = None,
+        max_universe_pct: float = None,
+        max_sector_pct: float = None,
+        max_industry_pct: float = None,
+        sort: str = 'return',
+        descending: bool = None,
+        after: Tuple = None,
+        limit: int = None
+    ) -> List[Dict]:
+        """Get metrics with comprehensive filtering, sorting and keyset pagination"""
+        query, params = self._metrics_query(
+            target_date, min_market_cap, max_market_cap, min_volume, sector, industry,
+            losers_only, max_cum_return, min_down_streak, max_zscore,
+            max_universe_pct, max_sector_pct, max_industry_pct, sort, descending, after, limit
+        )
         
         cur = self.conn.cursor()
         cur.execute(query, params)
         results = [dict(row) for row in cur.fetchall()]
-        logger.debug(f"Retrieved {len(results)} metrics for {date_str}")
+        logger.debug(f"Retrieved {len(results)} metrics for {target_date.isoformat()}")
         return results
 
+    def iter_metrics(self, target_date: date, chunk_size: int = 1000, first_chunk: int = 25,
+                     **filters) -> Iterator[List[sqlite3.Row]]:
+        """
+        Same rows as get_metrics (same keyword filters), streamed straight off
+        the cursor, so callers never hold the whole result at once. The first
+        list holds first_chunk rows so a stream can start right away; each
+        later one doubles, up to chunk_size.
+        """
+        query, params = self._metrics_query(target_date, **filters)
+        
+        cur = self.conn.cursor()
+        cur.execute(query, params)
+        size = min(first_chunk, chunk_size)
+        while True:
+            rows = cur.fetchmany(size)
+            if not rows:
+                break
+            yield rows
+            size = min(size * 2, chunk_size)
+
     def get_intraday_bars(self, ticker: str, target_date: date) -> List[Dict]:
         """Get intraday bars for ticker on specific date"""
-        date_str_start = f"{target_date.isoformat()}T00:00:00"
-        date_str_end = f"{target_date.isoformat()}T23:59:59"
-        
+        return self.get_intraday_bars_range(ticker, target_date, target_date)
+    
+    def get_intraday_bars_range(self, ticker: str, start_date: date, end_date: date) -> List[Dict]:
+        """
+        Every bar for ticker from start_date through end_date, in time
+        order: one index range read of intraday_bars, merged day by day
+        with whatever of the range is archived.
+        """
         cur = self.conn.cursor()
         cur.execute(
-            """SELECT timestamp, open, high, low, close
+            """SELECT timestamp, open, high, low, close, volume
                FROM intraday_bars
                WHERE ticker = ? AND timestamp >= ? AND timestamp <= ?
                ORDER BY timestamp""",
-            (ticker, date_str_start, date_str_end)
+            (ticker, f"{start_date.isoformat()}T00:00:00", f"{end_date.isoformat()}T23:59:59")
         )
         
-        rows = []
+        by_day = {}
         for row in cur.fetchall():
             d = dict(row)
+            by_day.setdefault(d['timestamp'][:10], []).append(d)
             d['timestamp'] = datetime.fromisoformat(d['timestamp'])
-            rows.append(d)
         
+        if self.archive:
+            days = [start_date] if start_date == end_date else self.archive.days(start_date, end_date)
+            for day, archived in self.archive.get_bars_range(ticker, days).items():
+                key = day.isoformat()
+                by_day[key] = merge_bars(archived, by_day.get(key))
+        
+        rows = [bar for key in sorted(by_day) for bar in by_day[key]]
         logger.debug(f"Retrieved {len(rows)} bars for {ticker}")
         return rows
     
+    _SAVE_BARS_SQL = """INSERT OR IGNORE INTO intraday_bars 
+               (ticker, timestamp, open, high, low, close, volume)
+               VALUES (?, ?, ?, ?, ?, ?, ?)"""
+
+    @staticmethod
+    def _bar_rows(ticker: str, bars: List[Dict]) -> List[Tuple]:
+        return [
+            (
+                ticker,
+                bar['timestamp'].isoformat(),
+                bar['open'],
+                bar['high'],
+                bar['low'],
+                bar['close'],
+                bar.get('volume')
+            )
+            for bar in bars
+        ]
+
     def save_intraday_bars(self, ticker: str, bars: List[Dict]):
         """Save intraday bars to database"""
         if not bars:
             return
         
+        data = self._bar_rows(ticker, bars)
+        cur = self.conn.cursor()
+        cur.executemany(self._SAVE_BARS_SQL, data)
+        self._commit()
+        logger.debug(f"Saved {len(data)} bars for {ticker}")
+
+    def save_bars_many(self, bars_by_ticker: Dict[str, List[Dict]]):
+        """Save bars for many tickers in one transaction"""
         data = []
-        for bar in bars:
-            data.append((
-                ticker,
-                bar['timestamp'].isoformat(),
-                bar['open'],
-                bar['high'],
-                bar['low'],
-                bar['close']
-            ))
-            
+        for ticker, bars in bars_by_ticker.items():
+            data.extend(self._bar_rows(ticker, bars))
+        if not data:
+            return
+        
+        with self.batch():
+            self.conn.executemany(self._SAVE_BARS_SQL, data)
+        logger.debug(f"Saved {len(data)} bars for {len(bars_by_ticker)} tickers")
+
+    def get_bar_dates(self) -> List[date]:
+        """Every date that still has bars in intraday_bars"""
         cur = self.conn.cursor()
-        cur.executemany(
-            """INSERT OR IGNORE INTO intraday_bars 
-               (ticker, timestamp, open, high, low, close)
-               VALUES (?, ?, ?, ?, ?, ?)""",
-            data
+        cur.execute("SELECT DISTINCT substr(timestamp, 1, 10) AS day FROM intraday_bars ORDER BY day")
+        return [date.fromisoformat(row['day']) for row in cur.fetchall()]
+
+    def archive_bars(self, target_date: date) -> int:
+        """
+        Move every bar for target_date from intraday_bars into the columnar
+        archive and return the number of bars moved. The archive partition is
+        complete before the rows are deleted, so a crash in between only
+        leaves the day readable from both places.
+        """
+        if self.archive is None:
+            raise ValueError("No archive_dir configured for this database")
+        
+        date_str_start = f"{target_date.isoformat()}T00:00:00"
+        date_str_end = f"{target_date.isoformat()}T23:59:59"
+        
+        cur = self.conn.cursor()
+        cur.execute(
+            """SELECT ticker, timestamp, open, high, low, close, volume
+               FROM intraday_bars
+               WHERE timestamp >= ? AND timestamp <= ?""",
+            (date_str_start, date_str_end)
         )
-        self.conn.commit()
-        logger.debug(f"Saved {len(data)} bars for {ticker}")
+        grouped = {}
+        for row in cur.fetchall():
+            d = dict(row)
+            ticker = d.pop('ticker')
+            d['timestamp'] = datetime.fromisoformat(d['timestamp'])
+            grouped.setdefault(ticker, []).append(d)
+        if not grouped:
+            return 0
+        
+        # Keep whatever is already archived for the day (an earlier run, or
+        # the bars a late fill is being added to)
+        if self.archive.has_day(target_date):
+            archived_tickers = self.archive.load_day(target_date)[0].tolist()
+            for ticker, bars in self.archive.get_bars_many(archived_tickers, target_date).items():
+                grouped[ticker] = merge_bars(bars, grouped.get(ticker))
+        
+        moved = self.archive.write_day(target_date, grouped)
+        with self.batch():
+            self.conn.execute(
+                "DELETE FROM intraday_bars WHERE timestamp >= ? AND timestamp <= ?",
+                (date_str_start, date_str_end)
+            )
+        logger.info(f"Archived {moved} bars for {len(grouped)} tickers on {target_date.isoformat()}")
+        return moved
+
+    # Aggregates over one date's metrics, as served by /api/metrics. With a
+    # single MIN() SQLite takes the bare ticker column from the minimum row.
+    _SNAPSHOT_SQL = """
+        SELECT {group} AS name,
+               COUNT(*) AS ticker_count,
+               AVG(m.max_drawdown_pct) AS avg_return_pct,
+               MIN(m.max_drawdown_pct) AS worst_return_pct,
+               m.ticker AS worst_ticker,
+               SUM(m.max_drawdown_pct < 0) AS losers
+        FROM intraday_metrics m
+        JOIN tickers t ON m.ticker = t.ticker
+        WHERE m.date = ?
+        {group_by}
+    """
+
+    def refresh_daily_snapshot(self, target_date: date) -> Optional[Dict]:
+        """
+        Recompute the daily_snapshot row for target_date, with per-sector and
+        per-industry breakdowns, from intraday_metrics. Dates without metrics
+        have their row removed. Returns the stored snapshot.
+        """
+        date_str = target_date.isoformat()
+        cur = self.conn.cursor()
+        
+        cur.execute(self._SNAPSHOT_SQL.format(group="NULL", group_by=""), (date_str,))
+        overall = dict(cur.fetchone())
+        
+        breakdowns = {}
+        for column in ('sector', 'industry'):
+            cur.execute(
+                self._SNAPSHOT_SQL.format(group=f"t.{column}", group_by=f"GROUP BY t.{column} ORDER BY name"),
+                (date_str,)
+            )
+            breakdowns[column] = [dict(row) for row in cur.fetchall()]
+        
+        with self.batch():
+            if overall['ticker_count'] == 0:
+                self.conn.execute("DELETE FROM daily_snapshot WHERE date = ?", (date_str,))
+            else:
+                self.conn.execute(
+                    """INSERT OR REPLACE INTO daily_snapshot
+                       (date, ticker_count, avg_return_pct, worst_ticker, worst_return_pct,
+                        losers, sectors, industries, computed_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))""",
+                    (date_str, overall['ticker_count'], overall['avg_return_pct'],
+                     overall['worst_ticker'], overall['worst_return_pct'], overall['losers'],
+                     json.dumps(breakdowns['sector']), json.dumps(breakdowns['industry']))
+                )
+        logger.debug(f"Refreshed daily snapshot for {date_str}: {overall['ticker_count']} tickers")
+        return self.get_daily_snapshot(target_date)
+
+    def get_daily_snapshot(self, target_date: date) -> Optional[Dict]:
+        """Stored snapshot for target_date (one primary-key lookup), or None"""
+        cur = self.conn.cursor()
+        cur.execute("SELECT * FROM daily_snapshot WHERE date = ?", (target_date.isoformat(),))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        snapshot = dict(row)
+        snapshot['sectors'] = json.loads(snapshot['sectors'])
+        snapshot['industries'] = json.loads(snapshot['industries'])
+        return snapshot
+
+    def get_data_generation(self) -> int:
+        """Counter that changes whenever any connection writes tickers, metrics or bars"""
+        cur = self.conn.cursor()
+        cur.execute("SELECT generation FROM data_generation WHERE id = 1")
+        return cur.fetchone()['generation']
 
     def get_stats(self) -> Dict:
         """Get database statistics"""
@@ -316,3 +947,123 @@ class Database:
                 'max': date_range['max_date']
             }
         }
+
+
+class BatchWriter:
+    """
+    Unit of work for pipeline writes.
+
+    Buffers metrics and bars per ticker and writes them in one transaction
+    once `max_tickers` are pending or `max_seconds` have passed since the
+    last flush, so an interrupted run loses at most one batch. Use as a
+    context manager to flush whatever is left on exit.
+    """
+    
+    def __init__(self, db: Database, max_tickers: int = 100, max_seconds: float = 5.0):
+        self.db = db
+        self.max_tickers = max_tickers
+        self.max_seconds = max_seconds
+        self._metrics = []
+        self._bars = {}
+        self._last_flush = time.monotonic()
+        self.flushes = 0
+        self.flush_seconds = 0.0
+    
+    def add(self, ticker: str, target_date: date, metrics: Dict, source: str, bars: List[Dict] = None):
+        """Queue one ticker's results, flushing if a threshold is reached"""
+        self._metrics.append((ticker, target_date, metrics, source))
+        if bars:
+            self._bars.setdefault(ticker, []).extend(bars)
+        
+        if (len(self._metrics) >= self.max_tickers
+                or time.monotonic() - self._last_flush >= self.max_seconds):
+            self.flush()
+    
+    def flush(self):
+        """Write everything pending in a single transaction"""
+        if self._metrics or self._bars:
+            start = time.perf_counter()
+            with self.db.batch():
+                self.db.save_metrics_many(self._metrics)
+                self.db.save_bars_many(self._bars)
+            self.flush_seconds += time.perf_counter() - start
+            logger.debug(f"Flushed {len(self._metrics)} tickers")
+            self._metrics = []
+            self._bars = {}
+            self.flushes += 1
+        self._last_flush = time.monotonic()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+
+class ReadPool:
+    """
+    Bounded pool of read-only Databases, each checked out by one request
+    at a time and returned when it ends.
+
+    Connections are opened lazily, up to max_size (database.read_pool_size),
+    and reused by whichever thread asks next, so a server that starts a
+    thread per request keeps a fixed set of connections and warm archive
+    mappings. Callers beyond max_size wait for a connection to come back.
+    Writes must go through a separate Database opened with connect().
+    """
+    
+    def __init__(self, config: dict, max_size: int = None):
+        self.config = config
+        self.max_size = max_size or config.get('read_pool_size', 8)
+        self.timeout = config.get('read_pool_timeout_seconds', 30)
+        # Most recently returned first, so a quiet server reuses its warmest connection
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> Database:
+        """Check out a read-only Database; hand it back with release()"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            grow = self._opened < self.max_size
+            if grow:
+                self._opened += 1
+        if grow:
+            db = Database(self.config)
+            try:
+                db.connect_read_only()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+            return db
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError(f"no read connection free after {self.timeout}s "
+                               f"({self.max_size} in use)")
+    
+    def release(self, db: Database):
+        self._idle.put(db)
+    
+    def size(self) -> int:
+        """Connections opened so far, checked out or idle"""
+        with self._lock:
+            return self._opened
+    
+    def idle(self) -> int:
+        return self._idle.qsize()
+    
+    def close(self):
+        """Close every idle connection; checked-out ones are closed by GC"""
+        while True:
+            try:
+                db = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            db.conn.close()
+            with self._lock:
+                self._opened -= 1
@@ -0,0 +1,157 @@
+"""Persistent cache of raw market data provider responses, shared across processes"""
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (ticker, interval, window start, window end)
+Key = Tuple[str, str, str, str]
+
+# What get_many returns for a key whose last fetch came back empty or failed
+NEGATIVE = object()
+
+
+class FetchCache:
+    """
+    SQLite file of provider responses keyed by (ticker, interval, window).
+
+    Positive entries hold the raw response payload and live for
+    positive_ttl seconds; negative entries record that the provider had
+    nothing for the key (invalid, delisted or blocked ticker) and live for
+    the shorter negative_ttl. Entries for windows that have not closed yet
+    can be given their own TTL by the caller.
+
+    The file is opened in WAL mode with a busy timeout, so concurrent runs
+    and worker threads share it safely. Once the stored payloads exceed
+    max_bytes, expired entries and then the least recently used ones are
+    evicted.
+    """
+
+    def __init__(self, path: str, positive_ttl: float = 7 * 86400,
+                 negative_ttl: float = 6 * 3600, max_bytes: int = 512 * 1024 * 1024):
+        self.path = Path(path)
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS fetch_cache (
+            ticker TEXT NOT NULL,
+            interval TEXT NOT NULL,
+            window_start TEXT NOT NULL,
+            window_end TEXT NOT NULL,
+            payload BLOB,
+            size INTEGER NOT NULL,
+            fetched_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            last_access REAL NOT NULL,
+            PRIMARY KEY (ticker, interval, window_start, window_end)
+        )""")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_fetch_cache_last_access ON fetch_cache(last_access)"
+        )
+        self.conn.commit()
+
+    def get_many(self, keys: Iterable[Key], include_expired: bool = False) -> Dict[Key, object]:
+        """
+        Unexpired entries among keys: the payload bytes for positive
+        entries, NEGATIVE for negative ones. Missing and expired keys are
+        absent, unless include_expired asks for stale entries too (a last
+        resort while the provider is down). Hits are marked as recently used.
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                row = self.conn.execute(
+                    """SELECT payload FROM fetch_cache
+                       WHERE ticker = ? AND interval = ? AND window_start = ? AND window_end = ?
+                         AND expires_at > ?""",
+                    (*key, 0 if include_expired else now)
+                ).fetchone()
+                if row is not None:
+                    found[key] = row[0] if row[0] is not None else NEGATIVE
+            if found:
+                self.conn.executemany(
+                    """UPDATE fetch_cache SET last_access = ?
+                       WHERE ticker = ? AND interval = ? AND window_start = ? AND window_end = ?""",
+                    [(now, *key) for key in found]
+                )
+            self.conn.commit()
+        return found
+
+    def get(self, key: Key) -> Optional[object]:
+        """Payload bytes, NEGATIVE, or None on a miss"""
+        return self.get_many([key]).get(key)
+
+    def put_many(self, entries: Dict[Key, Optional[bytes]], ttl: float = None):
+        """
+        Store payloads (None records a negative entry) in one transaction.
+        ttl overrides positive_ttl/negative_ttl for every entry.
+        """
+        if not entries:
+            return
+        now = time.time()
+        rows = []
+        for key, payload in entries.items():
+            life = ttl if ttl is not None else (self.positive_ttl if payload is not None else self.negative_ttl)
+            rows.append((*key, payload, len(payload) if payload else 0, now, now + life, now))
+        with self._lock:
+            self.conn.executemany(
+                """INSERT OR REPLACE INTO fetch_cache
+                   (ticker, interval, window_start, window_end, payload, size,
+                    fetched_at, expires_at, last_access)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                rows
+            )
+            self.conn.commit()
+            self._evict(now)
+
+    def put(self, key: Key, payload: Optional[bytes], ttl: float = None):
+        self.put_many({key: payload}, ttl)
+
+    def _evict(self, now: float):
+        """Drop expired entries, then least recently used ones, until under max_bytes"""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM fetch_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        self.conn.execute("DELETE FROM fetch_cache WHERE expires_at <= ?", (now,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM fetch_cache").fetchone()[0]
+        evicted = 0
+        while total > self.max_bytes:
+            rows = self.conn.execute(
+                """SELECT rowid, size FROM fetch_cache ORDER BY last_access LIMIT 256"""
+            ).fetchall()
+            if not rows:
+                break
+            drop = []
+            for rowid, size in rows:
+                if total <= self.max_bytes:
+                    break
+                drop.append((rowid,))
+                total -= size
+            self.conn.executemany("DELETE FROM fetch_cache WHERE rowid = ?", drop)
+            evicted += len(drop)
+        self.conn.commit()
+        if evicted:
+            logger.debug(f"Evicted {evicted} fetch cache entries")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries, negative, size = self.conn.execute(
+                """SELECT COUNT(*), COALESCE(SUM(payload IS NULL), 0), COALESCE(SUM(size), 0)
+                   FROM fetch_cache"""
+            ).fetchone()
+        return {'entries': entries, 'negative': negative, 'bytes': size, 'max_bytes': self.max_bytes}
+
+    def close(self):
+        self.conn.close()
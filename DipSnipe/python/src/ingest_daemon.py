@@ -0,0 +1,628 @@
+"""
+Resident ingestion service. One long-lived process keeps its imports,
+database connection and market data client (HTTP session, fetch cache,
+circuit breakers) warm between runs, and:
+  - runs the EOD ingestion once each trading day's close plus
+    daemon.eod_delay_minutes has passed, catching up on startup if the
+    latest one was missed
+  - optionally refreshes provisional intraday metrics every
+    daemon.live_interval_minutes while the market is open
+  - takes on-demand backfill (or EOD / live) runs over a localhost HTTP
+    control endpoint, which also reports every job's state and duration
+
+Jobs are kept in the daemon_jobs table and run one at a time, EOD first,
+so a restarted daemon picks up where it stopped. A scheduled EOD run that
+fails is queued again with exponential backoff, up to daemon.max_attempts.
+
+Usage: python ingest_daemon.py serve [--simulate]
+       python ingest_daemon.py backfill --from YYYY-MM-DD [--to YYYY-MM-DD] [TICKER ...]
+       python ingest_daemon.py eod YYYY-MM-DD [TICKER ...]
+       python ingest_daemon.py jobs [ID]
+"""
+import argparse
+import json
+import logging
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date, datetime, time as clock_time, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import requests
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from compute_metrics import LAST_SUCCESS, backfill_range, process_universe, refresh_live
+from config_loader import load_config
+from database import Database
+from providers import client_from_config
+from telemetry import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY
+from trading_calendar import is_trading_day
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first; within a priority, oldest first
+PRIORITY = {'eod': 0, 'live': 1, 'backfill': 2}
+# compute_metrics' run modes, for dipsnipe_pipeline_last_run_success
+RUN_MODES = {'eod': 'daily', 'live': 'live', 'backfill': 'backfill'}
+
+JOBS = REGISTRY.counter(
+    'dipsnipe_daemon_jobs_total', 'Daemon job runs, by kind and outcome (done, retried, failed)',
+    ('kind', 'outcome'))
+JOB_SECONDS = REGISTRY.histogram(
+    'dipsnipe_daemon_job_duration_seconds', 'Wall time of each daemon job', ('kind',),
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200))
+
+Job = Dict[str, Any]
+
+
+def _clock(value) -> clock_time:
+    """'HH:MM' from the config -> time"""
+    hours, minutes = str(value).split(':')
+    return clock_time(int(hours), int(minutes))
+
+
+def _utc_text(moment: datetime) -> str:
+    """An aware datetime in SQLite's datetime('now') format"""
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def daemon_options(config: dict) -> Dict[str, Any]:
+    daemon = config.get('daemon', {})
+    return {
+        'host': daemon.get('host', '127.0.0.1'),
+        'port': int(daemon.get('port', 8081)),
+        'tz': ZoneInfo(daemon.get('timezone', 'America/New_York')),
+        'market_open': _clock(daemon.get('market_open', '09:30')),
+        'market_close': _clock(daemon.get('market_close', '16:00')),
+        'eod_delay': timedelta(minutes=daemon.get('eod_delay_minutes', 30)),
+        # Zero disables the intraday refreshes
+        'live_interval': timedelta(minutes=daemon.get('live_interval_minutes', 0)),
+        # Upper bound on one scheduler sleep, so clock jumps are noticed
+        'max_sleep': daemon.get('max_sleep_seconds', 300),
+        # Tries of a scheduled EOD run, the first retry after retry_backoff
+        'max_attempts': int(daemon.get('max_attempts', 4)),
+        'retry_backoff': timedelta(minutes=daemon.get('retry_backoff_minutes', 10)),
+    }
+
+
+class DaemonJobs:
+    """
+    daemon_jobs rows move queued -> running -> done or failed. A scheduled
+    job carries a slot name and is only ever queued once per slot; on-demand
+    jobs have none. Jobs found running when the daemon starts were cut short
+    by its last exit and are queued again: every run mode resumes where it
+    stopped. A failed job may instead be queued again with a retry_at
+    before which it is not claimed.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def submit(self, kind: str, args: dict, slot: str = None) -> Optional[int]:
+        """Queue a job and return its id, or None if its slot was already queued"""
+        # The scheduler asks on every wakeup; don't take the write lock to learn nothing
+        if slot and self.db.conn.execute(
+                "SELECT 1 FROM daemon_jobs WHERE slot = ?", (slot,)).fetchone():
+            return None
+        with self.db.batch():
+            cur = self.db.conn.execute(
+                """INSERT OR IGNORE INTO daemon_jobs (kind, slot, args, priority, state, requested_at)
+                   VALUES (?, ?, ?, ?, 'queued', datetime('now'))""",
+                (kind, slot, json.dumps(args), PRIORITY[kind])
+            )
+            return cur.lastrowid if cur.rowcount else None
+
+    def claim(self, now: datetime) -> Optional[Job]:
+        """Mark the next queued job that may start at now running and return it"""
+        with self.db.batch():
+            row = self.db.conn.execute(
+                """SELECT id FROM daemon_jobs
+                   WHERE state = 'queued' AND (retry_at IS NULL OR retry_at <= ?)
+                   ORDER BY priority, id LIMIT 1""",
+                (_utc_text(now),)
+            ).fetchone()
+            if row is None:
+                return None
+            self.db.conn.execute(
+                """UPDATE daemon_jobs
+                   SET state = 'running', started_at = datetime('now'), attempts = attempts + 1
+                   WHERE id = ?""",
+                (row[0],)
+            )
+        return self.get(row[0])
+
+    def finish(self, job_id: int, seconds: float, stats: dict = None, error: str = None,
+               retry_at: datetime = None):
+        """
+        Record a job's outcome: done with its run stats, or failed with
+        error, or with error and retry_at, queued again to start no sooner
+        """
+        if error and retry_at:
+            state = 'queued'
+        else:
+            state = 'failed' if error else 'done'
+        with self.db.batch():
+            self.db.conn.execute(
+                """UPDATE daemon_jobs
+                   SET state = ?, finished_at = datetime('now'), duration_seconds = ?,
+                       stats = ?, error = ?, retry_at = ?
+                   WHERE id = ?""",
+                (state, seconds, json.dumps(stats) if stats is not None else None, error,
+                 _utc_text(retry_at) if state == 'queued' else None, job_id)
+            )
+
+    def next_retry(self) -> Optional[datetime]:
+        """When the earliest job waiting to be retried may start"""
+        row = self.db.conn.execute(
+            "SELECT MIN(retry_at) FROM daemon_jobs WHERE state = 'queued' AND retry_at IS NOT NULL"
+        ).fetchone()
+        if row[0] is None:
+            return None
+        return datetime.fromisoformat(row[0]).replace(tzinfo=timezone.utc)
+
+    def requeue_interrupted(self) -> int:
+        """Queue again the jobs a previous daemon left running"""
+        with self.db.batch():
+            cur = self.db.conn.execute(
+                """UPDATE daemon_jobs SET state = 'queued', started_at = NULL
+                   WHERE state = 'running'"""
+            )
+            return cur.rowcount
+
+    def active(self, kind: str) -> bool:
+        """Whether a job of this kind is queued or running"""
+        row = self.db.conn.execute(
+            "SELECT 1 FROM daemon_jobs WHERE state IN ('queued', 'running') AND kind = ? LIMIT 1",
+            (kind,)
+        ).fetchone()
+        return row is not None
+
+    def counts(self) -> Dict[str, int]:
+        """Jobs by state"""
+        counts = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+        counts.update({row[0]: row[1] for row in self.db.conn.execute(
+            "SELECT state, COUNT(*) FROM daemon_jobs GROUP BY state")})
+        return counts
+
+    def get(self, job_id: int) -> Optional[Job]:
+        row = self.db.conn.execute("SELECT * FROM daemon_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._record(row) if row else None
+
+    def recent(self, limit: int = 50, state: str = None) -> List[Job]:
+        """Latest jobs first, optionally only those in one state"""
+        if state:
+            rows = self.db.conn.execute(
+                "SELECT * FROM daemon_jobs WHERE state = ? ORDER BY id DESC LIMIT ?", (state, limit))
+        else:
+            rows = self.db.conn.execute(
+                "SELECT * FROM daemon_jobs ORDER BY id DESC LIMIT ?", (limit,))
+        return [self._record(row) for row in rows.fetchall()]
+
+    @staticmethod
+    def _record(row) -> Job:
+        job = dict(row)
+        job['args'] = json.loads(job['args'])
+        job['stats'] = json.loads(job['stats']) if job['stats'] else None
+        return job
+
+
+class Scheduler:
+    """
+    When scheduled runs fall due, in the market's time zone. Only
+    datetime arithmetic: the daemon asks it what is due at `now` and how
+    long it may sleep.
+    """
+
+    # How far to look for the previous / next trading day
+    _HORIZON = 14
+
+    def __init__(self, options: Dict[str, Any]):
+        self.tz = options['tz']
+        self.market_open = options['market_open']
+        self.market_close = options['market_close']
+        self.eod_delay = options['eod_delay']
+        self.live_interval = options['live_interval']
+
+    def eod_time(self, day: date) -> datetime:
+        """When day's EOD run falls due"""
+        return datetime.combine(day, self.market_close, tzinfo=self.tz) + self.eod_delay
+
+    def last_eod(self, now: datetime) -> Optional[date]:
+        """The latest trading day whose EOD run is due by now"""
+        today = now.astimezone(self.tz).date()
+        for back in range(self._HORIZON):
+            day = today - timedelta(days=back)
+            if is_trading_day(day) and self.eod_time(day) <= now:
+                return day
+        return None
+
+    def next_eod(self, now: datetime) -> Optional[datetime]:
+        """When the next EOD run after now falls due"""
+        today = now.astimezone(self.tz).date()
+        for ahead in range(self._HORIZON):
+            day = today + timedelta(days=ahead)
+            if is_trading_day(day) and self.eod_time(day) > now:
+                return self.eod_time(day)
+        return None
+
+    def _session(self, day: date) -> Tuple[datetime, datetime]:
+        return (datetime.combine(day, self.market_open, tzinfo=self.tz),
+                datetime.combine(day, self.market_close, tzinfo=self.tz))
+
+    def live_slot(self, now: datetime) -> Optional[datetime]:
+        """Start of the intraday refresh slot now falls in, if refreshes are on and the market is open"""
+        if not self.live_interval:
+            return None
+        day = now.astimezone(self.tz).date()
+        opens, closes = self._session(day)
+        if not is_trading_day(day) or not opens <= now < closes:
+            return None
+        return opens + (now - opens) // self.live_interval * self.live_interval
+
+    def next_live(self, now: datetime) -> Optional[datetime]:
+        """Start of the next intraday refresh slot after now"""
+        if not self.live_interval:
+            return None
+        today = now.astimezone(self.tz).date()
+        for ahead in range(self._HORIZON):
+            day = today + timedelta(days=ahead)
+            if not is_trading_day(day):
+                continue
+            opens, closes = self._session(day)
+            if now < opens:
+                return opens
+            if now < closes:
+                following = opens + ((now - opens) // self.live_interval + 1) * self.live_interval
+                if following < closes:
+                    return following
+        return None
+
+    def due(self, now: datetime) -> List[Tuple[str, str, dict]]:
+        """(kind, slot, args) of the scheduled jobs due at now"""
+        jobs = []
+        eod_day = self.last_eod(now)
+        if eod_day:
+            jobs.append(('eod', f"eod:{eod_day.isoformat()}", {'date': eod_day.isoformat()}))
+        slot = self.live_slot(now)
+        if slot:
+            jobs.append(('live', f"live:{slot.isoformat(timespec='minutes')}",
+                         {'date': slot.date().isoformat()}))
+        return jobs
+
+    def next_wakeup(self, now: datetime) -> Optional[datetime]:
+        upcoming = [t for t in (self.next_eod(now), self.next_live(now)) if t]
+        return min(upcoming) if upcoming else None
+
+
+def parse_job(kind: str, body: dict, today: date) -> dict:
+    """
+    Validated args for an on-demand job, from a control request body.
+    Raises ValueError when they don't describe a run.
+    """
+    if kind not in PRIORITY:
+        raise ValueError(f"unknown job kind {kind!r}")
+    tickers = body.get('tickers') or []
+    if not isinstance(tickers, list) or not all(isinstance(t, str) and t for t in tickers):
+        raise ValueError("tickers must be a list of symbols")
+    args = {'tickers': [t.upper() for t in tickers]} if tickers else {}
+
+    if kind == 'backfill':
+        if not body.get('start'):
+            raise ValueError("backfill needs a start date")
+        start = date.fromisoformat(body['start'])
+        end = date.fromisoformat(body['end']) if body.get('end') else start
+        if end < start:
+            raise ValueError("end is before start")
+        if end > today:
+            raise ValueError("cannot backfill future dates")
+        args.update(start=start.isoformat(), end=end.isoformat())
+    else:
+        day = date.fromisoformat(body['date']) if body.get('date') else today
+        if day > today:
+            raise ValueError("cannot ingest a future date")
+        args['date'] = day.isoformat()
+    return args
+
+
+class IngestDaemon:
+    """
+    Runs the job loop on the calling thread and the control endpoint on a
+    background thread. Each side has its own connection: runs write through
+    self.db; the endpoint queues and reads jobs through self.control,
+    serialized by a lock.
+    """
+
+    def __init__(self, config: dict, simulate: bool = False, clock=None):
+        self.config = config
+        self.options = daemon_options(config)
+        self.scheduler = Scheduler(self.options)
+        self.simulate = simulate
+        self.clock = clock or (lambda: datetime.now(self.options['tz']))
+        self.db = Database(config['database'])
+        self.control_db = Database(config['database'])
+        self.jobs = DaemonJobs(self.db)
+        self.control = DaemonJobs(self.control_db)
+        self.client = None
+        self.running = None
+        self._control_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._server = None
+
+    def open(self):
+        """Connect, requeue interrupted jobs and build the market data client"""
+        self.db.connect()
+        self.control_db.connect()
+        requeued = self.jobs.requeue_interrupted()
+        if requeued:
+            logger.info(f"Requeued {requeued} jobs interrupted by the last shutdown")
+        tickers = self._universe(None)
+        # Built once: its session, rate limiter, fetch cache and breakers
+        # carry over from run to run
+        self.client = client_from_config(
+            self.config, simulate=self.simulate,
+            sectors={t['ticker']: t.get('sector') for t in tickers}
+        )
+
+    def close(self):
+        self.stop()
+        self.db.close()
+        self.control_db.close()
+
+    def today(self) -> date:
+        return self.clock().astimezone(self.options['tz']).date()
+
+    def submit(self, kind: str, args: dict, slot: str = None) -> Optional[int]:
+        """Queue a job from any thread and wake the job loop"""
+        with self._control_lock:
+            job_id = self.control.submit(kind, args, slot)
+        self._wake.set()
+        return job_id
+
+    def schedule(self, now: datetime = None) -> List[int]:
+        """Queue the scheduled jobs due at now; returns the ids of new ones"""
+        now = now or self.clock()
+        queued = []
+        for kind, slot, args in self.scheduler.due(now):
+            # A refresh still waiting or running covers this slot too
+            if kind == 'live' and self.jobs.active('live'):
+                continue
+            job_id = self.jobs.submit(kind, args, slot)
+            if job_id:
+                logger.info(f"Scheduled {kind} job {job_id} ({slot})")
+                queued.append(job_id)
+        return queued
+
+    def run_pending(self) -> int:
+        """Run queued jobs until none are left (or the daemon stops); returns how many ran"""
+        ran = 0
+        while not self._stopping.is_set():
+            self.schedule()
+            job = self.jobs.claim(self.clock())
+            if job is None:
+                return ran
+            self.run_job(job)
+            ran += 1
+        return ran
+
+    def _universe(self, tickers: Optional[List[str]]) -> List[dict]:
+        if tickers:
+            return [{'ticker': t} for t in tickers]
+        return self.db.get_filtered_tickers(
+            min_market_cap=self.config['universe']['min_market_cap'])
+
+    def run_job(self, job: Job):
+        kind, args = job['kind'], job['args']
+        logger.info(f"Running {kind} job {job['id']}: {args}")
+        self.running = job['id']
+        started = time.monotonic()
+        stats = error = None
+        try:
+            tickers = self._universe(args.get('tickers'))
+            if kind == 'backfill':
+                stats = backfill_range(self.db, self.client, tickers, date.fromisoformat(args['start']),
+                                       date.fromisoformat(args['end']), self.config)
+            elif kind == 'live':
+                stats = refresh_live(self.db, self.client, tickers,
+                                     date.fromisoformat(args['date']), self.config)
+            else:
+                stats = process_universe(self.db, self.client, tickers,
+                                         date.fromisoformat(args['date']), self.config)
+        except Exception as e:
+            logger.exception(f"{kind} job {job['id']} failed")
+            error = f"{type(e).__name__}: {e}"
+            if self.db.conn.in_transaction:
+                self.db.conn.rollback()
+        seconds = time.monotonic() - started
+        retry_at = self._retry_at(job) if error else None
+        self.jobs.finish(job['id'], seconds, stats, error, retry_at)
+        self.running = None
+
+        outcome = 'retried' if retry_at else 'failed' if error else 'done'
+        JOBS.inc(kind=kind, outcome=outcome)
+        JOB_SECONDS.observe(seconds, kind=kind)
+        LAST_SUCCESS.set(int(error is None), mode=RUN_MODES[kind])
+        textfile = self.config.get('metrics', {}).get('textfile')
+        if textfile:
+            REGISTRY.write_textfile(textfile)
+        logger.info(f"{kind} job {job['id']} {outcome} in {seconds:.1f}s "
+                    f"(attempt {job['attempts']})")
+        if retry_at:
+            logger.info(f"Retrying {kind} job {job['id']} at {retry_at.isoformat(timespec='seconds')}")
+
+    def _retry_at(self, job: Job) -> Optional[datetime]:
+        """
+        When a failed job should run again: scheduled EOD runs back off
+        retry_backoff, doubling per attempt, until max_attempts; other jobs
+        are not retried (the next live slot supersedes a refresh, and
+        on-demand runs are resubmitted by whoever asked)
+        """
+        if job['kind'] != 'eod' or not job['slot'] or job['attempts'] >= self.options['max_attempts']:
+            return None
+        return self.clock() + self.options['retry_backoff'] * 2 ** (job['attempts'] - 1)
+
+    def next_wakeup(self, now: datetime) -> Optional[datetime]:
+        """The next scheduled slot or job retry, whichever comes first"""
+        upcoming = [t for t in (self.scheduler.next_wakeup(now), self.jobs.next_retry()) if t]
+        return min(upcoming) if upcoming else None
+
+    def status(self) -> dict:
+        now = self.clock()
+        next_eod = self.scheduler.next_eod(now)
+        with self._control_lock:
+            counts = self.control.counts()
+            next_retry = self.control.next_retry()
+        upcoming = [t for t in (self.scheduler.next_wakeup(now), next_retry) if t]
+        wakeup = min(upcoming) if upcoming else None
+        return {
+            'status': 'running',
+            'running_job': self.running,
+            'jobs': counts,
+            'simulate': self.simulate,
+            'now': now.isoformat(timespec='seconds'),
+            'next_eod': next_eod.isoformat(timespec='seconds') if next_eod else None,
+            'next_retry': next_retry.isoformat(timespec='seconds') if next_retry else None,
+            'next_wakeup': wakeup.isoformat(timespec='seconds') if wakeup else None,
+        }
+
+    def start_control(self):
+        """Serve the control endpoint on a background thread"""
+        self._server = make_server(self.options['host'], self.options['port'],
+                                   control_app(self), threaded=True)
+        threading.Thread(target=self._server.serve_forever, name='daemon-control',
+                         daemon=True).start()
+        logger.info(f"Control endpoint on http://{self.options['host']}:{self._server.port}")
+
+    def serve_forever(self):
+        """Run jobs as they are scheduled or requested until stop()"""
+        self.start_control()
+        while not self._stopping.is_set():
+            self.run_pending()
+            now = self.clock()
+            wakeup = self.next_wakeup(now)
+            sleep = self.options['max_sleep']
+            if wakeup:
+                sleep = min(sleep, max((wakeup - now).total_seconds(), 0.0))
+            self._wake.wait(sleep)
+            self._wake.clear()
+
+    def stop(self):
+        """Stop after the running job; an interrupted one is requeued at the next start"""
+        self._stopping.set()
+        self._wake.set()
+        if self._server:
+            self._server.shutdown()
+            self._server = None
+
+
+def control_app(daemon: IngestDaemon) -> Flask:
+    """The daemon's localhost control endpoint"""
+    app = Flask(__name__)
+
+    @app.route('/health', methods=['GET'])
+    def health():
+        return jsonify(daemon.status())
+
+    @app.route('/jobs', methods=['GET'])
+    def list_jobs():
+        limit = min(request.args.get('limit', 50, type=int), 1000)
+        with daemon._control_lock:
+            jobs = daemon.control.recent(limit, request.args.get('state'))
+        return jsonify({'jobs': jobs, 'count': len(jobs)})
+
+    @app.route('/jobs/<int:job_id>', methods=['GET'])
+    def get_job(job_id):
+        with daemon._control_lock:
+            job = daemon.control.get(job_id)
+        if job is None:
+            return jsonify({'error': f"no job {job_id}"}), 404
+        return jsonify(job)
+
+    @app.route('/jobs/<kind>', methods=['POST'])
+    def submit_job(kind):
+        try:
+            args = parse_job(kind, request.get_json(silent=True) or {}, daemon.today())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        try:
+            job_id = daemon.submit(kind, args)
+        except sqlite3.OperationalError as e:
+            # The writer holds the database for longer than busy_timeout
+            return jsonify({'error': f"database busy, retry: {e}"}), 503
+        with daemon._control_lock:
+            job = daemon.control.get(job_id)
+        return jsonify(job), 202
+
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+    return app
+
+
+def serve_main(simulate: bool):
+    daemon = IngestDaemon(load_config(), simulate=simulate)
+    signal.signal(signal.SIGTERM, lambda *_: daemon.stop())
+    try:
+        daemon.open()
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Interrupted, shutting down")
+    finally:
+        daemon.close()
+
+
+def client_main(args):
+    """The backfill / eod / jobs subcommands: talk to a running daemon"""
+    options = daemon_options(load_config())
+    base = f"http://{options['host']}:{options['port']}"
+    try:
+        if args.command == 'jobs':
+            path = f"/jobs/{args.id}" if args.id else "/jobs"
+            response = requests.get(base + path, timeout=10)
+        else:
+            body = {'tickers': args.tickers}
+            if args.command == 'backfill':
+                body.update(start=args.start, end=args.end)
+            else:
+                body['date'] = args.date
+            response = requests.post(f"{base}/jobs/{args.command}", json=body, timeout=60)
+    except requests.ConnectionError:
+        print(f"Error: no ingestion daemon listening on {base}")
+        sys.exit(1)
+    print(json.dumps(response.json(), indent=2))
+    if not response.ok:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident ingestion daemon and its client.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help="run the daemon in the foreground")
+    serve.add_argument('--simulate', action='store_true',
+                       help="use simulated bars instead of Yahoo (offline runs and load tests)")
+    backfill = commands.add_parser('backfill', help="ask the daemon to backfill a date range")
+    backfill.add_argument('--from', dest='start', required=True, help="first date (YYYY-MM-DD)")
+    backfill.add_argument('--to', dest='end', help="last date (default: --from)")
+    backfill.add_argument('tickers', nargs='*')
+    eod = commands.add_parser('eod', help="ask the daemon to (re)run one date's EOD ingestion")
+    eod.add_argument('date', help="YYYY-MM-DD")
+    eod.add_argument('tickers', nargs='*')
+    jobs = commands.add_parser('jobs', help="recent jobs, or one job's status")
+    jobs.add_argument('id', nargs='?', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve_main(args.simulate)
+    else:
+        client_main(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Multi-process ingestion: worker processes drain the ingest_jobs queue"""
+import logging
+import multiprocessing
+import os
+import socket
+import time
+from datetime import date
+from multiprocessing import forkserver
+from typing import Dict, List
+
+from database import Database
+from job_queue import JobQueue
+from metrics import compute_drawdown_metrics_many
+from providers import client_from_config
+from ranks import refresh_ranks
+from rolling import update_rolling
+
+logger = logging.getLogger(__name__)
+
+
+def _queue_options(config: dict) -> Dict:
+    ingest = config.get('ingest', {})
+    return {
+        'batch_size': ingest.get('batch_size', 100),
+        'lease_seconds': ingest.get('lease_seconds', 300),
+        'max_attempts': ingest.get('max_attempts', 3),
+        'poll_seconds': ingest.get('poll_seconds', 1.0),
+    }
+
+
+def _process_day(db, queue, client, owner, tickers: List[str], day: date) -> Dict[str, int]:
+    """Compute one day's claimed tickers and commit them with their done markers"""
+    jobs = [(ticker, day) for ticker in tickers]
+    try:
+        cached = db.get_intraday_bars_many(tickers, day)
+        to_fetch = [t for t in tickers if t not in cached]
+        sources = dict.fromkeys(cached, 'cache')
+        fetched = client.get_intraday_bars_bulk(to_fetch, day, sources=sources) if to_fetch else {}
+        computed = compute_drawdown_metrics_many({**cached, **fetched})
+    except Exception as e:
+        logger.warning(f"{owner}: {len(jobs)} jobs for {day} failed: {e}")
+        queue.fail(owner, jobs, repr(e))
+        return {'done': 0, 'failed': len(jobs)}
+
+    ok = [job for job in jobs if computed.get(job[0])]
+    with db.batch():
+        # Fenced on the lease: a job another worker has reclaimed is not
+        # ours to write any more, so its metrics are dropped here
+        won = {ticker for ticker, _ in queue.complete(owner, ok)}
+        db.save_metrics_many([
+            (ticker, day, computed[ticker], sources[ticker])
+            for ticker in tickers if ticker in won
+        ])
+        db.save_bars_many({t: bars for t, bars in fetched.items() if t in won})
+
+    missing = [job for job in jobs if not computed.get(job[0])]
+    queue.fail(owner, missing, "no bars")
+    return {'done': len(won), 'failed': len(missing)}
+
+
+def work(db, client, start: date, end: date, options: Dict, owner: str = None) -> Dict[str, int]:
+    """
+    Claim, compute and complete jobs dated in [start, end] until none are
+    pending or leased. While other workers hold the last leases, poll so
+    any that expire are picked up here.
+    """
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+    queue = JobQueue(db, max_attempts=options['max_attempts'])
+    stats = {'done': 0, 'failed': 0}
+
+    while True:
+        jobs = queue.claim(owner, options['batch_size'], options['lease_seconds'], start, end)
+        if not jobs:
+            counts = queue.counts(start, end)
+            if counts['pending'] + counts['leased'] == 0:
+                break
+            time.sleep(options['poll_seconds'])
+            continue
+
+        by_day = {}
+        for ticker, day in jobs:
+            by_day.setdefault(day, []).append(ticker)
+        for day, tickers in by_day.items():
+            for key, value in _process_day(db, queue, client, owner, tickers, day).items():
+                stats[key] += value
+
+    logger.info(f"{owner}: {stats['done']} done, {stats['failed']} failed attempts")
+    return stats
+
+
+def _worker_main(config: dict, simulate: bool, sectors: Dict[str, str],
+                 rate_share: float, start: date, end: date):
+    """Entry point of one spawned worker process"""
+    logging.basicConfig(level=logging.INFO)
+    db = Database(config['database'])
+    try:
+        db.connect()
+        client = client_from_config(config, simulate, sectors, rate_share)
+        work(db, client, start, end, _queue_options(config))
+    finally:
+        db.close()
+
+
+def _worker_context():
+    """
+    Start workers from a forkserver that has already imported this module
+    (and with it pandas, yfinance and the pipeline), so each one starts in
+    milliseconds instead of importing everything afresh; the server is
+    kept for later runs. Plain spawn where forkserver is unavailable.
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    ctx = multiprocessing.get_context('forkserver')
+    ctx.set_forkserver_preload([__name__])
+    # The server does not inherit sys.path (before 3.13), only the
+    # environment, and a preload that fails to import is silently skipped
+    saved = os.environ.get('PYTHONPATH')
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    os.environ['PYTHONPATH'] = os.pathsep.join(path for path in (src_dir, saved) if path)
+    try:
+        forkserver.ensure_running()
+    finally:
+        if saved is None:
+            del os.environ['PYTHONPATH']
+        else:
+            os.environ['PYTHONPATH'] = saved
+    return ctx
+
+
+def run_workers(db, config: dict, tickers: List[Dict], days: List[date],
+                n_workers: int, simulate: bool = False) -> Dict[str, int]:
+    """
+    Queue every missing (ticker, day) and drain the queue with n_workers
+    processes, each with its own connection, client and 1/n_workers of the
+    rate limit. Jobs left by an interrupted run are resumed, not redone.
+    Returns the queue's per-state counts for the range (all zero if days
+    is empty, e.g. a range of weekends and holidays).
+    """
+    if not days:
+        logger.info("No trading days in range; nothing to queue")
+        return {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+    start, end = min(days), max(days)
+    names = [t['ticker'] for t in tickers]
+    have = db.get_metric_keys(start, end)
+    queue = JobQueue(db, max_attempts=_queue_options(config)['max_attempts'])
+    queued = queue.enqueue((t, day) for day in days for t in names if (t, day) not in have)
+    logger.info(f"Queued {queued} jobs; {len(have)} (ticker, date) pairs already computed")
+
+    sectors = {t['ticker']: t.get('sector') for t in tickers}
+    ctx = _worker_context()
+    procs = [
+        ctx.Process(target=_worker_main, name=f"ingest-worker-{i}",
+                    args=(config, simulate, sectors, 1.0 / n_workers, start, end))
+        for i in range(n_workers)
+    ]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+        if proc.exitcode:
+            logger.error(f"{proc.name} exited with code {proc.exitcode}")
+
+    for day in days:
+        db.refresh_daily_snapshot(day)
+        refresh_ranks(db, day)
+    update_rolling(db, start, config)
+
+    counts = queue.counts(start, end)
+    for ticker, day, attempts, error in queue.errors(start, end):
+        logger.warning(f"Failed {ticker} {day} after {attempts} attempts: {error}")
+    logger.info(f"Job states: {counts}")
+    return counts
@@ -0,0 +1,149 @@
+"""Durable (ticker, date) work queue in the SQLite database, leased to worker processes"""
+import logging
+import time
+from datetime import date
+from typing import Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+Job = Tuple[str, date]
+
+
+class JobQueue:
+    """
+    ingest_jobs rows move pending -> leased -> done, or back to pending
+    with last_error recorded when an attempt fails, until max_attempts
+    have been used and the job is parked as failed.
+
+    A claim leases a batch to one owner until lease_expiry; leases of
+    workers that died are reclaimed by the next claim once they expire.
+    complete() only succeeds for the current lease holder and runs inside
+    the caller's transaction, so a job's metrics are written together with
+    its done marker, by exactly one worker.
+    """
+
+    def __init__(self, db, max_attempts: int = 3):
+        self.db = db
+        self.max_attempts = max_attempts
+
+    def enqueue(self, jobs: Iterable[Job]) -> int:
+        """
+        Add jobs as pending and return how many were new or re-armed.
+        Jobs already queued keep their state, except failed ones, which
+        get a fresh set of attempts.
+        """
+        rows = [(ticker, day.isoformat()) for ticker, day in jobs]
+        if not rows:
+            return 0
+        with self.db.batch():
+            before = self.db.conn.total_changes
+            self.db.conn.executemany(
+                """INSERT INTO ingest_jobs (ticker, date, state, attempts, updated_at)
+                   VALUES (?, ?, 'pending', 0, datetime('now'))
+                   ON CONFLICT(ticker, date) DO UPDATE SET
+                       state = 'pending', attempts = 0, last_error = NULL,
+                       updated_at = datetime('now')
+                   WHERE state = 'failed'""",
+                rows
+            )
+            return self.db.conn.total_changes - before
+
+    def claim(self, owner: str, limit: int, lease_seconds: float,
+              start: date, end: date) -> List[Job]:
+        """
+        Lease up to limit pending (or expired) jobs dated in [start, end]
+        to owner, oldest date first. Expired leases that already used every
+        attempt are parked as failed instead.
+        """
+        now = time.time()
+        conn = self.db.conn
+        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                """UPDATE ingest_jobs
+                   SET state = 'failed', lease_owner = NULL, updated_at = datetime('now'),
+                       last_error = COALESCE(last_error, 'lease expired')
+                   WHERE state = 'leased' AND lease_expiry < ? AND attempts >= ?""",
+                (now, self.max_attempts)
+            )
+            rows = conn.execute(
+                """SELECT ticker, date FROM ingest_jobs
+                   WHERE (state = 'pending' OR (state = 'leased' AND lease_expiry < ?))
+                     AND date BETWEEN ? AND ?
+                   ORDER BY date, ticker
+                   LIMIT ?""",
+                (now, start.isoformat(), end.isoformat(), limit)
+            ).fetchall()
+            conn.executemany(
+                """UPDATE ingest_jobs
+                   SET state = 'leased', attempts = attempts + 1, lease_owner = ?,
+                       lease_expiry = ?, updated_at = datetime('now')
+                   WHERE ticker = ? AND date = ?""",
+                [(owner, now + lease_seconds, row[0], row[1]) for row in rows]
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return [(row[0], date.fromisoformat(row[1])) for row in rows]
+
+    def complete(self, owner: str, jobs: Iterable[Job]) -> List[Job]:
+        """
+        Mark jobs done if owner still holds their lease and return those
+        that were. Call inside Database.batch() together with the writes
+        for the same jobs, so both commit or neither does.
+        """
+        jobs = list(jobs)
+        won = []
+        with self.db.batch():
+            for ticker, day in jobs:
+                cur = self.db.conn.execute(
+                    """UPDATE ingest_jobs
+                       SET state = 'done', lease_expiry = NULL, last_error = NULL,
+                           updated_at = datetime('now')
+                       WHERE ticker = ? AND date = ? AND state = 'leased' AND lease_owner = ?""",
+                    (ticker, day.isoformat(), owner)
+                )
+                if cur.rowcount:
+                    won.append((ticker, day))
+        lost = len(jobs) - len(won)
+        if lost:
+            logger.warning(f"{owner} lost {lost} leases before completing them")
+        return won
+
+    def fail(self, owner: str, jobs: Iterable[Job], error: str):
+        """Record error for owner's leased jobs; retry them later or park them as failed"""
+        rows = [(error, self.max_attempts, ticker, day.isoformat(), owner) for ticker, day in jobs]
+        if not rows:
+            return
+        with self.db.batch():
+            self.db.conn.executemany(
+                """UPDATE ingest_jobs
+                   SET last_error = ?, lease_owner = NULL, lease_expiry = NULL,
+                       state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                       updated_at = datetime('now')
+                   WHERE ticker = ? AND date = ? AND state = 'leased' AND lease_owner = ?""",
+                rows
+            )
+
+    def counts(self, start: date, end: date) -> Dict[str, int]:
+        """Jobs dated in [start, end] by state"""
+        cur = self.db.conn.execute(
+            """SELECT state, COUNT(*) FROM ingest_jobs
+               WHERE date BETWEEN ? AND ? GROUP BY state""",
+            (start.isoformat(), end.isoformat())
+        )
+        counts = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        counts.update({row[0]: row[1] for row in cur.fetchall()})
+        return counts
+
+    def errors(self, start: date, end: date, limit: int = 20) -> List[Tuple[str, date, int, str]]:
+        """(ticker, date, attempts, last_error) of failed jobs dated in [start, end]"""
+        cur = self.db.conn.execute(
+            """SELECT ticker, date, attempts, last_error FROM ingest_jobs
+               WHERE state = 'failed' AND date BETWEEN ? AND ?
+               ORDER BY date, ticker LIMIT ?""",
+            (start.isoformat(), end.isoformat(), limit)
+        )
+        return [(r[0], date.fromisoformat(r[1]), r[2], r[3]) for r in cur.fetchall()]
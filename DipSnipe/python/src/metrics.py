@@ -4,7 +4,13 @@ Tracks which stocks closed negative for the day
 """
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+
+# Keys produced by compute_drawdown_metrics and its batch counterparts
+_METRIC_KEYS = (
+    'max_drawdown_pct', 'drawdown_time', 'recovery_pct', 'day_return_pct',
+    'open_price', 'close_price', 'intraday_low', 'intraday_high'
+)
 
 def compute_drawdown_metrics(bars: List[Dict]) -> Optional[Dict]:
     """
@@ -52,3 +58,172 @@ def compute_drawdown_metrics(bars: List[Dict]) -> Optional[Dict]:
         'intraday_low': float(intraday_low),
         'intraday_high': float(intraday_high)
     }
+
+
+def pack_bars(bars_by_ticker: Dict[str, List[Dict]]) -> Tuple[List[str], Dict[str, np.ndarray], np.ndarray]:
+    """
+    Flatten {ticker: bars} into contiguous arrays for the batch kernel.
+    
+    Returns (tickers, columns, offsets): columns holds 'timestamp', 'open',
+    'high', 'low' and 'close' arrays with each ticker's bars sorted by time,
+    and offsets[i] is where tickers[i]'s bars start. Tickers without bars
+    are left out.
+    """
+    tickers = []
+    offsets = []
+    rows = []
+    for ticker, bars in bars_by_ticker.items():
+        if not bars:
+            continue
+        tickers.append(ticker)
+        offsets.append(len(rows))
+        rows.extend(sorted(bars, key=lambda b: b['timestamp']))
+    
+    columns = {
+        'timestamp': np.array([b['timestamp'] for b in rows], dtype=object),
+        'open': np.array([b['open'] for b in rows], dtype=np.float64),
+        'high': np.array([b['high'] for b in rows], dtype=np.float64),
+        'low': np.array([b['low'] for b in rows], dtype=np.float64),
+        'close': np.array([b['close'] for b in rows], dtype=np.float64),
+    }
+    return tickers, columns, np.array(offsets, dtype=np.intp)
+
+def compute_drawdown_metrics_batch(
+    timestamps: np.ndarray,
+    opens: np.ndarray,
+    highs: np.ndarray,
+    lows: np.ndarray,
+    closes: np.ndarray,
+    offsets: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """
+    Vectorized compute_drawdown_metrics for a whole universe at once.
+    
+    Bars for ticker i live in [offsets[i], offsets[i + 1]) and must already be
+    sorted by timestamp (see pack_bars). Returns one array per metric, in the
+    same order as offsets, with the same keys as compute_drawdown_metrics.
+    """
+    n = len(offsets)
+    if n == 0:
+        return {key: np.empty(0) for key in _METRIC_KEYS}
+    
+    ends = np.append(offsets[1:], len(opens))
+    counts = ends - offsets
+    
+    open_price = opens[offsets]
+    close_price = closes[ends - 1]
+    day_return_pct = ((close_price - open_price) / open_price) * 100
+    
+    # fmax/fmin skip NaN bars the way pandas max/min do
+    intraday_high = np.fmax.reduceat(highs, offsets)
+    intraday_low = np.fmin.reduceat(lows, offsets)
+    intraday_range_pct = ((intraday_high - intraday_low) / open_price) * 100
+    
+    # First bar in each segment that hits the segment low (matches idxmin);
+    # a segment whose lows are all NaN has no low bar and gets no time
+    positions = np.arange(len(lows))
+    at_low = lows == np.repeat(intraday_low, counts)
+    low_pos = np.minimum.reduceat(np.where(at_low, positions, len(lows)), offsets)
+    found = low_pos < len(lows)
+    drawdown_time = np.full(n, None, dtype=object)
+    drawdown_time[found] = timestamps[low_pos[found]]
+    
+    return {
+        'max_drawdown_pct': day_return_pct,
+        'drawdown_time': drawdown_time,
+        'recovery_pct': intraday_range_pct,
+        'day_return_pct': day_return_pct,
+        'open_price': open_price,
+        'close_price': close_price,
+        'intraday_low': intraday_low,
+        'intraday_high': intraday_high
+    }
+
+def compute_drawdown_metrics_many(bars_by_ticker: Dict[str, List[Dict]]) -> Dict[str, Dict]:
+    """Batch counterpart of compute_drawdown_metrics: {ticker: bars} -> {ticker: metrics}"""
+    tickers, cols, offsets = pack_bars(bars_by_ticker)
+    batch = compute_drawdown_metrics_batch(
+        cols['timestamp'], cols['open'], cols['high'], cols['low'], cols['close'], offsets
+    )
+    
+    results = {}
+    for i, ticker in enumerate(tickers):
+        results[ticker] = {
+            key: batch[key][i] if key == 'drawdown_time' else float(batch[key][i])
+            for key in _METRIC_KEYS
+        }
+    return results
+
+def _settle(state: Dict, bar: Dict):
+    """Fold one bar that can no longer change into the settled aggregates"""
+    if state['settled'] == 0:
+        state.update(open=bar['open'], high=bar['high'], low=bar['low'], low_time=bar['timestamp'])
+    else:
+        state['high'] = max(state['high'], bar['high'])
+        # Strictly lower only: the first bar to hit the low keeps it (idxmin)
+        if bar['low'] < state['low']:
+            state['low'] = bar['low']
+            state['low_time'] = bar['timestamp']
+    state['settled'] += 1
+
+def fold_running_state(state: Optional[Dict], bars: List[Dict]) -> Optional[Dict]:
+    """
+    Advance a ticker's running day state with freshly fetched bars, looking
+    only at bars from the latest one already seen onwards.
+    
+    The state keeps aggregates of the settled bars ('settled', 'open',
+    'high', 'low', 'low_time') and the latest bar on its own ('last_time',
+    'last_open', 'last_high', 'last_low', 'last_close'), because the
+    provider revises that bar until its interval closes. A fetched bar with
+    the same timestamp replaces it; a newer one settles it first. Returns
+    the state unchanged (the same object) when no bar is that recent.
+    """
+    if state is not None:
+        bars = [b for b in bars if b['timestamp'] >= state['last_time']]
+    if not bars:
+        return state
+    bars = sorted(bars, key=lambda b: b['timestamp'])
+    
+    if state is None:
+        new = {'settled': 0, 'open': None, 'high': None, 'low': None, 'low_time': None}
+    else:
+        new = dict(state)
+        if bars[0]['timestamp'] > state['last_time']:
+            _settle(new, {
+                'timestamp': state['last_time'], 'open': state['last_open'],
+                'high': state['last_high'], 'low': state['last_low']
+            })
+    for bar in bars[:-1]:
+        _settle(new, bar)
+    
+    last = bars[-1]
+    new.update(last_time=last['timestamp'], last_open=last['open'], last_high=last['high'],
+               last_low=last['low'], last_close=last['close'])
+    return new
+
+def running_metrics(state: Dict) -> Dict:
+    """compute_drawdown_metrics over every bar folded into a running state"""
+    if state['settled']:
+        open_price = state['open']
+        intraday_high = max(state['high'], state['last_high'])
+        if state['low'] <= state['last_low']:
+            intraday_low, low_time = state['low'], state['low_time']
+        else:
+            intraday_low, low_time = state['last_low'], state['last_time']
+    else:
+        open_price = state['last_open']
+        intraday_high = state['last_high']
+        intraday_low, low_time = state['last_low'], state['last_time']
+    close_price = state['last_close']
+    
+    day_return_pct = ((close_price - open_price) / open_price) * 100
+    return {
+        'max_drawdown_pct': float(day_return_pct),
+        'drawdown_time': low_time,
+        'recovery_pct': float(((intraday_high - intraday_low) / open_price) * 100),
+        'day_return_pct': float(day_return_pct),
+        'open_price': float(open_price),
+        'close_price': float(close_price),
+        'intraday_low': float(intraday_low),
+        'intraday_high': float(intraday_high)
+    }
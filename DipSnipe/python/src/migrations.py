@@ -0,0 +1,365 @@
+"""Versioned schema migrations for the SQLite database"""
+import logging
+import re
+import sqlite3
+from datetime import datetime
+from typing import Callable, Iterable, List, Tuple, Union
+
+from trading_calendar import to_utc
+
+logger = logging.getLogger(__name__)
+
+# A migration step is either one SQL statement or a callable taking the connection
+Step = Union[str, Callable[[sqlite3.Connection], None]]
+
+
+def _generation_triggers(tables=('tickers', 'intraday_metrics', 'intraday_bars')) -> List[str]:
+    """Triggers that bump data_generation on every write to the served tables"""
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_generation
+        AFTER {event} ON {table}
+        BEGIN
+            UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+        END"""
+        for table in tables
+        for event in ('INSERT', 'UPDATE', 'DELETE')
+    ]
+
+
+def _add_column(table: str, column: str, decl: str) -> Callable[[sqlite3.Connection], None]:
+    """ALTER TABLE ... ADD COLUMN that is a no-op if the column already exists"""
+    def step(conn: sqlite3.Connection):
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    return step
+
+
+def _utc_timestamps(table: str, column: str) -> Callable[[sqlite3.Connection], None]:
+    """
+    Rewrite column's ISO timestamps that are not UTC as UTC '+00:00'
+    strings, the format bars are written in; naive ones are exchange
+    time. A row whose rewritten key already exists duplicates that row
+    and is dropped.
+    """
+    def step(conn: sqlite3.Connection):
+        stale = [row[0] for row in conn.execute(
+            f"SELECT DISTINCT {column} FROM {table} WHERE {column} NOT LIKE '%+00:00'")]
+        if not stale:
+            return
+        conn.execute("CREATE TEMP TABLE utc_rewrite (old TEXT PRIMARY KEY, new TEXT NOT NULL)")
+        conn.executemany("INSERT INTO utc_rewrite (old, new) VALUES (?, ?)",
+                         [(ts, to_utc(datetime.fromisoformat(ts)).isoformat()) for ts in stale])
+        conn.execute(
+            f"""UPDATE OR IGNORE {table}
+                SET {column} = (SELECT new FROM utc_rewrite WHERE old = {column})
+                WHERE {column} IN (SELECT old FROM utc_rewrite)""")
+        conn.execute(f"DELETE FROM {table} WHERE {column} IN (SELECT old FROM utc_rewrite)")
+        conn.execute("DROP TABLE utc_rewrite")
+    return step
+
+
+# Ordered (version, name, steps). Every step must be safe to rerun, because
+# databases created before schema_version existed start from version 0.
+# Never edit a released migration; append a new one instead.
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (1, 'baseline', [
+        """CREATE TABLE IF NOT EXISTS tickers (
+            ticker TEXT PRIMARY KEY,
+            sector TEXT,
+            industry TEXT,
+            market_cap INTEGER,
+            avg_volume INTEGER,
+            last_updated TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_tickers_cap ON tickers(market_cap)",
+        "CREATE INDEX IF NOT EXISTS idx_tickers_sector ON tickers(sector)",
+        "CREATE INDEX IF NOT EXISTS idx_tickers_industry ON tickers(industry)",
+        """CREATE TABLE IF NOT EXISTS intraday_metrics (
+            ticker TEXT NOT NULL,
+            date TEXT NOT NULL,
+            max_drawdown_pct REAL,
+            drawdown_time TEXT,
+            recovery_pct REAL,
+            data_source TEXT,
+            computed_at TEXT,
+            PRIMARY KEY (ticker, date),
+            FOREIGN KEY (ticker) REFERENCES tickers(ticker) ON DELETE CASCADE
+        )""",
+        """CREATE TABLE IF NOT EXISTS intraday_bars (
+            ticker TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            PRIMARY KEY (ticker, timestamp),
+            FOREIGN KEY (ticker) REFERENCES tickers(ticker) ON DELETE CASCADE
+        )""",
+        # Bumped by triggers on every write so readers in any process
+        # can tell when cached responses are stale
+        """CREATE TABLE IF NOT EXISTS data_generation (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            generation INTEGER NOT NULL
+        )""",
+        "INSERT OR IGNORE INTO data_generation (id, generation) VALUES (1, 0)",
+        *_generation_triggers(),
+    ]),
+    (2, 'intraday_bars_volume', [
+        _add_column('intraday_bars', 'volume', 'INTEGER'),
+    ]),
+    (3, 'hot_query_indexes', [
+        # get_metrics: WHERE date = ? ORDER BY max_drawdown_pct, answered from the index alone
+        """CREATE INDEX IF NOT EXISTS idx_intraday_metrics_date_drawdown
+           ON intraday_metrics(date, max_drawdown_pct, ticker,
+                               drawdown_time, recovery_pct, data_source)""",
+        # get_metrics / get_filtered_tickers with sector and industry filters
+        """CREATE INDEX IF NOT EXISTS idx_tickers_sector_industry_cap
+           ON tickers(sector, industry, market_cap)""",
+        "CREATE INDEX IF NOT EXISTS idx_tickers_avg_volume ON tickers(avg_volume)",
+        "ANALYZE",
+    ]),
+    (4, 'leaderboard_sort_indexes', [
+        # Top-N / keyset pages sorted by market cap or volume walk these in
+        # order; ticker breaks ties so every page boundary is unique
+        "CREATE INDEX IF NOT EXISTS idx_tickers_cap_ticker ON tickers(market_cap, ticker)",
+        """CREATE INDEX IF NOT EXISTS idx_tickers_volume_ticker
+           ON tickers(COALESCE(avg_volume, 0), ticker)""",
+        # Superseded by the two above
+        "DROP INDEX IF EXISTS idx_tickers_cap",
+        "DROP INDEX IF EXISTS idx_tickers_avg_volume",
+        "ANALYZE",
+    ]),
+    (5, 'daily_snapshot', [
+        # One row per date, rebuilt by Database.refresh_daily_snapshot at the
+        # end of each ingestion run; sectors/industries hold JSON breakdowns
+        """CREATE TABLE IF NOT EXISTS daily_snapshot (
+            date TEXT PRIMARY KEY,
+            ticker_count INTEGER NOT NULL,
+            avg_return_pct REAL,
+            worst_ticker TEXT,
+            worst_return_pct REAL,
+            losers INTEGER NOT NULL,
+            sectors TEXT NOT NULL,
+            industries TEXT NOT NULL,
+            computed_at TEXT
+        )""",
+        *_generation_triggers(('daily_snapshot',)),
+    ]),
+    (6, 'tickers_refresh_trigger', [
+        # The incremental fundamentals refresh stamps last_updated on rows it
+        # checked but found unchanged; that alone must not invalidate caches
+        "DROP TRIGGER IF EXISTS trg_tickers_update_generation",
+        """CREATE TRIGGER IF NOT EXISTS trg_tickers_update_generation
+        AFTER UPDATE OF ticker, sector, industry, market_cap, avg_volume ON tickers
+        BEGIN
+            UPDATE data_generation SET generation = generation + 1 WHERE id = 1;
+        END""",
+    ]),
+    (7, 'ingest_jobs', [
+        # Durable work queue for compute_metrics --workers: one row per
+        # (ticker, date), leased to a worker process while it computes
+        """CREATE TABLE IF NOT EXISTS ingest_jobs (
+            ticker TEXT NOT NULL,
+            date TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending'
+                CHECK (state IN ('pending', 'leased', 'done', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            lease_expiry REAL,
+            last_error TEXT,
+            updated_at TEXT,
+            PRIMARY KEY (ticker, date)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_ingest_jobs_state ON ingest_jobs(state, lease_expiry)",
+    ]),
+    (8, 'live_state', [
+        # Running aggregates behind provisional metrics written by
+        # compute_metrics --live: the settled bars (open, high, low, time of
+        # the low) plus the latest bar, which may still be revised. A row
+        # exists only until a final (EOD) write supersedes the metrics.
+        """CREATE TABLE IF NOT EXISTS live_state (
+            ticker TEXT NOT NULL,
+            date TEXT NOT NULL,
+            settled INTEGER NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            low_time TEXT,
+            last_time TEXT NOT NULL,
+            last_open REAL NOT NULL,
+            last_high REAL NOT NULL,
+            last_low REAL NOT NULL,
+            last_close REAL NOT NULL,
+            updated_at TEXT,
+            PRIMARY KEY (ticker, date)
+        )""",
+    ]),
+    (9, 'rolling_metrics', [
+        # Multi-day statistics over each ticker's final day returns, written
+        # by the rolling stage (rolling.py). return_window holds the trailing
+        # returns, oldest first, as float64 bytes: the state the next date
+        # advances from.
+        """CREATE TABLE IF NOT EXISTS rolling_metrics (
+            ticker TEXT NOT NULL,
+            date TEXT NOT NULL,
+            cum_return_pct REAL NOT NULL,
+            down_streak INTEGER NOT NULL,
+            return_zscore REAL,
+            return_window BLOB NOT NULL,
+            computed_at TEXT,
+            PRIMARY KEY (ticker, date),
+            FOREIGN KEY (ticker) REFERENCES tickers(ticker) ON DELETE CASCADE
+        )""",
+        # Leaderboard sorts on the rolling columns walk these in order
+        """CREATE INDEX IF NOT EXISTS idx_rolling_metrics_date_cum_return
+           ON rolling_metrics(date, cum_return_pct, ticker)""",
+        """CREATE INDEX IF NOT EXISTS idx_rolling_metrics_date_down_streak
+           ON rolling_metrics(date, down_streak, ticker)""",
+        """CREATE INDEX IF NOT EXISTS idx_rolling_metrics_date_zscore
+           ON rolling_metrics(date, return_zscore, ticker)""",
+        *_generation_triggers(('rolling_metrics',)),
+    ]),
+    (10, 'metric_ranks', [
+        # Each date's day returns ranked worst-first across the universe and
+        # within the ticker's sector and industry, with percentile = 100 *
+        # rank / group size, written by ranks.refresh_ranks
+        *[_add_column('intraday_metrics', f"{scope}_{kind}", decl)
+          for scope in ('universe', 'sector', 'industry')
+          for kind, decl in (('rank', 'INTEGER'), ('pct', 'REAL'))],
+        # "Bottom decile of each sector" and friends are a range of one of these
+        """CREATE INDEX IF NOT EXISTS idx_intraday_metrics_date_universe_pct
+           ON intraday_metrics(date, universe_pct, ticker)""",
+        """CREATE INDEX IF NOT EXISTS idx_intraday_metrics_date_sector_pct
+           ON intraday_metrics(date, sector_pct, ticker)""",
+        """CREATE INDEX IF NOT EXISTS idx_intraday_metrics_date_industry_pct
+           ON intraday_metrics(date, industry_pct, ticker)""",
+    ]),
+    (11, 'daemon_jobs', [
+        # Runs requested from the ingestion daemon (ingest_daemon.py), by its
+        # scheduler or over its control endpoint, and their outcome. slot
+        # names a scheduled run (e.g. eod:2024-06-03) so it is queued once.
+        """CREATE TABLE IF NOT EXISTS daemon_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL CHECK (kind IN ('eod', 'live', 'backfill')),
+            slot TEXT UNIQUE,
+            args TEXT NOT NULL,
+            priority INTEGER NOT NULL,
+            state TEXT NOT NULL DEFAULT 'queued'
+                CHECK (state IN ('queued', 'running', 'done', 'failed')),
+            requested_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT,
+            duration_seconds REAL,
+            stats TEXT,
+            error TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_daemon_jobs_state ON daemon_jobs(state, priority, id)",
+    ]),
+    (12, 'daemon_job_retries', [
+        # Runs started so far, and for a failed scheduled run queued again
+        # with backoff, the UTC time ('YYYY-MM-DD HH:MM:SS') it may next start
+        _add_column('daemon_jobs', 'attempts', 'INTEGER NOT NULL DEFAULT 0'),
+        _add_column('daemon_jobs', 'retry_at', 'TEXT'),
+    ]),
+    (13, 'utc_bar_timestamps', [
+        # Bars used to be stored in whatever zone the provider gave (naive
+        # exchange time or '-05:00'), so the same instant could be keyed
+        # twice; everything bar-timed is now a UTC '+00:00' string
+        _utc_timestamps('intraday_bars', 'timestamp'),
+        _utc_timestamps('intraday_metrics', 'drawdown_time'),
+        _utc_timestamps('live_state', 'low_time'),
+        _utc_timestamps('live_state', 'last_time'),
+    ]),
+]
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """Highest applied migration, or 0 for a database that predates schema_version"""
+    conn.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )""")
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection, migrations: Iterable[Tuple[int, str, List[Step]]] = None) -> int:
+    """
+    Apply every pending migration in version order, each in its own
+    transaction, and return the resulting schema version.
+    """
+    migrations = sorted(migrations if migrations is not None else MIGRATIONS)
+    version = current_version(conn)
+    conn.commit()
+
+    for number, name, steps in migrations:
+        if number <= version:
+            continue
+        try:
+            conn.execute("BEGIN")
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, datetime('now'))",
+                (number, name)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"Migration {number} ({name}) failed")
+            raise
+        logger.info(f"Applied migration {number}: {name}")
+        version = number
+
+    return version
+
+
+def schema_sql(migrations: Iterable[Tuple[int, str, List[Step]]] = None) -> str:
+    """
+    The schema the migrations produce, as the SQL of every table, index
+    and trigger of a freshly migrated in-memory database in creation
+    order, followed by the schema_version and data_generation rows, so
+    running it on an empty file yields an up-to-date database.
+    """
+    conn = sqlite3.connect(':memory:')
+    try:
+        version = migrate(conn, migrations)
+        objects = conn.execute(
+            """SELECT sql FROM sqlite_master
+               WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+               ORDER BY rowid"""
+        ).fetchall()
+        applied = conn.execute("SELECT version, name FROM schema_version ORDER BY version").fetchall()
+    finally:
+        conn.close()
+    statements = [row[0] for row in objects]
+    statements += [
+        f"INSERT OR IGNORE INTO schema_version (version, name, applied_at) "
+        f"VALUES ({number}, '{name}', datetime('now'))"
+        for number, name in applied
+    ]
+    statements.append("INSERT OR IGNORE INTO data_generation (id, generation) VALUES (1, 0)")
+    return f"-- schema version {version}\n\n" + "".join(f"{sql};\n\n" for sql in statements)
+
+
+# EXPLAIN QUERY PLAN details for a full table scan, e.g. "SCAN m" or
+# "SCAN TABLE intraday_metrics AS m" (older SQLite). Index scans read
+# "SCAN t USING [COVERING] INDEX ..." and are fine.
+_FULL_SCAN = re.compile(r'^SCAN (TABLE )?\S+( AS \S+)?$')
+
+
+def full_table_scans(conn: sqlite3.Connection, sql: str) -> List[str]:
+    """EXPLAIN QUERY PLAN details of `sql` that scan a whole table"""
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    return [row[3] for row in plan if _FULL_SCAN.match(row[3])]
+
+
+def temp_sorts(conn: sqlite3.Connection, sql: str) -> List[str]:
+    """EXPLAIN QUERY PLAN details of `sql` that sort rows in a temporary b-tree"""
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    return [row[3] for row in plan if row[3].startswith('USE TEMP B-TREE')]
@@ -1,9 +1,10 @@
 """Script to populate ticker fundamentals table"""
+import argparse
 import logging
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import yfinance as yf
-import time
 import requests
 import pandas as pd
 from io import StringIO
@@ -12,6 +13,8 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from config_loader import load_config
 from database import Database
+from ranks import refresh_ranks
+from rate_limiter import TokenBucket
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,7 +27,7 @@ def get_sp500_tickers():
         headers = {
             "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
         }
-        response = requests.get(url, headers=headers)
+        response = requests.get(url, headers=headers, timeout=30)
         response.raise_for_status() # Check if the request actually worked
         
         # Wrap in StringIO to fix the FutureWarning
@@ -53,55 +56,123 @@ def fetch_ticker_fundamentals(ticker: str) -> dict:
     except Exception as e:
         return None
 
-def populate_fundamentals(db: Database, tickers: list = None):
+def _changed(fetched: dict, stored: dict) -> bool:
+    """True if fetched fundamentals differ from the stored row (or there is none)"""
+    if stored is None:
+        return True
+    return any(fetched[k] != stored[k] for k in ('sector', 'industry', 'market_cap'))
+
+def _regrouped(fetched: dict, stored: dict) -> bool:
+    """True if the ticker moves into a different sector or industry group"""
+    return stored is None or any(fetched[k] != stored[k] for k in ('sector', 'industry'))
+
+def refresh_groupings(db: Database, tickers: list) -> list:
+    """
+    Rebuild the daily snapshot and ranks of every date on which one of
+    tickers has metrics, after their sector or industry changed: both are
+    grouped by the tickers table. Returns the dates refreshed.
+    """
+    days = db.get_metric_dates(tickers=tickers) if tickers else []
+    for day in days:
+        db.refresh_daily_snapshot(day)
+        refresh_ranks(db, day)
+    if days:
+        logger.info(f"Refreshed snapshots and ranks of {len(days)} dates for "
+                    f"{len(tickers)} regrouped tickers")
+    return days
+
+def refresh_fundamentals(
+    db: Database,
+    tickers: list = None,
+    ttl_hours: float = 24,
+    max_workers: int = 8,
+    rate_limit: int = 300,
+    full: bool = False,
+    fetch=fetch_ticker_fundamentals
+) -> dict:
+    """
+    Refetch fundamentals for tickers that are new to the table or whose
+    last_updated is older than ttl_hours (every ticker if full), with up to
+    max_workers requests in flight. Rows whose values changed are upserted
+    and unchanged rows only get a fresh last_updated, all in one
+    transaction. Tickers whose sector or industry changed get the
+    snapshots and ranks of their dates rebuilt (see refresh_groupings).
+    Returns counts of tickers checked, changed, unchanged and failed, and
+    of dates refreshed.
+    """
     if tickers is None:
         logger.info("Fetching S&P 500 list...")
         tickers = get_sp500_tickers()
     
     if not tickers:
         logger.error("No tickers found. Aborting.")
-        return
+        return {}
 
-    logger.info(f"Processing {len(tickers)} tickers...")
-    
-    successful = 0
-    
-    for i, ticker in enumerate(tickers):
-        yf_ticker = ticker.replace('.', '-')
-        fundamentals = fetch_ticker_fundamentals(yf_ticker)
-        
-        if fundamentals:
-            fundamentals['ticker'] = ticker
-            try:
-                # SQLite syntax: INSERT OR REPLACE
-                cur = db.conn.cursor()
-                cur.execute(
-                    """INSERT OR REPLACE INTO tickers (ticker, sector, industry, market_cap, last_updated)
-                       VALUES (?, ?, ?, ?, datetime('now'))""",
-                    (
-                        fundamentals['ticker'],
-                        fundamentals['sector'],
-                        fundamentals['industry'],
-                        fundamentals['market_cap']
-                    )
-                )
-                db.conn.commit()
-                successful += 1
-            except Exception as e:
-                logger.error(f"DB Error saving {ticker}: {e}")
-        
-        if i % 10 == 0:
-            print(f"Progress: {i}/{len(tickers)}")
-        time.sleep(0.1) # Be nice to Yahoo
-    
-    logger.info(f"Completed: {successful} successful")
+    stored = db.get_fundamentals(ttl_hours)
+    todo = [t for t in tickers if full or t not in stored or stored[t]['stale']]
+    logger.info(f"{len(todo)} of {len(tickers)} tickers new or stale "
+                f"(ttl {ttl_hours}h{', full refresh' if full else ''})")
+
+    changed = []
+    unchanged = []
+    failed = 0
+    limiter = TokenBucket(rate_limit)
+
+    def fetch_one(ticker):
+        limiter.acquire()
+        return fetch(ticker.replace('.', '-'))
+
+    if todo:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(fetch_one, t): t for t in todo}
+            for i, future in enumerate(as_completed(futures), 1):
+                ticker = futures[future]
+                fundamentals = future.result()
+                if not fundamentals:
+                    failed += 1
+                elif _changed({**fundamentals, 'ticker': ticker}, stored.get(ticker)):
+                    changed.append({**fundamentals, 'ticker': ticker})
+                else:
+                    unchanged.append(ticker)
+                if i % 50 == 0:
+                    logger.info(f"Progress: {i}/{len(todo)}")
+
+    # Failed tickers keep their old last_updated so the next run retries them
+    with db.batch():
+        db.save_fundamentals_many(changed)
+        db.touch_fundamentals(unchanged)
+    days = refresh_groupings(db, [row['ticker'] for row in changed
+                                  if _regrouped(row, stored.get(row['ticker']))])
+
+    summary = {'checked': len(todo), 'changed': len(changed),
+               'unchanged': len(unchanged), 'failed': failed, 'dates_refreshed': len(days)}
+    logger.info(f"Completed: {summary}")
+    return summary
+
+def populate_fundamentals(db: Database, tickers: list = None, **options):
+    """Refetch and save fundamentals for every ticker, stale or not"""
+    return refresh_fundamentals(db, tickers, full=True, **options)
 
 def main():
+    parser = argparse.ArgumentParser(description="Refresh ticker fundamentals")
+    parser.add_argument('tickers', nargs='*', help="Tickers to refresh (default: S&P 500)")
+    parser.add_argument('--full', action='store_true',
+                        help="Refetch every ticker, ignoring the TTL")
+    args = parser.parse_args()
+
     config = load_config()
+    options = config.get('fundamentals', {})
     db = Database(config['database'])
     try:
         db.connect()
-        populate_fundamentals(db)
+        refresh_fundamentals(
+            db,
+            args.tickers or None,
+            ttl_hours=options.get('ttl_hours', 24),
+            max_workers=options.get('max_workers', 8),
+            rate_limit=options.get('rate_limit_per_minute', 300),
+            full=args.full
+        )
     finally:
         db.close()
 
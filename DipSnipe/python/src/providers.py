@@ -0,0 +1,329 @@
+"""Market data providers tried in order per ticker, each behind a circuit breaker"""
+import logging
+import threading
+import time
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from api_clients import ProviderError, YahooFinanceClient, _decode_frame
+from fetch_cache import NEGATIVE, FetchCache
+from market_simulator import MarketSimulator, SimulatedMarketClient
+from telemetry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_STATE = REGISTRY.gauge(
+    'dipsnipe_provider_circuit_state', 'Provider circuit breaker state: 0 closed, 1 half-open, 2 open',
+    ('provider',))
+CIRCUIT_TRIPS = REGISTRY.counter(
+    'dipsnipe_provider_circuit_trips_total', 'Times a provider circuit breaker opened', ('provider',))
+PROVIDER_TICKERS = REGISTRY.counter(
+    'dipsnipe_provider_tickers_total', 'Tickers served by each provider of the fallback chain',
+    ('provider',))
+PROVIDER_SKIPPED = REGISTRY.counter(
+    'dipsnipe_provider_skipped_tickers_total', 'Tickers not offered to a provider because its circuit was open',
+    ('provider',))
+
+DEFAULT_PROVIDERS = ('yahoo', 'fetch_cache', 'drop_dir', 'simulated')
+
+
+class CircuitBreaker:
+    """
+    Closed, calls go through. failure_threshold consecutive failures open
+    it and calls are refused for reset_seconds; it then half-opens and lets
+    a single trial call through, which closes it again on success and
+    reopens it on failure.
+    """
+
+    _STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 300.0,
+                 clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, provider=name)
+
+    def _set_state(self, state: str):
+        self.state = state
+        CIRCUIT_STATE.set(self._STATES[state], provider=self.name)
+
+    def allow(self) -> bool:
+        """Whether the caller may use the provider now"""
+        with self._lock:
+            if self.state == 'open' and self.clock() - self.opened_at >= self.reset_seconds:
+                self._set_state('half_open')
+                self._trial = False
+                logger.info(f"Circuit for {self.name} half-open, sending a trial request")
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info(f"Circuit for {self.name} closed")
+                self._set_state('closed')
+            self.failures = 0
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    CIRCUIT_TRIPS.inc(provider=self.name)
+                    logger.warning(f"Circuit for {self.name} open after {self.failures} "
+                                   f"consecutive failures, retrying in {self.reset_seconds:.0f}s")
+                self._set_state('open')
+                self.opened_at = self.clock()
+            self._trial = False
+
+
+class FetchCacheProvider:
+    """
+    Yahoo responses from the on-disk fetch cache, served even after their
+    TTL has expired: stale bars for the same window beat synthetic ones
+    while Yahoo is unavailable.
+    """
+
+    name = 'fetch_cache'
+
+    def __init__(self, cache: FetchCache):
+        self.cache = cache
+
+    def fetch_range(self, tickers: List[str], start_date: date,
+                    end_date: date) -> Dict[str, Dict[date, List[Dict]]]:
+        keys = {t: YahooFinanceClient._cache_key(t, start_date, end_date) for t in tickers}
+        found = self.cache.get_many(keys.values(), include_expired=True)
+        results = {}
+        for ticker, key in keys.items():
+            payload = found.get(key)
+            if payload is None or payload is NEGATIVE:
+                continue
+            days = YahooFinanceClient._frame_to_bars_by_day(_decode_frame(payload))
+            if days:
+                results[ticker] = days
+        return results
+
+
+class DropDirProvider:
+    """
+    Bars dropped into a directory by hand or by another feed, one file per
+    ticker: <TICKER>.parquet or <TICKER>.csv, with a timestamp (or datetime)
+    column and open/high/low/close[/volume] columns in any case, so a Yahoo
+    CSV export works as-is. Files are re-read only when they change.
+    """
+
+    name = 'drop_dir'
+
+    _READERS = (('.parquet', pd.read_parquet), ('.csv', pd.read_csv))
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+        df = df.rename(columns=lambda c: str(c).strip().title())
+        for column in ('Timestamp', 'Datetime', 'Date'):
+            if column in df.columns:
+                df = df.set_index(column)
+                break
+        df.index = pd.to_datetime(df.index)
+        missing = {'Open', 'High', 'Low', 'Close'} - set(df.columns)
+        if missing:
+            raise ValueError(f"missing columns {sorted(missing)}")
+        return df.dropna(subset=['Open', 'High', 'Low', 'Close']).sort_index()
+
+    def _load(self, ticker: str) -> Optional[pd.DataFrame]:
+        for suffix, reader in self._READERS:
+            path = self.path / f"{ticker}{suffix}"
+            if not path.exists():
+                continue
+            version = (path, path.stat().st_mtime)
+            with self._lock:
+                cached = self._frames.get(ticker)
+            if cached and cached[0] == version:
+                return cached[1]
+            try:
+                df = self._normalize(reader(path))
+            except Exception as e:
+                # Includes ImportError when no parquet engine is installed
+                logger.warning(f"Could not read dropped bars {path}: {e}")
+                continue
+            with self._lock:
+                self._frames[ticker] = (version, df)
+            return df
+        return None
+
+    def fetch_range(self, tickers: List[str], start_date: date,
+                    end_date: date) -> Dict[str, Dict[date, List[Dict]]]:
+        if not self.path.is_dir():
+            return {}
+        results = {}
+        for ticker in tickers:
+            df = self._load(ticker)
+            if df is None:
+                continue
+            days = np.array(df.index.date)
+            window = df[(days >= start_date) & (days <= end_date)]
+            by_day = YahooFinanceClient._frame_to_bars_by_day(window)
+            if by_day:
+                results[ticker] = by_day
+        return results
+
+
+class ProviderChain:
+    """
+    Market data client that asks each provider in turn for the tickers the
+    earlier ones could not serve, e.g. live Yahoo, then stale fetch cache
+    entries, then dropped files, then the simulator.
+
+    A provider that raises (for Yahoo: a failed request, or one that came
+    back with nothing at all) counts as a failure for its circuit breaker.
+    While a breaker is open its provider is skipped outright, so a blocked
+    run falls through to the next provider instead of paying for retries on
+    every chunk. Callers learn who served each ticker through `sources`.
+    """
+
+    def __init__(self, providers: Sequence, failure_threshold: int = 5,
+                 reset_seconds: float = 300.0, chunk_size: int = 100):
+        self.providers = list(providers)
+        self.breakers = {
+            p.name: CircuitBreaker(p.name, failure_threshold, reset_seconds) for p in self.providers
+        }
+        self.chunk_size = chunk_size
+
+    @property
+    def total_wait(self) -> float:
+        """Seconds spent waiting on every rate-limited provider's token bucket (0 if none is)"""
+        return sum(p.limiter.total_wait for p in self.providers if hasattr(p, 'limiter'))
+
+    def _fetch_chunk(self, tickers: List[str], start_date: date, end_date: date,
+                     sources: Dict[str, str]) -> Dict[str, Dict[date, List[Dict]]]:
+        results = {}
+        remaining = list(tickers)
+        for provider in self.providers:
+            if not remaining:
+                break
+            breaker = self.breakers[provider.name]
+            if not breaker.allow():
+                PROVIDER_SKIPPED.inc(len(remaining), provider=provider.name)
+                continue
+            try:
+                served = provider.fetch_range(remaining, start_date, end_date)
+                breaker.record_success()
+            except Exception as e:
+                served = e.served if isinstance(e, ProviderError) else {}
+                breaker.record_failure()
+                logger.warning(f"{provider.name} failed for {len(remaining)} tickers: {e}")
+
+            hits = [t for t in remaining if served.get(t)]
+            for ticker in hits:
+                results[ticker] = served[ticker]
+                sources[ticker] = provider.name
+            PROVIDER_TICKERS.inc(len(hits), provider=provider.name)
+            remaining = [t for t in remaining if t not in results]
+
+        if remaining:
+            logger.warning(f"No provider had bars for {len(remaining)} tickers")
+        return results
+
+    def get_intraday_bars_range(self, tickers: List[str], start_date: date, end_date: date,
+                                sources: Dict[str, str] = None) -> Dict[str, Dict[date, List[Dict]]]:
+        """
+        {ticker: {day: bars}} for [start_date, end_date], one pass down the
+        chain per chunk. If given, sources is filled with the name of the
+        provider that served each ticker.
+        """
+        sources = sources if sources is not None else {}
+        results = {}
+        for i in range(0, len(tickers), self.chunk_size):
+            results.update(self._fetch_chunk(tickers[i:i + self.chunk_size],
+                                             start_date, end_date, sources))
+        return results
+
+    def get_intraday_bars_bulk(self, tickers: List[str], target_date: date,
+                               sources: Dict[str, str] = None) -> Dict[str, List[Dict]]:
+        by_day = self.get_intraday_bars_range(tickers, target_date, target_date, sources)
+        return {t: days[target_date] for t, days in by_day.items() if days.get(target_date)}
+
+    def get_intraday_bars(self, ticker: str, target_date: date) -> List[Dict]:
+        return self.get_intraday_bars_bulk([ticker], target_date).get(ticker, [])
+
+
+def client_from_config(config: dict, simulate: bool = False, sectors: Dict[str, str] = None,
+                       rate_share: float = 1.0):
+    """
+    The market data client config describes: the provider chain listed in
+    apis.providers, or just the offline simulator when simulate is set.
+    rate_share scales the per-minute budget (the simulator's is unlimited
+    unless configured) for callers that split it across processes.
+    """
+    apis = config.get('apis', {})
+    yahoo_config = apis.get('yahoo', {})
+    sim_config = apis.get('simulated', {})
+    chunk_size = yahoo_config.get('chunk_size', 100)
+    simulator = MarketSimulator(seed=sim_config.get('seed', 0), sectors=sectors)
+
+    if simulate:
+        return SimulatedMarketClient(
+            simulator,
+            chunk_size=chunk_size,
+            rate_limit=(sim_config.get('rate_limit_per_minute') or 1e9) * rate_share,
+            latency=sim_config.get('latency_seconds', 0.0)
+        )
+
+    cache_config = yahoo_config.get('cache', {})
+    fetch_cache = None
+    if cache_config.get('path'):
+        fetch_cache = FetchCache(
+            cache_config['path'],
+            positive_ttl=cache_config.get('positive_ttl_hours', 168) * 3600,
+            negative_ttl=cache_config.get('negative_ttl_hours', 6) * 3600,
+            max_bytes=int(cache_config.get('max_mb', 512) * 1024 * 1024)
+        )
+
+    providers = []
+    for name in apis.get('providers', DEFAULT_PROVIDERS):
+        if name == 'yahoo':
+            providers.append(YahooFinanceClient(
+                rate_limit=yahoo_config.get('rate_limit_per_minute', 60) * rate_share,
+                chunk_size=chunk_size,
+                max_retries=yahoo_config.get('max_retries', 3),
+                cache=fetch_cache,
+                live_ttl=cache_config.get('live_ttl_minutes', 5) * 60
+            ))
+        elif name == 'fetch_cache':
+            if fetch_cache is not None:
+                providers.append(FetchCacheProvider(fetch_cache))
+        elif name == 'drop_dir':
+            if apis.get('drop_dir', {}).get('path'):
+                providers.append(DropDirProvider(apis['drop_dir']['path']))
+        elif name == 'simulated':
+            providers.append(SimulatedMarketClient(simulator, chunk_size=chunk_size))
+        else:
+            raise ValueError(f"Unknown market data provider: {name}")
+
+    breaker = apis.get('circuit_breaker', {})
+    return ProviderChain(
+        providers,
+        failure_threshold=breaker.get('failure_threshold', 5),
+        reset_seconds=breaker.get('reset_seconds', 300),
+        chunk_size=chunk_size
+    )
@@ -0,0 +1,101 @@
+"""
+Cross-sectional ranks of each date's day returns, worst first, across the
+universe and within each ticker's sector and industry. Ranks are 1-based
+with ties sharing the lowest rank; percentile is 100 * rank / group size,
+so the bottom decile of a group is percentile <= 10.
+"""
+import logging
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+RANK_SCOPES = ('universe', 'sector', 'industry')
+RANK_COLUMNS = tuple(f"{scope}_{kind}" for scope in RANK_SCOPES for kind in ('rank', 'pct'))
+
+
+def rank_within(codes: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (rank, group size) of every value within its group, lowest value first,
+    in one sort. codes are non-negative integer group labels.
+    """
+    n = len(values)
+    order = np.lexsort((values, codes))
+    sorted_codes = codes[order]
+    sorted_values = values[order]
+
+    new_group = np.ones(n, dtype=bool)
+    new_group[1:] = sorted_codes[1:] != sorted_codes[:-1]
+    new_value = new_group.copy()
+    new_value[1:] |= sorted_values[1:] != sorted_values[:-1]
+    # Where each row's group and run of tied values start in sorted order
+    position = np.arange(n)
+    group_start = np.maximum.accumulate(np.where(new_group, position, 0))
+    tie_start = np.maximum.accumulate(np.where(new_value, position, 0))
+
+    ranks = np.empty(n, dtype=np.int64)
+    ranks[order] = tie_start - group_start + 1
+    return ranks, np.bincount(codes)[codes]
+
+
+def compute_ranks(returns: np.ndarray, groups: Dict[str, List[Optional[str]]]) -> Dict[str, np.ndarray]:
+    """
+    {scope_rank, scope_pct: array} for the universe and every labelled
+    grouping in `groups` (e.g. sector, industry). Rows without a label get
+    NaN for that scope.
+    """
+    result = {}
+    labelled = {'universe': [0] * len(returns), **groups}
+    for scope, labels in labelled.items():
+        codes, _ = pd.factorize(pd.Series(labels, dtype=object))
+        ranks = np.full(len(returns), np.nan)
+        pct = np.full(len(returns), np.nan)
+        known = codes >= 0
+        if known.any():
+            rank, size = rank_within(codes[known], returns[known])
+            ranks[known] = rank
+            pct[known] = 100.0 * rank / size
+        result[f"{scope}_rank"] = ranks
+        result[f"{scope}_pct"] = pct
+    return result
+
+
+def _stored(column: str, values: np.ndarray) -> list:
+    """Array of one rank column -> what SQLite holds: None, integer ranks or float percentiles"""
+    missing = np.isnan(values)
+    if column.endswith('_rank'):
+        values = np.where(missing, 0, values).astype(np.int64)
+    stored = np.array(values.tolist(), dtype=object)
+    stored[missing] = None
+    return stored.tolist()
+
+
+def refresh_ranks(db, target_date: date) -> int:
+    """
+    Recompute every rank and percentile for target_date in one pass over
+    its metrics, e.g. again after late tickers arrive, and write back only
+    the rows whose values changed, so a rerun with nothing new writes
+    nothing. Returns the number of rows updated.
+    """
+    inputs = db.get_rank_inputs(target_date)
+    if not inputs:
+        return 0
+
+    returns = np.array([row['max_drawdown_pct'] for row in inputs], dtype=np.float64)
+    ranked = compute_ranks(returns, {
+        scope: [row[scope] or None for row in inputs] for scope in RANK_SCOPES[1:]
+    })
+
+    stored = {c: _stored(c, ranked[c]) for c in RANK_COLUMNS}
+    rows = []
+    for i, row in enumerate(inputs):
+        values = {c: stored[c][i] for c in RANK_COLUMNS}
+        if any(values[c] != row[c] for c in RANK_COLUMNS):
+            rows.append({'ticker': row['ticker'], **values})
+
+    db.save_ranks(target_date, rows)
+    logger.info(f"Ranks for {target_date}: {len(rows)} of {len(inputs)} rows changed")
+    return len(rows)
@@ -0,0 +1,50 @@
+"""Thread-safe token bucket shared by all market data fetch workers"""
+import random
+import threading
+import time
+
+# Private RNG so jitter never disturbs (or depends on) global random state
+_jitter = random.Random()
+
+
+class TokenBucket:
+    """
+    Token bucket enforcing a per-minute request budget.
+
+    The bucket starts full so a run can burst up to `capacity` requests,
+    then refills continuously at rate_per_minute / 60 tokens per second.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive")
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, min(rate_per_minute, 10.0))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.total_wait = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Block until `tokens` are available. Returns seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    self.total_wait += waited
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """Exponential backoff with full jitter for retry number `attempt` (0-based)"""
+    return _jitter.uniform(0, min(cap, base * (2 ** attempt)))
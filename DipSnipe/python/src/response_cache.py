@@ -0,0 +1,72 @@
+"""In-process LRU cache of serialized API responses"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+
+class ResponseCache:
+    """
+    LRU cache of response bodies bounded by total size in bytes.
+
+    Every lookup passes the current data generation: the counter in the
+    data_generation table, which triggers bump on every write to the
+    served tables from any process. When it differs from the generation
+    the cached entries were built under, the whole cache is dropped, so
+    responses never outlive the data they were rendered from.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._generation = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _check_generation(self, generation: Hashable):
+        if generation != self._generation:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._size = 0
+            self._generation = generation
+
+    def get(self, key: Hashable, generation: Hashable) -> Optional[bytes]:
+        """Cached body for key, or None on a miss"""
+        with self._lock:
+            self._check_generation(generation)
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: Hashable, generation: Hashable, body: bytes):
+        """Store body for key, evicting least recently used entries to stay under max_bytes"""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._check_generation(generation)
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes
+            }
@@ -0,0 +1,140 @@
+"""
+Rolling multi-day dip statistics over each ticker's final day returns:
+- cum_return_pct: compounded return over the last cum_days dates with data
+  (negative = the N-day cumulative drawdown)
+- down_streak: consecutive dates closing below the open, ending today
+- return_zscore: today's return against the mean and volatility of the
+  vol_days returns before it
+
+Each date advances from the state stored with the ticker's previous date
+(its trailing returns and streak) in one vectorized pass over the universe,
+so a daily run never rescans history.
+"""
+import logging
+from datetime import date
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Stored windows are little-endian float64 whatever the host
+_WINDOW_DTYPE = np.dtype('<f8')
+
+
+def rolling_options(config: dict) -> Dict[str, int]:
+    rolling = config.get('rolling', {})
+    cum_days = rolling.get('cum_days', 5)
+    vol_days = rolling.get('vol_days', 20)
+    return {
+        'cum_days': cum_days,
+        # The window carries enough returns for both statistics
+        'window': max(cum_days, vol_days),
+        'vol_days': vol_days,
+        'min_vol_days': max(rolling.get('min_vol_days', 5), 2),
+    }
+
+
+def unpack_windows(blobs: List[Optional[bytes]], length: int) -> np.ndarray:
+    """
+    Stored return windows -> (n, length) array, right-aligned (latest return
+    in the last column) and NaN-padded on the left. Windows longer than
+    `length` keep their latest returns.
+    """
+    windows = np.full((len(blobs), length), np.nan)
+    sizes = np.array([len(b) // _WINDOW_DTYPE.itemsize if b else 0 for b in blobs], dtype=np.intp)
+    if not sizes.sum():
+        return windows
+    flat = np.frombuffer(b''.join(b for b in blobs if b), dtype=_WINDOW_DTYPE)
+    rows = np.repeat(np.arange(len(blobs)), sizes)
+    # Position within its own window, then shifted so the window ends at `length`
+    position = np.arange(len(flat)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    cols = position + np.repeat(length - sizes, sizes)
+    keep = cols >= 0
+    windows[rows[keep], cols[keep]] = flat[keep]
+    return windows
+
+
+def pack_window(window: np.ndarray) -> bytes:
+    """One right-aligned window row -> stored bytes, without the NaN padding"""
+    return window[~np.isnan(window)].astype(_WINDOW_DTYPE).tobytes()
+
+
+def advance(windows: np.ndarray, streaks: np.ndarray, returns: np.ndarray,
+            cum_days: int, vol_days: int, min_vol_days: int) -> Dict[str, np.ndarray]:
+    """
+    One date's step for the whole universe.
+
+    windows holds each ticker's trailing returns before today (see
+    unpack_windows), streaks its down streak as of its previous date and
+    returns today's day return in percent. Returns the statistics for
+    today and the windows with today's return appended, as 'windows'.
+    """
+    trailing = windows[:, -vol_days:]
+    valid = ~np.isnan(trailing)
+    count = valid.sum(axis=1)
+    mean = np.where(valid, trailing, 0.0).sum(axis=1) / np.maximum(count, 1)
+    squares = np.where(valid, (trailing - mean[:, None]) ** 2, 0.0).sum(axis=1)
+    std = np.sqrt(squares / np.maximum(count - 1, 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        zscore = (returns - mean) / std
+    # Too little history, or none of it moved: no meaningful volatility
+    zscore[(count < min_vol_days) | (std == 0)] = np.nan
+
+    windows = np.concatenate([windows[:, 1:], returns[:, None]], axis=1)
+    growth = np.nanprod(1 + windows[:, -cum_days:] / 100, axis=1)
+    return {
+        'cum_return_pct': (growth - 1) * 100,
+        'down_streak': np.where(returns < 0, streaks + 1, 0),
+        'return_zscore': zscore,
+        'windows': windows,
+    }
+
+
+def _update_day(db, day: date, options: Dict[str, int]) -> int:
+    inputs = db.get_rolling_inputs(day)
+    if not inputs:
+        db.save_rolling_day(day, [])
+        return 0
+
+    windows = unpack_windows([row['return_window'] for row in inputs], options['window'])
+    streaks = np.array([row['down_streak'] or 0 for row in inputs], dtype=np.int64)
+    returns = np.array([row['day_return'] for row in inputs], dtype=np.float64)
+    stats = advance(windows, streaks, returns, options['cum_days'],
+                    options['vol_days'], options['min_vol_days'])
+
+    zscores = stats['return_zscore']
+    rows = [
+        (row['ticker'], float(stats['cum_return_pct'][i]), int(stats['down_streak'][i]),
+         None if np.isnan(zscores[i]) else float(zscores[i]), pack_window(stats['windows'][i]))
+        for i, row in enumerate(inputs)
+    ]
+    db.save_rolling_day(day, rows)
+    return len(rows)
+
+
+def update_rolling(db, start_date: date, config: dict) -> int:
+    """
+    Advance rolling_metrics through every date with metrics from start_date
+    on, oldest first, each from the state stored before it. For a daily run
+    that is just start_date; a backfill or late tickers for an older date
+    also re-chain every later date, since their state depended on it.
+    Returns the number of rows written.
+    """
+    options = rolling_options(config)
+    days = db.get_metric_dates(start_date)
+    written = sum(_update_day(db, day, options) for day in days)
+    logger.info(f"Rolling metrics: {written} rows over {len(days)} dates from {start_date}")
+    return written
+
+
+def rebuild_rolling(db, config: dict, start_date: date = None) -> int:
+    """
+    Full rebuild: drop rolling_metrics from start_date on (all of it if
+    None) and recompute it date by date, e.g. after changing the windows.
+    """
+    cleared = db.clear_rolling(start_date)
+    logger.info(f"Rebuilding rolling metrics from {start_date or 'the first date'} "
+                f"({cleared} rows cleared)")
+    days = db.get_metric_dates(start_date)
+    return update_rolling(db, days[0], config) if days else 0
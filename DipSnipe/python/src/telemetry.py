@@ -0,0 +1,217 @@
+"""Prometheus-style counters, gauges and histograms with text exposition"""
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [
+                f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())
+            ]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set"""
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels):
+        if amount < 0:
+            raise ValueError("counters only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    @contextmanager
+    def time(self, **labels):
+        """Add the seconds spent inside the block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.inc(time.perf_counter() - start, **labels)
+
+
+class Gauge(_Metric):
+    """Value per label set that can go up and down"""
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count of observations per label set"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent inside the block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Callback(_Metric):
+    """Unlabelled value read from a function at render time"""
+
+    def __init__(self, name: str, help: str, kind: str, fn: Callable[[], float]):
+        super().__init__(name, help)
+        self.kind = kind
+        self.fn = fn
+
+    def _samples(self) -> List[str]:
+        try:
+            value = float(self.fn())
+        except Exception:
+            return []
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class Registry:
+    """
+    Named metrics for one process. Asking for a name that already exists
+    returns the existing metric, so modules can declare what they record at
+    import time without coordinating.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labelnames, buckets)
+
+    def callback(self, name: str, help: str, fn: Callable[[], float], kind: str = 'gauge'):
+        """Export fn()'s value under name; replaces an earlier callback of that name"""
+        with self._lock:
+            self._metrics[name] = _Callback(name, help, kind, fn)
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        return ''.join(line + '\n' for metric in metrics for line in metric.render())
+
+    def write_textfile(self, path: str):
+        """
+        Write render() to path for node_exporter's textfile collector. The
+        file is written next to its destination and renamed into place, so
+        the collector never reads a partial scrape.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        scratch = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        scratch.write_text(self.render())
+        os.replace(scratch, path)
+
+
+REGISTRY = Registry()
@@ -0,0 +1,87 @@
+"""NYSE trading calendar (regular full-day holidays only)"""
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import List, Set
+from zoneinfo import ZoneInfo
+
+# The exchange's wall clock: session hours, and the timezone assumed for
+# bar timestamps that arrive without one
+EXCHANGE_TZ = ZoneInfo("America/New_York")
+
+
+def _easter(year: int) -> date:
+    """Gregorian Easter Sunday (Anonymous Gregorian algorithm)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """n-th (1-based) given weekday of a month; n=-1 for the last one"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _observed(d: date) -> date:
+    """Saturday holidays are observed Friday, Sunday holidays Monday"""
+    if d.weekday() == 5:
+        return d - timedelta(days=1)
+    if d.weekday() == 6:
+        return d + timedelta(days=1)
+    return d
+
+
+@lru_cache(maxsize=None)
+def market_holidays(year: int) -> Set[date]:
+    """NYSE full-day holidays for a year"""
+    holidays = {
+        _nth_weekday(year, 1, 0, 3),            # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),            # Washington's Birthday
+        _easter(year) - timedelta(days=2),      # Good Friday
+        _nth_weekday(year, 5, 0, -1),           # Memorial Day
+        _observed(date(year, 7, 4)),            # Independence Day
+        _nth_weekday(year, 9, 0, 1),            # Labor Day
+        _nth_weekday(year, 11, 3, 4),           # Thanksgiving
+        _observed(date(year, 12, 25)),          # Christmas
+    }
+    # New Year's Day falling on a Saturday is not observed on the prior Friday
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        holidays.add(_observed(new_year))
+    if year >= 2022:
+        holidays.add(_observed(date(year, 6, 19)))  # Juneteenth
+    return holidays
+
+
+def is_trading_day(d: date) -> bool:
+    """True if the NYSE has a regular session on d"""
+    return d.weekday() < 5 and d not in market_holidays(d.year)
+
+
+def to_utc(ts: datetime) -> datetime:
+    """A bar timestamp as UTC-aware; naive ones are exchange wall time"""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=EXCHANGE_TZ)
+    return ts.astimezone(timezone.utc)
+
+
+def trading_days(start: date, end: date) -> List[date]:
+    """All trading days in [start, end], in order"""
+    days = []
+    d = start
+    while d <= end:
+        if is_trading_day(d):
+            days.append(d)
+        d += timedelta(days=1)
+    return days
@@ -6,12 +6,6 @@ set -e
 echo "DipHunter Setup"
 echo "==============="
 
-# Check PostgreSQL
-if ! command -v psql &> /dev/null; then
-    echo "Error: PostgreSQL not found. Please install PostgreSQL first."
-    exit 1
-fi
-
 # Check Python
 if ! command -v python3 &> /dev/null; then
     echo "Error: Python 3 not found. Please install Python 3.8+ first."
@@ -37,16 +31,8 @@ mkdir -p logs
 
 echo ""
 echo "3. Database setup..."
-echo "Please ensure PostgreSQL is running and create a database:"
-echo "  createdb diphunter"
-echo "  psql diphunter < database/schema.sql"
-echo ""
-read -p "Have you created the database? (y/n) " -n 1 -r
-echo
-if [[ ! $REPLY =~ ^[Yy]$ ]]; then
-    echo "Please create the database and run this script again."
-    exit 1
-fi
+echo "The SQLite database (database.file in config/config.yaml) is created and"
+echo "migrated on first use; database/schema.sql documents the resulting schema."
 
 echo ""
 echo "4. Configuration..."
@@ -76,4 +62,5 @@ echo "1. Edit config/config.yaml with your database credentials and API keys"
 echo "2. Run: python python/src/populate_fundamentals.py"
 echo "3. Run: python python/src/compute_metrics.py YYYY-MM-DD"
 echo "4. Start API server: python python/src/api_server.py"
+echo "   Keep data current: python python/src/ingest_daemon.py serve (EOD runs after each close)"
 echo "5. Start Shiny app: cd R && Rscript -e \"shiny::runApp('app.R', port=3838)\""
@@ -154,3 +154,8 @@ def main():
     print()
     print("Quick test with 10 tickers:")
     print(f"   python3 {compute_script} {yesterday} AAPL MSFT GOOGL TSLA NVDA META AMZN")
+    print()
+    print("Keep it current (EOD run after every close, backfills on request):")
+    daemon_script = os.path.join(os.path.dirname(compute_script), "ingest_daemon.py")
+    print(f"   python3 {daemon_script} serve")
+    print(f"   python3 {daemon_script} backfill --from YYYY-MM-DD --to YYYY-MM-DD")
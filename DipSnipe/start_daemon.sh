@@ -0,0 +1,6 @@
+#!/bin/bash
+# Start the DipHunter ingestion daemon
+
+cd "$(dirname "$0")"
+source venv/bin/activate
+python python/src/ingest_daemon.py serve "$@"